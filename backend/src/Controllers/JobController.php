@@ -47,6 +47,11 @@ class JobController
             return $response->withStatus(404)->withHeader('Content-Type', 'application/json');
         }
         
+        if (($job['status'] ?? null) === 'processing') {
+            $queueService = new QueueService();
+            $job['live_progress'] = $queueService->getJobStatus($jobId);
+        }
+        
         $response->getBody()->write(json_encode(['job' => $job]));
         return $response->withHeader('Content-Type', 'application/json');
     }
@@ -5,11 +5,19 @@ namespace App\Controllers;
 use Psr\Http\Message\ResponseInterface as Response;
 use Psr\Http\Message\ServerRequestInterface as Request;
 use App\Models\Store;
+use App\Services\QueueService;
 use Monolog\Logger;
 use Monolog\Handler\StreamHandler;
 
 class WebhookController
 {
+    private const MIRROR_TOPICS = [
+        'products-create', 'products-update', 'products-delete',
+        'customers-create', 'customers-update', 'customers-delete',
+        'orders-create', 'orders-updated', 'orders-delete',
+        'collections-create', 'collections-update', 'collections-delete'
+    ];
+    
     private Logger $logger;
     
     public function __construct()
@@ -37,7 +45,7 @@ class WebhookController
         $this->logger->info('Webhook received', [
             'shop' => $shop,
             'topic' => $topic,
-            'data' => $data
+            'data' => in_array($topic, self::MIRROR_TOPICS) ? ['id' => $data['id'] ?? null] : $data
         ]);
         
         switch ($topic) {
@@ -50,6 +58,11 @@ class WebhookController
                 break;
                 
             default:
+                if (in_array($topic, self::MIRROR_TOPICS)) {
+                    $this->handleMirrorUpdate($shop, $topic, $data, $request->getHeaderLine('X-Shopify-Webhook-Id'));
+                    break;
+                }
+                
                 $this->logger->warning('Unknown webhook topic', ['topic' => $topic]);
         }
         
@@ -78,4 +91,15 @@ class WebhookController
         $storeModel = new Store();
         $storeModel->updateShopInfo($shop, $data);
     }
+    
+    private function handleMirrorUpdate(string $shop, string $topic, array $data, string $webhookId): void
+    {
+        $queueService = new QueueService();
+        $queueService->enqueue($webhookId ?: uniqid('webhook_'), [
+            'shop' => $shop,
+            'type' => 'mirror_webhook',
+            'topic' => str_replace('-', '/', $topic),
+            'payload' => $data
+        ]);
+    }
 }
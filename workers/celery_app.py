@@ -8,7 +8,7 @@ app = Celery(
     'shopify_workers',
     broker=os.getenv('CELERY_BROKER', 'redis://localhost:6379/1'),
     backend=os.getenv('CELERY_BACKEND', 'redis://localhost:6379/2'),
-    include=['tasks.export_tasks', 'tasks.import_tasks']
+    include=['tasks.export_tasks', 'tasks.import_tasks', 'tasks.entity_tasks', 'tasks.mirror_tasks']
 )
 
 app.conf.update(
@@ -23,3 +23,43 @@ redis_client = redis.Redis(
 
 S3_BUCKET = os.getenv('AWS_S3_BUCKET', 'shopify-bulk-manager')
 SHOPIFY_API_VERSION = os.getenv('SHOPIFY_API_VERSION', '2025-10')
+
+BULK_EXPORT_THRESHOLD = int(os.getenv('BULK_EXPORT_THRESHOLD', 10000))
+BULK_POLL_INTERVAL = float(os.getenv('BULK_POLL_INTERVAL', 5))
+BULK_OPERATION_TIMEOUT = int(os.getenv('BULK_OPERATION_TIMEOUT', 3000))
+BULK_IMPORT_THRESHOLD = int(os.getenv('BULK_IMPORT_THRESHOLD', 5000))
+BULK_MUTATION_MAX_BYTES = int(os.getenv('BULK_MUTATION_MAX_BYTES', 20 * 1024 * 1024))
+S3_MULTIPART_PART_SIZE = int(os.getenv('S3_MULTIPART_PART_SIZE', 8 * 1024 * 1024))
+EXPORT_GZIP_LEVEL = int(os.getenv('EXPORT_GZIP_LEVEL', 6))
+EXPORT_ZSTD_LEVEL = int(os.getenv('EXPORT_ZSTD_LEVEL', 3))
+COLUMNAR_ROW_GROUP_SIZE = int(os.getenv('COLUMNAR_ROW_GROUP_SIZE', 50000))
+COLUMNAR_COMPRESSION = os.getenv('COLUMNAR_COMPRESSION', 'zstd')
+S3_DOWNLOAD_CHUNK_SIZE = int(os.getenv('S3_DOWNLOAD_CHUNK_SIZE', 1024 * 1024))
+
+IMPORT_CONCURRENCY = int(os.getenv('IMPORT_CONCURRENCY', 4))
+SHOPIFY_REST_RATE = float(os.getenv('SHOPIFY_REST_RATE', 2))
+SHOPIFY_REST_BURST = int(os.getenv('SHOPIFY_REST_BURST', 40))
+SHOPIFY_MAX_RETRIES = int(os.getenv('SHOPIFY_MAX_RETRIES', 5))
+SHOPIFY_GRAPHQL_RATE = float(os.getenv('SHOPIFY_GRAPHQL_RATE', 50))
+SHOPIFY_GRAPHQL_BURST = int(os.getenv('SHOPIFY_GRAPHQL_BURST', 1000))
+SHOPIFY_GRAPHQL_QUERY_COST = int(os.getenv('SHOPIFY_GRAPHQL_QUERY_COST', 50))
+METAFIELDS_SET_BATCH_SIZE = int(os.getenv('METAFIELDS_SET_BATCH_SIZE', 25))
+FANOUT_CONCURRENCY = int(os.getenv('FANOUT_CONCURRENCY', 4))
+EXPORT_ENTITY_CONCURRENCY = int(os.getenv('EXPORT_ENTITY_CONCURRENCY', 4))
+PROGRESS_FLUSH_INTERVAL = float(os.getenv('PROGRESS_FLUSH_INTERVAL', 2))
+PROGRESS_FLUSH_ROWS = int(os.getenv('PROGRESS_FLUSH_ROWS', 1000))
+JOB_ERROR_LIMIT = int(os.getenv('JOB_ERROR_LIMIT', 100))
+PROGRESS_MILESTONE_PERCENT = int(os.getenv('PROGRESS_MILESTONE_PERCENT', 10))
+PROGRESS_MILESTONE_INTERVAL = float(os.getenv('PROGRESS_MILESTONE_INTERVAL', 30))
+PROGRESS_EVENT_TTL = int(os.getenv('PROGRESS_EVENT_TTL', 3600))
+IMPORT_READ_BATCH_ROWS = int(os.getenv('IMPORT_READ_BATCH_ROWS', 5000))
+IMPORT_CHUNK_ROWS = int(os.getenv('IMPORT_CHUNK_ROWS', 25000))
+IMPORT_CHUNK_THRESHOLD = int(os.getenv('IMPORT_CHUNK_THRESHOLD', 50000))
+WATERMARK_SKEW_SECONDS = int(os.getenv('WATERMARK_SKEW_SECONDS', 300))
+IMPORT_CHECKPOINT_ROWS = int(os.getenv('IMPORT_CHECKPOINT_ROWS', 500))
+IMPORT_ROWS_TTL = int(os.getenv('IMPORT_ROWS_TTL', 7 * 24 * 3600))
+EXPORT_TIME_BUDGET = int(os.getenv('EXPORT_TIME_BUDGET', 3000))
+EXPORT_CHECKPOINT_INTERVAL = int(os.getenv('EXPORT_CHECKPOINT_INTERVAL', 60))
+MIRROR_WRITE_BATCH_SIZE = int(os.getenv('MIRROR_WRITE_BATCH_SIZE', 500))
+METAFIELDS_PER_OWNER = int(os.getenv('METAFIELDS_PER_OWNER', 25))
+SHOPIFY_GRAPHQL_MAX_QUERY_COST = int(os.getenv('SHOPIFY_GRAPHQL_MAX_QUERY_COST', 1000))
@@ -0,0 +1,648 @@
+import json
+import os
+import re
+import tempfile
+import time
+import requests
+from typing import List, Dict, Any, Callable, Optional, Iterator, Iterable, Tuple
+from config import SHOPIFY_API_VERSION, BULK_POLL_INTERVAL, BULK_OPERATION_TIMEOUT, BULK_MUTATION_MAX_BYTES
+from services.rate_limiter import ShopRateLimiter
+import logging
+
+logger = logging.getLogger(__name__)
+
+BULK_QUERIES = {
+    'products': """
+        {
+            products%(query)s {
+                edges {
+                    node {
+                        id
+                        title
+                        handle
+                        descriptionHtml
+                        vendor
+                        productType
+                        tags
+                        status
+                        createdAt
+                        updatedAt
+                        publishedAt
+                        variants {
+                            edges {
+                                node {
+                                    id
+                                    title
+                                    sku
+                                    price
+                                    compareAtPrice
+                                    barcode
+                                    inventoryQuantity
+                                    position
+                                }
+                            }
+                        }
+                        metafields {
+                            edges {
+                                node {
+                                    id
+                                    namespace
+                                    key
+                                    value
+                                    type
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    """,
+    'customers': """
+        {
+            customers%(query)s {
+                edges {
+                    node {
+                        id
+                        email
+                        firstName
+                        lastName
+                        phone
+                        state
+                        tags
+                        note
+                        taxExempt
+                        numberOfOrders
+                        amountSpent {
+                            amount
+                        }
+                        createdAt
+                        updatedAt
+                        defaultAddress {
+                            address1
+                            address2
+                            city
+                            province
+                            provinceCode
+                            country
+                            countryCodeV2
+                            zip
+                            phone
+                        }
+                        metafields {
+                            edges {
+                                node {
+                                    id
+                                    namespace
+                                    key
+                                    value
+                                    type
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    """,
+    'orders': """
+        {
+            orders%(query)s {
+                edges {
+                    node {
+                        id
+                        name
+                        email
+                        createdAt
+                        updatedAt
+                        processedAt
+                        currencyCode
+                        displayFinancialStatus
+                        displayFulfillmentStatus
+                        tags
+                        note
+                        subtotalPriceSet {
+                            shopMoney {
+                                amount
+                            }
+                        }
+                        totalTaxSet {
+                            shopMoney {
+                                amount
+                            }
+                        }
+                        totalPriceSet {
+                            shopMoney {
+                                amount
+                            }
+                        }
+                        shippingAddress {
+                            name
+                            address1
+                            city
+                            province
+                            country
+                            zip
+                        }
+                        lineItems {
+                            edges {
+                                node {
+                                    id
+                                    title
+                                    sku
+                                    quantity
+                                    originalUnitPriceSet {
+                                        shopMoney {
+                                            amount
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    """,
+}
+
+BULK_MUTATIONS = {
+    'productSet': """
+        mutation call($input: ProductSetInput!) {
+            productSet(input: $input) {
+                product {
+                    id
+                }
+                userErrors {
+                    field
+                    message
+                }
+            }
+        }
+    """,
+}
+
+CHILD_COLLECTIONS = {
+    'ProductVariant': 'variants',
+    'LineItem': 'line_items',
+    'MailingAddress': 'addresses',
+    'Metafield': 'metafields',
+}
+
+FIELD_ALIASES = {
+    'description_html': 'body_html',
+    'number_of_orders': 'orders_count',
+    'amount_spent': 'total_spent',
+    'country_code_v2': 'country_code',
+    'currency_code': 'currency',
+    'display_financial_status': 'financial_status',
+    'display_fulfillment_status': 'fulfillment_status',
+    'subtotal_price_set': 'subtotal_price',
+    'total_tax_set': 'total_tax',
+    'total_price_set': 'total_price',
+    'original_unit_price_set': 'price',
+}
+
+GID_PATTERN = re.compile(r'^gid://shopify/(\w+)/(\d+)')
+SELECTION_PATTERN = re.compile(r'\s*(\w+)')
+BLOCK_START_PATTERN = re.compile(r'\s*\{')
+
+# userError Shopify returns while another bulk operation of the same kind runs for the shop
+BUSY_ERROR = 'already in progress'
+
+
+class BulkOperationError(Exception):
+    pass
+
+
+class BulkOperationService:
+    """Runs Shopify GraphQL bulk operations and reassembles their JSONL output"""
+
+    def __init__(self, shop: str, access_token: str, endpoint: str = None,
+                 poll_interval: float = BULK_POLL_INTERVAL, timeout: int = BULK_OPERATION_TIMEOUT,
+                 limiter: ShopRateLimiter = None):
+        self.shop = shop
+        self.access_token = access_token
+        self.endpoint = endpoint or f"https://{shop}/admin/api/{SHOPIFY_API_VERSION}/graphql.json"
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.limiter = limiter or ShopRateLimiter(shop, 'graphql')
+        self.http = requests.Session()
+        self.http.headers.update({
+            'X-Shopify-Access-Token': access_token,
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        })
+
+    @staticmethod
+    def supports(entity: str, filters: Dict = None) -> bool:
+        """Whether an entity/filter combination can be exported through a bulk query"""
+        if entity not in BULK_QUERIES:
+            return False
+        return not (filters or {}).get('collection_id')
+
+    @staticmethod
+    def build_search_query(entity: str, filters: Dict = None) -> str:
+        """Translate export filters into a GraphQL search string"""
+        filters = filters or {}
+        terms = []
+
+        if entity == 'products':
+            for key in ['status', 'product_type', 'vendor']:
+                if filters.get(key):
+                    terms.append(f"{key}:'{filters[key]}'")
+            if filters.get('updated_at_min'):
+                terms.append(f"updated_at:>='{filters['updated_at_min']}'")
+        elif entity == 'customers':
+            if filters.get('created_at_min'):
+                terms.append(f"created_at:>='{filters['created_at_min']}'")
+            if filters.get('updated_at_min'):
+                terms.append(f"updated_at:>='{filters['updated_at_min']}'")
+        elif entity == 'orders':
+            if filters.get('status') and filters['status'] != 'any':
+                terms.append(f"status:{filters['status']}")
+            if filters.get('financial_status'):
+                terms.append(f"financial_status:{filters['financial_status']}")
+            if filters.get('fulfillment_status'):
+                terms.append(f"fulfillment_status:{filters['fulfillment_status']}")
+            if filters.get('created_at_min'):
+                terms.append(f"created_at:>='{filters['created_at_min']}'")
+            if filters.get('updated_at_min'):
+                terms.append(f"updated_at:>='{filters['updated_at_min']}'")
+
+        return ' AND '.join(terms)
+
+    def build_query(self, entity: str, filters: Dict = None, fields: Iterable[str] = None,
+                    include_metafields: bool = True) -> str:
+        search = self.build_search_query(entity, filters)
+        query_arg = f"(query: {json.dumps(search)})" if search else ''
+        query = BULK_QUERIES[entity] % {'query': query_arg}
+        if fields is not None or not include_metafields:
+            query = self.project_query(query, fields, include_metafields)
+        return query
+
+    @staticmethod
+    def project_query(query: str, fields: Iterable[str] = None, include_metafields: bool = True) -> str:
+        """Keep only the top-level node fields whose REST name is in ``fields``
+
+        Field names are matched after the same snake_case/alias mapping that
+        ``normalize_record`` applies, so callers pass REST column names.
+        ``id`` is always kept (bulk output links children to it) and
+        ``metafields`` only when requested.
+        """
+        start = query.index('node {') + len('node {')
+        end = BulkOperationService._block_end(query, start)
+        wanted = None if fields is None else set(fields) | {'id'}
+
+        selections = []
+        position = start
+        while True:
+            match = SELECTION_PATTERN.match(query, position, end)
+            if not match:
+                break
+            name = match.group(1)
+            position = match.end()
+            block = BLOCK_START_PATTERN.match(query, position, end)
+            if block:
+                position = BulkOperationService._block_end(query, block.end()) + 1
+
+            rest_name = re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+            rest_name = FIELD_ALIASES.get(rest_name, rest_name)
+            if name == 'metafields':
+                keep = include_metafields
+            else:
+                keep = wanted is None or rest_name in wanted
+            if keep:
+                selections.append(query[match.start(1):position].strip())
+
+        return query[:start] + ' ' + ' '.join(selections) + ' ' + query[end:]
+
+    @staticmethod
+    def _block_end(text: str, start: int) -> int:
+        """Index of the brace closing the block that opens just before ``start``"""
+        depth = 1
+        for position in range(start, len(text)):
+            if text[position] == '{':
+                depth += 1
+            elif text[position] == '}':
+                depth -= 1
+                if depth == 0:
+                    return position
+        raise ValueError("Unbalanced braces in GraphQL query")
+
+    def execute(self, query: str, variables: Dict = None) -> Dict[str, Any]:
+        """Execute a GraphQL request and return its data payload"""
+        result = self.limiter.graphql_call(self._post, query, variables)
+
+        if result.get('errors'):
+            raise BulkOperationError(f"GraphQL errors: {result['errors']}")
+
+        return result.get('data') or {}
+
+    def _post(self, query: str, variables: Dict) -> Dict[str, Any]:
+        response = self.http.post(self.endpoint, json={'query': query, 'variables': variables})
+        response.raise_for_status()
+        return response.json()
+
+    def run_query(self, query: str) -> str:
+        """Submit a bulkOperationRunQuery and return the operation ID"""
+        mutation = """
+            mutation ($query: String!) {
+                bulkOperationRunQuery(query: $query) {
+                    bulkOperation {
+                        id
+                        status
+                    }
+                    userErrors {
+                        field
+                        message
+                    }
+                }
+            }
+        """
+        return self.submit('bulkOperationRunQuery', mutation, {'query': query}, 'Bulk query')
+
+    def submit(self, field: str, mutation: str, variables: Dict, label: str) -> str:
+        """Run a bulkOperationRun* mutation and return the operation ID
+
+        Shopify runs one bulk query and one bulk mutation per shop at a time,
+        so while another one is in progress the submission is retried every
+        poll interval, for up to the operation timeout.
+        """
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            payload = self.execute(mutation, variables).get(field) or {}
+            user_errors = payload.get('userErrors') or []
+            if not user_errors:
+                return payload['bulkOperation']['id']
+
+            busy = any(BUSY_ERROR in (error.get('message') or '').lower() for error in user_errors)
+            if not busy or time.monotonic() >= deadline:
+                raise BulkOperationError(f"{label} rejected: {user_errors}")
+
+            logger.info(f"{label} waiting for another bulk operation on {self.shop} to finish")
+            time.sleep(self.poll_interval)
+
+    def wait_for_completion(self, operation_id: str) -> Dict[str, Any]:
+        """Poll a bulk operation until it reaches a terminal status"""
+        query = """
+            query ($id: ID!) {
+                node(id: $id) {
+                    ... on BulkOperation {
+                        id
+                        status
+                        errorCode
+                        objectCount
+                        url
+                        partialDataUrl
+                    }
+                }
+            }
+        """
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            operation = self.execute(query, {'id': operation_id}).get('node') or {}
+            status = operation.get('status')
+
+            if status == 'COMPLETED':
+                return operation
+            if status in ['FAILED', 'CANCELED', 'EXPIRED']:
+                raise BulkOperationError(
+                    f"Bulk operation {operation_id} {status.lower()}: {operation.get('errorCode')}"
+                )
+            if time.monotonic() >= deadline:
+                raise BulkOperationError(f"Bulk operation {operation_id} timed out after {self.timeout}s")
+
+            logger.info(f"Bulk operation {operation_id} {status}: {operation.get('objectCount', 0)} objects")
+            time.sleep(self.poll_interval)
+
+    def iter_jsonl(self, url: Optional[str]) -> Iterator[Dict[str, Any]]:
+        """Stream JSONL lines from a bulk operation result URL"""
+        if not url:
+            return
+
+        with requests.get(url, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def iter_records(self, entity: str, filters: Dict = None, include_metafields: bool = True,
+                     fields: Iterable[str] = None) -> Iterator[Dict[str, Any]]:
+        """Run a bulk export for an entity and yield reassembled, REST-shaped records
+
+        ``fields`` limits the query to those top-level REST fields.
+        """
+        operation_id = self.run_query(self.build_query(entity, filters, fields, include_metafields))
+        logger.info(f"Started bulk operation {operation_id} for {entity} on {self.shop}")
+
+        operation = self.wait_for_completion(operation_id)
+
+        for record in self.stitch(self.iter_jsonl(operation.get('url'))):
+            yield self.normalize_record(record, include_metafields)
+
+    def stage_upload(self, path: str) -> str:
+        """Upload a JSONL variables file to Shopify's staged storage and return its path"""
+        mutation = """
+            mutation ($input: [StagedUploadInput!]!) {
+                stagedUploadsCreate(input: $input) {
+                    stagedTargets {
+                        url
+                        resourceUrl
+                        parameters {
+                            name
+                            value
+                        }
+                    }
+                    userErrors {
+                        field
+                        message
+                    }
+                }
+            }
+        """
+        data = self.execute(mutation, {'input': [{
+            'resource': 'BULK_MUTATION_VARIABLES',
+            'filename': os.path.basename(path),
+            'mimeType': 'text/jsonl',
+            'httpMethod': 'POST'
+        }]})
+        payload = data.get('stagedUploadsCreate') or {}
+
+        if payload.get('userErrors'):
+            raise BulkOperationError(f"Staged upload rejected: {payload['userErrors']}")
+
+        target = payload['stagedTargets'][0]
+        fields = {param['name']: param['value'] for param in target['parameters']}
+
+        with open(path, 'rb') as variables_file:
+            response = requests.post(target['url'], data=fields, files={'file': (os.path.basename(path), variables_file, 'text/jsonl')})
+        response.raise_for_status()
+
+        return fields['key']
+
+    def run_mutation(self, mutation: str, staged_upload_path: str) -> str:
+        """Submit a bulkOperationRunMutation and return the operation ID"""
+        return self.submit('bulkOperationRunMutation', """
+            mutation ($mutation: String!, $stagedUploadPath: String!) {
+                bulkOperationRunMutation(mutation: $mutation, stagedUploadPath: $stagedUploadPath) {
+                    bulkOperation {
+                        id
+                        status
+                    }
+                    userErrors {
+                        field
+                        message
+                    }
+                }
+            }
+        """, {'mutation': mutation, 'stagedUploadPath': staged_upload_path}, 'Bulk mutation')
+
+    def run_bulk_mutation(self, mutation: str, variables: Iterable[Dict[str, Any]], submitted: Dict[int, str] = None,
+                          on_submit: Callable[[int, str], None] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Run a mutation once per variables dict and yield (input position, result line)
+
+        Inputs are split into JSONL files of at most BULK_MUTATION_MAX_BYTES,
+        each staged and run as its own bulk operation, one after another.
+        ``on_submit(file_number, operation_id)`` is called as soon as a file's
+        operation is accepted; passing those IDs back as ``submitted`` on a
+        later run (same inputs) polls the existing operations instead of
+        running their files a second time.
+        """
+        submitted = submitted or {}
+        offset = 0
+        for number, (path, count) in enumerate(self._write_variable_files(variables)):
+            try:
+                operation_id = submitted.get(number)
+                if operation_id:
+                    logger.info(f"Resuming bulk mutation {operation_id} for {count} inputs on {self.shop}")
+                else:
+                    operation_id = self.run_mutation(mutation, self.stage_upload(path))
+                    logger.info(f"Started bulk mutation {operation_id} for {count} inputs on {self.shop}")
+                    if on_submit is not None:
+                        on_submit(number, operation_id)
+                operation = self.wait_for_completion(operation_id)
+
+                for position, line in enumerate(self.iter_jsonl(operation.get('url'))):
+                    yield offset + line.pop('__lineNumber', position), line
+            finally:
+                os.remove(path)
+
+            offset += count
+
+    def _write_variable_files(self, variables: Iterable[Dict[str, Any]]) -> Iterator[Tuple[str, int]]:
+        handle = None
+        path = None
+        count = 0
+        size = 0
+
+        try:
+            for item in variables:
+                line = (json.dumps(item, default=str) + '\n').encode('utf-8')
+
+                if handle is not None and size + len(line) > BULK_MUTATION_MAX_BYTES:
+                    handle.close()
+                    handle = None
+                    yield path, count
+
+                if handle is None:
+                    fd, path = tempfile.mkstemp(prefix='bulk_op_vars_', suffix='.jsonl')
+                    handle = os.fdopen(fd, 'wb')
+                    count = 0
+                    size = 0
+
+                handle.write(line)
+                count += 1
+                size += len(line)
+
+            if handle is not None:
+                handle.close()
+                handle = None
+                yield path, count
+        finally:
+            if handle is not None:
+                handle.close()
+                os.remove(path)
+
+    @staticmethod
+    def parse_gid(gid: str) -> Optional[tuple]:
+        match = GID_PATTERN.match(gid or '')
+        if not match:
+            return None
+        return match.group(1), int(match.group(2))
+
+    @staticmethod
+    def stitch(lines: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Attach child lines to their parents via __parentId
+
+        Bulk output lists every child after its parent, so only the current
+        top-level record and its descendants are held in memory.
+        """
+        current = None
+        nodes = {}
+
+        for line in lines:
+            parent_id = line.pop('__parentId', None)
+
+            if parent_id is None:
+                if current is not None:
+                    yield current
+                current = line
+                nodes = {line.get('id'): line}
+                continue
+
+            parent = nodes.get(parent_id)
+            if parent is None:
+                logger.warning(f"Dropping bulk line with unknown parent {parent_id}")
+                continue
+
+            gid = BulkOperationService.parse_gid(line.get('id'))
+            collection = CHILD_COLLECTIONS.get(gid[0], 'children') if gid else 'children'
+            parent.setdefault(collection, []).append(line)
+
+            if line.get('id'):
+                nodes[line['id']] = line
+
+        if current is not None:
+            yield current
+
+    @staticmethod
+    def normalize_record(record: Dict[str, Any], include_metafields: bool = True) -> Dict[str, Any]:
+        """Convert a GraphQL node to the snake_case, numeric-ID shape of REST exports"""
+        metafields = record.pop('metafields', None) or []
+        normalized = BulkOperationService._normalize_value(record)
+
+        if not include_metafields:
+            return normalized
+
+        for mf in metafields:
+            normalized[f"Metafield:{mf['namespace']}[{mf['key']}]"] = mf.get('value')
+
+        return normalized
+
+    @staticmethod
+    def _normalize_value(value: Any) -> Any:
+        if isinstance(value, list):
+            return [BulkOperationService._normalize_value(v) for v in value]
+        if not isinstance(value, dict):
+            return value
+        if set(value.keys()) == {'shopMoney'}:
+            return (value['shopMoney'] or {}).get('amount')
+        if set(value.keys()) == {'amount'}:
+            return value['amount']
+
+        normalized = {}
+        for key, item in value.items():
+            snake_key = re.sub(r'(?<!^)(?=[A-Z])', '_', key).lower()
+            snake_key = FIELD_ALIASES.get(snake_key, snake_key)
+            if snake_key == 'id':
+                gid = BulkOperationService.parse_gid(item)
+                normalized['admin_graphql_api_id'] = item
+                item = gid[1] if gid else item
+            elif snake_key == 'tags' and isinstance(item, list):
+                item = ', '.join(item)
+            normalized[snake_key] = BulkOperationService._normalize_value(item)
+
+        return normalized
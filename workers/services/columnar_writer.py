@@ -0,0 +1,265 @@
+import json
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Tuple
+import pyarrow as pa
+import pyarrow.parquet as pq
+from config import COLUMNAR_COMPRESSION, COLUMNAR_ROW_GROUP_SIZE
+import logging
+
+logger = logging.getLogger(__name__)
+
+COLUMNAR_FORMATS = ['parquet', 'feather']
+
+MONEY_TYPE = pa.decimal128(18, 4)
+MONEY_QUANTUM = Decimal('0.0001')
+TIMESTAMP_TYPE = pa.timestamp('us', tz='UTC')
+
+# Numeric Shopify IDs; other ``*_id`` fields (e.g. ``admin_graphql_api_id``) are typed by their values
+ID_COLUMNS = {
+    'id', 'product_id', 'variant_id', 'customer_id', 'order_id', 'location_id', 'inventory_item_id',
+    'image_id', 'collection_id', 'owner_id', 'user_id', 'checkout_id', 'app_id', 'blog_id', 'article_id',
+    'page_id', 'fulfillment_id', 'line_item_id', 'refund_id', 'transaction_id', 'parent_id', 'theme_id'
+}
+
+MONEY_COLUMNS = {
+    'price', 'compare_at_price', 'total_price', 'subtotal_price', 'total_tax', 'total_discounts',
+    'total_line_items_price', 'current_total_price', 'current_subtotal_price', 'current_total_tax',
+    'current_total_discounts', 'total_outstanding', 'total_spent', 'amount'
+}
+
+
+# Converters map blanks to None and raise ValueError for anything they cannot store exactly
+
+def _to_int(value: Any):
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"{value!r} is not an integer")
+    try:
+        return int(value)
+    except TypeError:
+        raise ValueError(f"{value!r} is not an integer")
+
+
+def _to_float(value: Any):
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"{value!r} is not a number")
+    try:
+        return float(value)
+    except TypeError:
+        raise ValueError(f"{value!r} is not a number")
+
+
+BOOL_STRINGS = {'true': True, '1': True, 'yes': True, 'false': False, '0': False, 'no': False}
+
+
+def _to_bool(value: Any):
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        try:
+            return BOOL_STRINGS[value.strip().lower()]
+        except KeyError:
+            raise ValueError(f"{value!r} is not a boolean")
+    return bool(value)
+
+
+def _to_money(value: Any):
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"{value!r} is not an amount")
+    try:
+        amount = Decimal(str(value)).quantize(MONEY_QUANTUM)
+    except InvalidOperation:
+        raise ValueError(f"{value!r} is not an amount")
+    if not amount.is_finite() or amount.adjusted() >= 14:
+        raise ValueError(f"{value!r} is not an amount")
+    return amount
+
+
+def _to_timestamp(value: Any):
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _converts(converter: Callable, values: List[Any]) -> bool:
+    try:
+        for value in values:
+            converter(value)
+    except (ValueError, OverflowError):
+        return False
+    return True
+
+
+def _to_string(value: Any):
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+class ColumnarWriter:
+    """Writes pages of records to Parquet or Feather (Arrow IPC) files incrementally
+
+    The schema is compiled once from the first row group: numeric IDs
+    (``ID_COLUMNS``) become int64, money fields decimal, ``*_at`` fields UTC
+    timestamps and other scalars keep their JSON type, while nested lists and
+    objects are stored as JSON strings. A column whose sampled values do not
+    all fit its type is widened (int to float64, anything to string). A later
+    value that does not fit the compiled type raises ValueError; no value is
+    ever written as null in its place. Like ``FileProcessor.write_csv_stream``,
+    keys that first appear after the first row group are ignored. Pages are
+    buffered into row groups (record batches for Feather) of
+    COLUMNAR_ROW_GROUP_SIZE rows and compressed with COLUMNAR_COMPRESSION,
+    so memory stays at one row group.
+    """
+
+    @staticmethod
+    def compile_schema(sample: List[Dict[str, Any]], columns: List[str] = None) -> Tuple[pa.Schema, List[Tuple]]:
+        """Arrow schema plus one (source type, value converter) pair per column"""
+        if not columns:
+            columns = list(dict.fromkeys(key for row in sample for key in row))
+
+        fields = []
+        converters = []
+        for column in columns:
+            arrow_type, source_type, converter = ColumnarWriter._column_type(column, sample)
+            fields.append(pa.field(column, arrow_type))
+            converters.append((source_type, converter))
+
+        return pa.schema(fields), converters
+
+    @staticmethod
+    def _column_type(column: str, sample: List[Dict[str, Any]]) -> Tuple[pa.DataType, pa.DataType, Callable]:
+        # Flattened columns are paths such as ``variants.price``: type them by the leaf field
+        name = column if column.startswith('Metafield:') else column.rsplit('.', 1)[-1]
+        values = [row.get(column) for row in sample]
+        present = [value for value in values if value is not None and value != '']
+        
+        if name in ID_COLUMNS and _converts(_to_int, values):
+            return pa.int64(), pa.int64(), _to_int
+        if (name in MONEY_COLUMNS or name.endswith('_price')) and _converts(_to_money, values):
+            return MONEY_TYPE, pa.string(), _to_money
+        if name.endswith('_at') and _converts(_to_timestamp, values):
+            return TIMESTAMP_TYPE, pa.string(), _to_timestamp
+
+        types = set(type(value) for value in present)
+        if types == {bool}:
+            return pa.bool_(), pa.bool_(), _to_bool
+        if types == {int} and _converts(_to_int, values):
+            return pa.int64(), pa.int64(), _to_int
+        if types and types <= {int, float}:
+            return pa.float64(), pa.float64(), _to_float
+        return pa.string(), pa.string(), _to_string
+
+    @staticmethod
+    def to_batch(page: List[Dict[str, Any]], schema: pa.Schema, converters: List[Tuple]) -> pa.RecordBatch:
+        arrays = []
+        for field, (source_type, convert) in zip(schema, converters):
+            values = [row.get(field.name) for row in page]
+            try:
+                # Shopify JSON usually arrives in the right shape: let Arrow convert (and
+                # parse money and timestamp strings) in one vectorised pass. Numbers are
+                # inferred and then safely cast, since pa.array(type=int64) truncates floats
+                array = pa.array(values, type=source_type if source_type == pa.string() else None)
+                if array.type != field.type:
+                    array = array.cast(field.type)
+            except (pa.ArrowException, TypeError, ValueError, OverflowError):
+                array = pa.array(ColumnarWriter._convert(field, convert, values), type=field.type)
+            arrays.append(array)
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    @staticmethod
+    def _convert(field: pa.Field, convert: Callable, values: List[Any]) -> List[Any]:
+        converted = []
+        for value in values:
+            try:
+                converted.append(convert(value))
+            except (ValueError, OverflowError) as e:
+                raise ValueError(
+                    f"Column {field.name} was typed {field.type} from the first row group "
+                    f"but a later value does not fit: {str(e)}"
+                )
+        return converted
+
+    @staticmethod
+    def write_stream(pages: Iterable[List[Dict[str, Any]]], output: BinaryIO, format_type: str = 'parquet',
+                     columns: List[str] = None, row_group_size: int = COLUMNAR_ROW_GROUP_SIZE) -> int:
+        """Encode pages of records to ``format_type`` incrementally and return the row count"""
+        if format_type not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unsupported columnar format: {format_type}")
+
+        writer = None
+        schema = None
+        converters = None
+        sample: List[List[Dict[str, Any]]] = []
+        sample_rows = 0
+        pending: List[pa.RecordBatch] = []
+        pending_rows = 0
+        row_count = 0
+
+        def open_writer():
+            nonlocal writer, schema, converters
+            schema, converters = ColumnarWriter.compile_schema([row for page in sample for row in page], columns)
+            writer = ColumnarWriter._open(output, schema, format_type)
+
+        def flush():
+            table = pa.Table.from_batches(pending, schema=schema)
+            if format_type == 'parquet':
+                writer.write_table(table, row_group_size=row_group_size)
+            else:
+                writer.write_table(table, max_chunksize=row_group_size)
+
+        try:
+            for page in pages:
+                if not page:
+                    continue
+                row_count += len(page)
+
+                # The first row group is held as records so the schema is inferred from all of it
+                if writer is None:
+                    sample.append(page)
+                    sample_rows += len(page)
+                    if sample_rows < row_group_size:
+                        continue
+                    open_writer()
+                    ready, sample = sample, []
+                else:
+                    ready = [page]
+
+                for records in ready:
+                    pending.append(ColumnarWriter.to_batch(records, schema, converters))
+                    pending_rows += len(records)
+
+                if pending_rows >= row_group_size:
+                    flush()
+                    pending = []
+                    pending_rows = 0
+
+            if writer is None:
+                open_writer()
+                pending = [ColumnarWriter.to_batch(records, schema, converters) for records in sample]
+            if pending:
+                flush()
+
+            writer.close()
+            return row_count
+        except Exception as e:
+            logger.error(f"Error writing {format_type}: {str(e)}")
+            raise
+
+    @staticmethod
+    def _open(output: BinaryIO, schema: pa.Schema, format_type: str):
+        if format_type == 'parquet':
+            return pq.ParquetWriter(output, schema, compression=COLUMNAR_COMPRESSION)
+        options = pa.ipc.IpcWriteOptions(compression=COLUMNAR_COMPRESSION)
+        return pa.ipc.new_file(output, schema, options=options)
@@ -0,0 +1,75 @@
+import shopify
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Tuple, Optional
+from config import SHOPIFY_API_VERSION, IMPORT_CONCURRENCY
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrentExecutor:
+    """Runs Shopify API work on a bounded thread pool
+
+    Each worker thread activates its own Shopify session (the API client keeps
+    connections per thread). At most ``max_in_flight`` items run at once and
+    results are yielded in input order; a window of twice that many queued
+    items keeps the pool busy while the oldest item is still running. Rate
+    limiting and 429 retries happen per API call in the services themselves.
+    """
+
+    def __init__(self, shop: str, access_token: str, max_in_flight: int = IMPORT_CONCURRENCY):
+        self.shop = shop
+        self.access_token = access_token
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.completed = 0
+        self.started_at = None
+        self._pool = None
+
+    def __enter__(self):
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_in_flight,
+            thread_name_prefix=f"shopify-{self.shop}",
+            initializer=self._activate_session
+        )
+        self.started_at = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._pool.shutdown(wait=True, cancel_futures=exc_type is not None)
+
+    def _activate_session(self):
+        session = shopify.Session(self.shop, SHOPIFY_API_VERSION, self.access_token)
+        shopify.ShopifyResource.activate_session(session)
+
+    @property
+    def throughput(self) -> float:
+        """Completed items per second since the executor started"""
+        if not self.started_at:
+            return 0.0
+        elapsed = time.monotonic() - self.started_at
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+    def map(self, fn: Callable, items: Iterable) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+        """Yield (item, result, error) for every item, in input order"""
+        pending = deque()
+
+        def collect():
+            item, future = pending.popleft()
+            try:
+                result = future.result()
+                error = None
+            except Exception as e:
+                result = None
+                error = e
+            self.completed += 1
+            return item, result, error
+
+        for item in items:
+            pending.append((item, self._pool.submit(fn, item)))
+            if len(pending) >= self.max_in_flight * 2:
+                yield collect()
+
+        while pending:
+            yield collect()
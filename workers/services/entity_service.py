@@ -1,15 +1,75 @@
 import shopify
-from typing import List, Dict, Any, Optional
-from config import SHOPIFY_API_VERSION
+import json
+import threading
+from collections import Counter
+from pyactiveresource.connection import ResourceConflict
+from typing import List, Dict, Any, Callable, Optional, Iterator, Tuple
+from config import (
+    SHOPIFY_API_VERSION, SHOPIFY_GRAPHQL_QUERY_COST, SHOPIFY_GRAPHQL_MAX_QUERY_COST, METAFIELDS_PER_OWNER,
+    FANOUT_CONCURRENCY
+)
+from services.rate_limiter import ShopRateLimiter
+from services.concurrent_executor import ConcurrentExecutor
+from services.metafield_batcher import OWNER_TYPES as METAFIELD_OWNER_TYPES
 import logging
 
 logger = logging.getLogger(__name__)
 
+OWNER_METAFIELDS_QUERY = """
+    query ($ids: [ID!]!, $first: Int!) {
+        nodes(ids: $ids) {
+            id
+            ... on HasMetafields {
+                metafields(first: $first) {
+                    edges {
+                        node {
+                            namespace
+                            key
+                            value
+                        }
+                    }
+                    pageInfo {
+                        hasNextPage
+                        endCursor
+                    }
+                }
+            }
+        }
+    }
+"""
+
+OWNER_METAFIELDS_PAGE_QUERY = """
+    query ($id: ID!, $first: Int!, $after: String) {
+        node(id: $id) {
+            ... on HasMetafields {
+                metafields(first: $first, after: $after) {
+                    edges {
+                        node {
+                            namespace
+                            key
+                            value
+                        }
+                    }
+                    pageInfo {
+                        hasNextPage
+                        endCursor
+                    }
+                }
+            }
+        }
+    }
+"""
+
 class EntityService:
-    def __init__(self, shop: str, access_token: str):
+    def __init__(self, shop: str, access_token: str, fetch_on_conflict: bool = False):
         self.shop = shop
         self.access_token = access_token
         self.session = None
+        self.fetch_on_conflict = fetch_on_conflict
+        self.call_counts = Counter()
+        self._counts_lock = threading.Lock()
+        self.rest_limiter = ShopRateLimiter(shop, 'rest')
+        self.graphql_limiter = ShopRateLimiter(shop, 'graphql')
         
     def __enter__(self):
         self.session = shopify.Session(self.shop, SHOPIFY_API_VERSION, self.access_token)
@@ -19,37 +79,127 @@ class EntityService:
     def __exit__(self, exc_type, exc_val, exc_tb):
         shopify.ShopifyResource.clear_session()
 
-    def fetch_paginated(self, resource_class, params: Dict = None, limit: int = 250) -> List[Dict[str, Any]]:
-        """Generic paginated fetch for any Shopify resource"""
-        items = []
-        page_info = None
+    def call(self, fn, *args, **kwargs):
+        """Run a REST call through the shop's shared rate limiter"""
+        return self.rest_limiter.call(fn, *args, **kwargs)
+
+    def graphql(self, query: str, variables: Dict = None, cost: float = SHOPIFY_GRAPHQL_QUERY_COST) -> Dict[str, Any]:
+        """Run a GraphQL query through the shop's shared rate limiter and return its data"""
+        def execute(query, variables):
+            return json.loads(shopify.GraphQL().execute(query, variables=variables))
+
+        result = self.graphql_limiter.graphql_call(execute, query, variables, cost)
+        if result.get('errors'):
+            raise ValueError(f"GraphQL errors: {result['errors']}")
+        return result.get('data') or {}
+
+    def iter_pages(self, resource_class, params: Dict = None, limit: int = 250,
+                   strict: bool = False) -> Iterator[List[Dict[str, Any]]]:
+        """Yield one page of records at a time for any Shopify resource
+
+        Errors end the iteration with a log entry, or propagate when ``strict``.
+        """
+        for page, _ in self.iter_page_cursors(resource_class, params, limit, strict):
+            yield page
+
+    def iter_page_cursors(self, resource_class, params: Dict = None, limit: int = 250, strict: bool = False,
+                          start_from: str = None) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """Yield (page, next_page_url) pairs, optionally resuming from a saved next_page_url"""
         params = params or {}
+        batch = None
         
         while True:
             try:
-                if page_info:
-                    batch = resource_class.find(limit=limit, page_info=page_info, **params)
+                if batch is None and start_from:
+                    batch = self.call(resource_class.find, from_=start_from)
+                elif batch is None:
+                    batch = self.call(resource_class.find, limit=limit, **params)
                 else:
-                    batch = resource_class.find(limit=limit, **params)
+                    batch = self.call(batch.next_page, no_cache=True)
                     
                 if not batch:
                     break
+                
+                has_next = hasattr(batch, 'has_next_page') and batch.has_next_page()
+                yield [item.to_dict() for item in batch], batch.next_page_url if has_next else None
                     
-                for item in batch:
-                    items.append(item.to_dict())
-                    
-                if not hasattr(resource_class, 'next_page_info') or not resource_class.next_page_info:
+                if not has_next:
                     break
-                    
-                page_info = resource_class.next_page_info
                 
             except Exception as e:
+                if strict:
+                    raise
                 logger.error(f"Error fetching {resource_class.__name__}: {str(e)}")
                 break
-            
+
+    def fetch_paginated(self, resource_class, params: Dict = None, limit: int = 250,
+                        strict: bool = False) -> List[Dict[str, Any]]:
+        """Generic paginated fetch for any Shopify resource"""
+        items = []
+        for page in self.iter_pages(resource_class, params, limit, strict):
+            items.extend(page)
         return items
 
-    def get_products(self, filters: Dict = None) -> List[Dict[str, Any]]:
+    def fan_out(self, parents: List[Dict[str, Any]], fetch_children: Callable[[Dict[str, Any]], List[Dict[str, Any]]],
+                label: str) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """Fetch each parent's children concurrently, yielding (parent, children) in parent order
+
+        Child requests share the shop's rate budget through the REST limiter.
+        A parent whose children fail to load raises its error, so the export
+        fails instead of silently missing that parent's rows.
+        """
+        with ConcurrentExecutor(self.shop, self.access_token, FANOUT_CONCURRENCY) as executor:
+            for parent, children, error in executor.map(fetch_children, parents):
+                if error is not None:
+                    logger.error(f"Error fetching {label} for {parent.get('id')}: {str(error)}")
+                    raise error
+                yield parent, children
+
+    def paginated_resource(self, entity: str, filters: Dict = None,
+                           fields: List[str] = None) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """Resource class and query params for entities exported through REST pagination
+
+        ``fields`` becomes the REST ``fields=`` projection, which Shopify keeps
+        on the page_info links of later pages.
+        """
+        resources = {
+            'products': (shopify.Product, self.product_params(filters)),
+            'variants': (shopify.Variant, {}),
+            'custom_collections': (shopify.CustomCollection, filters or {}),
+            'smart_collections': (shopify.SmartCollection, filters or {}),
+            'customers': (shopify.Customer, self.customer_params(filters)),
+            'orders': (shopify.Order, self.order_params(filters)),
+            'draft_orders': (shopify.DraftOrder, {}),
+            'pages': (shopify.Page, {}),
+            'redirects': (shopify.Redirect, {}),
+            'locations': (shopify.Location, {}),
+        }
+        resource = resources.get(entity)
+        if resource is None or not fields:
+            return resource
+        
+        resource_class, params = resource
+        return resource_class, dict(params, fields=','.join(fields))
+
+    def count_records(self, entity: str, filters: Dict = None) -> int:
+        """Count records for the entities that expose a REST count endpoint"""
+        countable = {
+            'products': (shopify.Product, self.product_params),
+            'customers': (shopify.Customer, self.customer_params),
+            'orders': (shopify.Order, self.order_params),
+        }
+        if entity not in countable:
+            return 0
+
+        resource_class, build_params = countable[entity]
+        try:
+            return int(self.call(resource_class.count, **build_params(filters)))
+        except Exception as e:
+            logger.error(f"Error counting {entity}: {str(e)}")
+            return 0
+
+    @staticmethod
+    def product_params(filters: Dict = None) -> Dict[str, Any]:
         params = {}
         if filters:
             if filters.get('status'):
@@ -60,8 +210,12 @@ class EntityService:
                 params['vendor'] = filters['vendor']
             if filters.get('collection_id'):
                 params['collection_id'] = filters['collection_id']
-        
-        return self.fetch_paginated(shopify.Product, params)
+            if filters.get('updated_at_min'):
+                params['updated_at_min'] = filters['updated_at_min']
+        return params
+
+    def get_products(self, filters: Dict = None) -> List[Dict[str, Any]]:
+        return self.fetch_paginated(shopify.Product, self.product_params(filters))
 
     def get_variants(self) -> List[Dict[str, Any]]:
         return self.fetch_paginated(shopify.Variant)
@@ -72,17 +226,21 @@ class EntityService:
     def get_smart_collections(self, filters: Dict = None) -> List[Dict[str, Any]]:
         return self.fetch_paginated(shopify.SmartCollection, filters or {})
 
-    def get_customers(self, filters: Dict = None) -> List[Dict[str, Any]]:
+    @staticmethod
+    def customer_params(filters: Dict = None) -> Dict[str, Any]:
         params = {}
         if filters:
             if filters.get('created_at_min'):
                 params['created_at_min'] = filters['created_at_min']
             if filters.get('updated_at_min'):
                 params['updated_at_min'] = filters['updated_at_min']
-        
-        return self.fetch_paginated(shopify.Customer, params)
+        return params
 
-    def get_orders(self, filters: Dict = None) -> List[Dict[str, Any]]:
+    def get_customers(self, filters: Dict = None) -> List[Dict[str, Any]]:
+        return self.fetch_paginated(shopify.Customer, self.customer_params(filters))
+
+    @staticmethod
+    def order_params(filters: Dict = None) -> Dict[str, Any]:
         params = {'status': 'any'}
         if filters:
             if filters.get('status'):
@@ -93,26 +251,26 @@ class EntityService:
                 params['fulfillment_status'] = filters['fulfillment_status']
             if filters.get('created_at_min'):
                 params['created_at_min'] = filters['created_at_min']
-        
-        return self.fetch_paginated(shopify.Order, params)
+            if filters.get('updated_at_min'):
+                params['updated_at_min'] = filters['updated_at_min']
+        return params
+
+    def get_orders(self, filters: Dict = None) -> List[Dict[str, Any]]:
+        return self.fetch_paginated(shopify.Order, self.order_params(filters))
 
     def get_draft_orders(self, filters: Dict = None) -> List[Dict[str, Any]]:
         return self.fetch_paginated(shopify.DraftOrder, filters or {})
 
     def get_discounts(self) -> List[Dict[str, Any]]:
         discounts = []
-        try:
-            price_rules = self.fetch_paginated(shopify.PriceRule)
-            for rule in price_rules:
-                rule['discount_codes'] = []
-                try:
-                    codes = shopify.DiscountCode.find(price_rule_id=rule['id'])
-                    rule['discount_codes'] = [c.to_dict() for c in codes]
-                except:
-                    pass
-                discounts.append(rule)
-        except Exception as e:
-            logger.error(f"Error fetching discounts: {str(e)}")
+        price_rules = self.fetch_paginated(shopify.PriceRule, strict=True)
+        
+        def codes_for(rule):
+            return self.fetch_paginated(shopify.DiscountCode, {'price_rule_id': rule['id']}, strict=True)
+        
+        for rule, codes in self.fan_out(price_rules, codes_for, 'discount codes'):
+            rule['discount_codes'] = codes
+            discounts.append(rule)
         
         return discounts
 
@@ -121,16 +279,16 @@ class EntityService:
 
     def get_blog_posts(self, filters: Dict = None) -> List[Dict[str, Any]]:
         posts = []
-        try:
-            blogs = self.fetch_paginated(shopify.Blog)
-            for blog in blogs:
-                blog_posts = self.fetch_paginated(shopify.Article, {'blog_id': blog['id']})
-                for post in blog_posts:
-                    post['blog_handle'] = blog.get('handle', '')
-                    post['blog_title'] = blog.get('title', '')
-                    posts.append(post)
-        except Exception as e:
-            logger.error(f"Error fetching blog posts: {str(e)}")
+        blogs = self.fetch_paginated(shopify.Blog, strict=True)
+        
+        def articles_for(blog):
+            return self.fetch_paginated(shopify.Article, {'blog_id': blog['id']}, strict=True)
+        
+        for blog, blog_posts in self.fan_out(blogs, articles_for, 'blog posts'):
+            for post in blog_posts:
+                post['blog_handle'] = blog.get('handle', '')
+                post['blog_title'] = blog.get('title', '')
+                posts.append(post)
         
         return posts
 
@@ -140,7 +298,7 @@ class EntityService:
     def get_files(self) -> List[Dict[str, Any]]:
         files = []
         try:
-            response = shopify.GraphQL().execute("""
+            result = self.graphql("""
                 query {
                     files(first: 250) {
                         edges {
@@ -177,7 +335,6 @@ class EntityService:
                     }
                 }
             """)
-            result = shopify.GraphQL.parse(response)
             if result and 'files' in result:
                 files = [edge['node'] for edge in result['files']['edges']]
         except Exception as e:
@@ -217,8 +374,7 @@ class EntityService:
             
             while has_next:
                 variables = {'first': 250, 'after': after}
-                response = shopify.GraphQL().execute(query, variables=variables)
-                result = shopify.GraphQL.parse(response)
+                result = self.graphql(query, variables)
                 
                 if result and 'metaobjects' in result:
                     for edge in result['metaobjects']['edges']:
@@ -236,7 +392,7 @@ class EntityService:
     def get_menus(self) -> List[Dict[str, Any]]:
         menus = []
         try:
-            response = shopify.GraphQL().execute("""
+            result = self.graphql("""
                 query {
                     shop {
                         navigationMenus(first: 250) {
@@ -257,7 +413,6 @@ class EntityService:
                     }
                 }
             """)
-            result = shopify.GraphQL.parse(response)
             if result and 'shop' in result and 'navigationMenus' in result['shop']:
                 menus = [edge['node'] for edge in result['shop']['navigationMenus']['edges']]
         except Exception as e:
@@ -267,7 +422,7 @@ class EntityService:
 
     def get_shop_info(self) -> Dict[str, Any]:
         try:
-            shop_data = shopify.Shop.current()
+            shop_data = self.call(shopify.Shop.current)
             return shop_data.to_dict() if shop_data else {}
         except Exception as e:
             logger.error(f"Error fetching shop info: {str(e)}")
@@ -280,9 +435,9 @@ class EntityService:
         items = []
         try:
             if location_id:
-                levels = shopify.InventoryLevel.find(location_ids=location_id)
+                levels = self.call(shopify.InventoryLevel.find, location_ids=location_id)
             else:
-                levels = shopify.InventoryLevel.find()
+                levels = self.call(shopify.InventoryLevel.find)
             
             for level in levels:
                 items.append(level.to_dict())
@@ -311,23 +466,18 @@ class EntityService:
         try:
             if command == 'NEW' or not data.get('id'):
                 resource = resource_class(data)
-                resource.save()
+                self._save(command, resource)
                 return resource.to_dict()
             elif command == 'UPDATE':
                 if data.get('id'):
-                    resource = resource_class.find(data['id'])
-                    for key, value in data.items():
-                        if key != 'id':
-                            setattr(resource, key, value)
-                    resource.save()
-                    return resource.to_dict()
+                    return self._update_by_id(resource_class, data)
                 else:
                     raise ValueError("ID required for UPDATE command")
             elif command == 'DELETE':
                 if data.get('id'):
-                    resource = resource_class.find(data['id'])
-                    resource.destroy()
-                    return {'deleted': True, 'id': data['id']}
+                    resource_id = self._resource_id(data['id'])
+                    self.counted_call(command, resource_class({'id': resource_id}).destroy)
+                    return {'deleted': True, 'id': resource_id}
                 else:
                     raise ValueError("ID required for DELETE command")
             else:
@@ -337,11 +487,50 @@ class EntityService:
             logger.error(f"Error in create_or_update for {entity_type}: {str(e)}")
             raise
 
+    def _update_by_id(self, resource_class, data: Dict[str, Any]) -> Dict[str, Any]:
+        """PUT only the supplied fields, fetching the current record only if that is rejected"""
+        partial = dict(data, id=self._resource_id(data['id']))
+        resource = resource_class(partial)
+        
+        try:
+            self._save('UPDATE', resource)
+            return resource.to_dict()
+        except (ValueError, ResourceConflict):
+            if not self.fetch_on_conflict:
+                raise
+        
+        logger.info(f"Direct update of {resource_class.__name__} {partial['id']} rejected, retrying with fetched record")
+        resource = self.counted_call('UPDATE', resource_class.find, partial['id'])
+        for key, value in partial.items():
+            if key != 'id':
+                setattr(resource, key, value)
+        self._save('UPDATE', resource)
+        return resource.to_dict()
+
+    def _save(self, command: str, resource) -> None:
+        if not self.counted_call(command, resource.save):
+            messages = '; '.join(resource.errors.full_messages()) or 'Validation failed'
+            raise ValueError(messages)
+
+    @staticmethod
+    def _resource_id(value: Any) -> int:
+        return int(float(value))
+
+    def count_call(self, command: str, calls: int = 1):
+        with self._counts_lock:
+            self.call_counts[command] += calls
+
+    def counted_call(self, command: str, fn, *args, **kwargs):
+        """Rate-limited REST call recorded against a command in call_counts"""
+        self.count_call(command)
+        return self.call(fn, *args, **kwargs)
+
     def get_metafields(self, owner_resource: str, owner_id: int) -> List[Dict[str, Any]]:
         """Get metafields for any entity"""
         metafields = []
         try:
-            mf = shopify.Metafield.find(
+            mf = self.call(
+                shopify.Metafield.find,
                 resource=owner_resource,
                 resource_id=owner_id
             )
@@ -351,6 +540,48 @@ class EntityService:
         
         return metafields
 
+    def get_owner_metafields(self, entity: str, owner_ids: List[Any],
+                             per_owner: int = METAFIELDS_PER_OWNER) -> List[Tuple[int, str, str, Any]]:
+        """Fetch metafields for many owners with batched GraphQL nodes queries
+
+        Returns flat (owner_id, namespace, key, value) tuples. Owners are grouped
+        so each query stays under the single-query cost limit; owners with more
+        than ``per_owner`` metafields page through the rest individually.
+        """
+        owner_type = METAFIELD_OWNER_TYPES[entity]
+        owner_cost = per_owner + 3
+        chunk_size = max(1, SHOPIFY_GRAPHQL_MAX_QUERY_COST // owner_cost)
+        metafields = []
+        
+        for start in range(0, len(owner_ids), chunk_size):
+            ids = [f"gid://shopify/{owner_type}/{self._resource_id(owner_id)}" for owner_id in owner_ids[start:start + chunk_size]]
+            data = self.graphql(OWNER_METAFIELDS_QUERY, {'ids': ids, 'first': per_owner}, cost=len(ids) * owner_cost)
+            
+            for node in data.get('nodes') or []:
+                if not node:
+                    continue
+                
+                owner_id = int(node['id'].rsplit('/', 1)[-1])
+                connection = node.get('metafields') or {}
+                
+                while True:
+                    for edge in connection.get('edges') or []:
+                        mf = edge['node']
+                        metafields.append((owner_id, mf['namespace'], mf['key'], mf['value']))
+                    
+                    page_info = connection.get('pageInfo') or {}
+                    if not page_info.get('hasNextPage'):
+                        break
+                    
+                    data = self.graphql(
+                        OWNER_METAFIELDS_PAGE_QUERY,
+                        {'id': node['id'], 'first': per_owner, 'after': page_info['endCursor']},
+                        cost=owner_cost
+                    )
+                    connection = (data.get('node') or {}).get('metafields') or {}
+        
+        return metafields
+
     def set_metafield(self, owner_resource: str, owner_id: int, namespace: str, key: str, value: Any, value_type: str) -> Dict[str, Any]:
         """Set a metafield for any entity"""
         try:
@@ -360,7 +591,7 @@ class EntityService:
                 'value': value,
                 'type': value_type
             })
-            metafield.save()
+            self.counted_call('METAFIELD', metafield.save)
             return metafield.to_dict()
         except Exception as e:
             logger.error(f"Error setting metafield: {str(e)}")
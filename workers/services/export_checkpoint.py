@@ -0,0 +1,69 @@
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from bson import ObjectId
+from config import mongodb, EXPORT_TIME_BUDGET, EXPORT_CHECKPOINT_INTERVAL
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ExportCheckpoint:
+    """Saves a streaming export's pagination cursor and upload state on its job document
+
+    ``pages`` sits between the cursor iterator and the CSV writer. Between
+    pages it checkpoints every ``interval`` seconds, and once ``budget``
+    seconds have passed it checkpoints and stops so the task can hand the
+    rest of the export to a continuation before the soft time limit.
+    """
+
+    def __init__(self, job_id: str, state: Dict[str, Any] = None, budget: float = EXPORT_TIME_BUDGET,
+                 interval: float = EXPORT_CHECKPOINT_INTERVAL, collection=None):
+        self.job_id = job_id
+        self.state = dict(state or {})
+        self.resuming = bool(state)
+        self.budget = budget
+        self.interval = interval
+        self.collection = collection if collection is not None else mongodb.jobs
+        self.cursor: Optional[str] = self.state.get('cursor')
+        self.records = self.state.get('records', 0)
+        self.saved = self.resuming
+        self.handed_off = False
+        self.started_at = time.monotonic()
+        self.last_saved = self.started_at
+
+    @classmethod
+    def load(cls, job_id: str, **kwargs) -> 'ExportCheckpoint':
+        job = mongodb.jobs.find_one({'_id': ObjectId(job_id)}, {'checkpoint': 1}) or {}
+        return cls(job_id, job.get('checkpoint'), **kwargs)
+
+    def pages(self, cursor_pages: Iterable[Tuple[List[Dict[str, Any]], Optional[str]]], writer) -> Iterator[List[Dict[str, Any]]]:
+        """Yield pages, checkpointing after each one has been written"""
+        for page, next_page_url in cursor_pages:
+            yield page
+            
+            self.records += len(page)
+            self.cursor = next_page_url
+            if next_page_url is None:
+                return
+            
+            now = time.monotonic()
+            if now - self.started_at >= self.budget:
+                self.save(writer)
+                self.handed_off = True
+                logger.info(f"Export job {self.job_id} handing off after {self.records} records")
+                return
+            
+            if now - self.last_saved >= self.interval:
+                self.save(writer)
+
+    def save(self, writer):
+        self.state.update(
+            cursor=self.cursor,
+            records=self.records,
+            upload=writer.checkpoint(f"checkpoints/{writer.key}"),
+            saved_at=datetime.utcnow()
+        )
+        self.collection.update_one({'_id': ObjectId(self.job_id)}, {'$set': {'checkpoint': self.state}})
+        self.saved = True
+        self.last_saved = time.monotonic()
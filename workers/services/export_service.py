@@ -1,118 +1,108 @@
 import pandas as pd
 from io import BytesIO
-from typing import List, Dict, Any
-from datetime import datetime
+from typing import BinaryIO, Iterable, List, Dict, Any
+from services.file_processor import FileProcessor
+from services.record_flattener import RecordFlattener
+
+
+def _is_set(value: Any) -> bool:
+    return value is not None
+
+
+def _or_zero(value: Any) -> Any:
+    return 0 if value is None else value
+
+
+def _full_name(customer: Dict[str, Any]) -> str:
+    if not customer:
+        return ''
+    return f"{customer.get('first_name') or ''} {customer.get('last_name') or ''}".strip()
+
+
+PRODUCTS_CSV = RecordFlattener([
+    ('Product ID', 'id'),
+    ('Title', 'title'),
+    ('Handle', 'handle'),
+    ('Body HTML', 'body_html'),
+    ('Vendor', 'vendor'),
+    ('Product Type', 'product_type'),
+    ('Tags', 'tags'),
+    ('Published', 'published_at', _is_set),
+    ('Status', 'status'),
+    ('Variant ID', 'variants.id'),
+    ('SKU', 'variants.sku'),
+    ('Price', 'variants.price'),
+    ('Compare At Price', 'variants.compare_at_price'),
+    ('Barcode', 'variants.barcode'),
+    ('Inventory Quantity', 'variants.inventory_quantity', _or_zero),
+    ('Weight', 'variants.weight'),
+    ('Weight Unit', 'variants.weight_unit'),
+], explode='variants')
+
+CUSTOMERS_CSV = RecordFlattener([
+    ('Customer ID', 'id'),
+    ('Email', 'email'),
+    ('First Name', 'first_name'),
+    ('Last Name', 'last_name'),
+    ('Phone', 'phone'),
+    ('Address 1', 'default_address.address1'),
+    ('Address 2', 'default_address.address2'),
+    ('City', 'default_address.city'),
+    ('Province', 'default_address.province'),
+    ('Zip', 'default_address.zip'),
+    ('Country', 'default_address.country'),
+    ('Total Spent', 'total_spent', _or_zero),
+    ('Orders Count', 'orders_count', _or_zero),
+    ('State', 'state'),
+    ('Tags', 'tags'),
+    ('Created At', 'created_at'),
+])
+
+ORDERS_CSV = RecordFlattener([
+    ('Order ID', 'id'),
+    ('Order Number', 'order_number'),
+    ('Email', 'email'),
+    ('Created At', 'created_at'),
+    ('Total Price', 'total_price', _or_zero),
+    ('Subtotal Price', 'subtotal_price', _or_zero),
+    ('Total Tax', 'total_tax', _or_zero),
+    ('Currency', 'currency'),
+    ('Financial Status', 'financial_status'),
+    ('Fulfillment Status', 'fulfillment_status'),
+    ('Customer Name', 'customer', _full_name),
+    ('Shipping Address 1', 'shipping_address.address1'),
+    ('Shipping City', 'shipping_address.city'),
+    ('Shipping Province', 'shipping_address.province'),
+    ('Shipping Country', 'shipping_address.country'),
+    ('Shipping Zip', 'shipping_address.zip'),
+])
 
 class ExportService:
     @staticmethod
     def products_to_csv(products: List[Dict[str, Any]]) -> bytes:
-        rows = []
-        
-        for product in products:
-            base_row = {
-                'Product ID': product.get('id', ''),
-                'Title': product.get('title', ''),
-                'Handle': product.get('handle', ''),
-                'Body HTML': product.get('body_html', ''),
-                'Vendor': product.get('vendor', ''),
-                'Product Type': product.get('product_type', ''),
-                'Tags': product.get('tags', ''),
-                'Published': product.get('published_at', '') is not None,
-                'Status': product.get('status', ''),
-            }
-            
-            variants = product.get('variants', [])
-            for variant in variants:
-                row = base_row.copy()
-                row.update({
-                    'Variant ID': variant.get('id', ''),
-                    'SKU': variant.get('sku', ''),
-                    'Price': variant.get('price', ''),
-                    'Compare At Price': variant.get('compare_at_price', ''),
-                    'Barcode': variant.get('barcode', ''),
-                    'Inventory Quantity': variant.get('inventory_quantity', 0),
-                    'Weight': variant.get('weight', ''),
-                    'Weight Unit': variant.get('weight_unit', ''),
-                })
-                rows.append(row)
-                
-        df = pd.DataFrame(rows)
-        
-        buffer = BytesIO()
-        df.to_csv(buffer, index=False, encoding='utf-8')
-        buffer.seek(0)
-        
-        return buffer.getvalue()
+        """One row per variant, product columns repeated"""
+        return FileProcessor.write_csv(products, flattener=PRODUCTS_CSV).encode('utf-8')
         
     @staticmethod
     def customers_to_csv(customers: List[Dict[str, Any]]) -> bytes:
-        rows = []
-        
-        for customer in customers:
-            default_address = customer.get('default_address', {}) or {}
-            
-            row = {
-                'Customer ID': customer.get('id', ''),
-                'Email': customer.get('email', ''),
-                'First Name': customer.get('first_name', ''),
-                'Last Name': customer.get('last_name', ''),
-                'Phone': customer.get('phone', ''),
-                'Address 1': default_address.get('address1', ''),
-                'Address 2': default_address.get('address2', ''),
-                'City': default_address.get('city', ''),
-                'Province': default_address.get('province', ''),
-                'Zip': default_address.get('zip', ''),
-                'Country': default_address.get('country', ''),
-                'Total Spent': customer.get('total_spent', 0),
-                'Orders Count': customer.get('orders_count', 0),
-                'State': customer.get('state', ''),
-                'Tags': customer.get('tags', ''),
-                'Created At': customer.get('created_at', ''),
-            }
-            rows.append(row)
-            
-        df = pd.DataFrame(rows)
-        
-        buffer = BytesIO()
-        df.to_csv(buffer, index=False, encoding='utf-8')
-        buffer.seek(0)
-        
-        return buffer.getvalue()
+        return FileProcessor.write_csv(customers, flattener=CUSTOMERS_CSV).encode('utf-8')
         
     @staticmethod
     def orders_to_csv(orders: List[Dict[str, Any]]) -> bytes:
-        rows = []
+        return FileProcessor.write_csv(orders, flattener=ORDERS_CSV).encode('utf-8')
         
-        for order in orders:
-            shipping_address = order.get('shipping_address', {}) or {}
-            
-            row = {
-                'Order ID': order.get('id', ''),
-                'Order Number': order.get('order_number', ''),
-                'Email': order.get('email', ''),
-                'Created At': order.get('created_at', ''),
-                'Total Price': order.get('total_price', 0),
-                'Subtotal Price': order.get('subtotal_price', 0),
-                'Total Tax': order.get('total_tax', 0),
-                'Currency': order.get('currency', ''),
-                'Financial Status': order.get('financial_status', ''),
-                'Fulfillment Status': order.get('fulfillment_status', ''),
-                'Customer Name': f"{order.get('customer', {}).get('first_name', '')} {order.get('customer', {}).get('last_name', '')}",
-                'Shipping Address 1': shipping_address.get('address1', ''),
-                'Shipping City': shipping_address.get('city', ''),
-                'Shipping Province': shipping_address.get('province', ''),
-                'Shipping Country': shipping_address.get('country', ''),
-                'Shipping Zip': shipping_address.get('zip', ''),
-            }
-            rows.append(row)
-            
-        df = pd.DataFrame(rows)
+    @staticmethod
+    def write_products_csv(pages: Iterable[List[Dict[str, Any]]], output: BinaryIO) -> int:
+        """Stream pages of products to ``output`` as products_to_csv rows and return the product count"""
+        return FileProcessor.write_csv_stream(pages, output, flattener=PRODUCTS_CSV)
         
-        buffer = BytesIO()
-        df.to_csv(buffer, index=False, encoding='utf-8')
-        buffer.seek(0)
+    @staticmethod
+    def write_customers_csv(pages: Iterable[List[Dict[str, Any]]], output: BinaryIO) -> int:
+        return FileProcessor.write_csv_stream(pages, output, flattener=CUSTOMERS_CSV)
         
-        return buffer.getvalue()
+    @staticmethod
+    def write_orders_csv(pages: Iterable[List[Dict[str, Any]]], output: BinaryIO) -> int:
+        return FileProcessor.write_csv_stream(pages, output, flattener=ORDERS_CSV)
         
     @staticmethod
     def to_excel(data: Dict[str, List[Dict[str, Any]]]) -> bytes:
@@ -3,12 +3,34 @@ import openpyxl
 from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
 import xlsxwriter
 from io import BytesIO, StringIO
-from typing import List, Dict, Any, Union
+from itertools import chain, islice
+from typing import List, Dict, Any, Optional, Tuple, Union, Iterable, Iterator, BinaryIO
+import codecs
 import csv
+import json
+import tempfile
+from services.record_flattener import RecordFlattener
 import logging
 
 logger = logging.getLogger(__name__)
 
+EXCEL_WIDTH_SAMPLE_SIZE = 1000
+
+EXCEL_HEADER_FORMAT = {
+    'bold': True,
+    'bg_color': '#4F81BD',
+    'font_color': 'white',
+    'border': 1,
+    'align': 'center',
+    'valign': 'vcenter'
+}
+
+EXCEL_CELL_FORMAT = {
+    'border': 1,
+    'valign': 'top',
+    'text_wrap': True
+}
+
 class FileProcessor:
     """Handles reading and writing CSV and Excel files"""
     
@@ -26,6 +48,76 @@ class FileProcessor:
             logger.error(f"Error reading file: {str(e)}")
             raise
 
+    @staticmethod
+    def iter_csv_batches(stream: BinaryIO, size: int) -> Iterator[pd.DataFrame]:
+        """Parse a CSV stream incrementally into DataFrames of at most ``size`` rows
+
+        Batches keep a running index across the file and have blanks filled
+        with ''. Column types are inferred per batch.
+        """
+        try:
+            with pd.read_csv(stream, chunksize=size) as reader:
+                for batch in reader:
+                    yield batch.fillna('')
+        except Exception as e:
+            logger.error(f"Error reading CSV stream: {str(e)}")
+            raise
+
+    @staticmethod
+    def iter_excel_batches(source: Union[str, BinaryIO], size: int) -> Iterator[pd.DataFrame]:
+        """Read the first sheet of an .xlsx workbook lazily into DataFrames of at most ``size`` rows
+
+        openpyxl's read_only mode streams the sheet XML instead of building the
+        cell tree, so memory stays at one batch. Values keep their Excel types
+        (whole-number floats become ints, as with ``pd.read_excel``), blank
+        rows are skipped and batches keep a running index with blanks filled
+        with ''. ``source`` must be seekable.
+        """
+        workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            
+            columns = [f'Unnamed: {i}' if value is None else str(value) for i, value in enumerate(header)]
+            width = len(columns)
+            
+            def typed_rows():
+                for values in rows:
+                    if any(value is not None for value in values):
+                        row = [int(value) if type(value) is float and value.is_integer() else value
+                               for value in values[:width]]
+                        row.extend([None] * (width - len(row)))
+                        yield row
+            
+            start = 0
+            for batch in FileProcessor.iter_batches(typed_rows(), size):
+                frame = pd.DataFrame.from_records(batch, columns=columns)
+                frame.index = range(start, start + len(frame))
+                start += len(frame)
+                yield frame.fillna('')
+        except Exception as e:
+            logger.error(f"Error reading Excel stream: {str(e)}")
+            raise
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def excel_row_count(source: Union[str, BinaryIO]) -> Optional[int]:
+        """Data row count of the first sheet from its stored dimensions, if the workbook records them"""
+        workbook = openpyxl.load_workbook(source, read_only=True)
+        try:
+            max_row = workbook.worksheets[0].max_row
+            return max(0, max_row - 1) if max_row else None
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def collect_batches(batches: Iterable[pd.DataFrame]) -> pd.DataFrame:
+        """Join streamed batches back into one DataFrame"""
+        return pd.concat(list(batches))
+
     @staticmethod
     def read_multi_sheet_excel(file_content: bytes) -> Dict[str, pd.DataFrame]:
         """Read all sheets from Excel file"""
@@ -40,9 +132,16 @@ class FileProcessor:
             raise
 
     @staticmethod
-    def write_csv(data: List[Dict[str, Any]], columns: List[str] = None) -> str:
-        """Write data to CSV string"""
+    def write_csv(data: List[Dict[str, Any]], columns: List[str] = None, flattener: RecordFlattener = None) -> str:
+        """Write data to CSV string, flattened to ``flattener``'s fixed columns if given"""
         try:
+            if flattener is not None:
+                buffer = StringIO()
+                writer = csv.writer(buffer, lineterminator='\n')
+                writer.writerow(flattener.columns)
+                writer.writerows(flattener.rows(data))
+                return buffer.getvalue()
+            
             if not data:
                 return ""
             
@@ -60,61 +159,117 @@ class FileProcessor:
             raise
 
     @staticmethod
-    def write_excel(data: List[Dict[str, Any]], columns: List[str] = None) -> bytes:
-        """Write data to Excel bytes with formatting"""
+    def write_csv_stream(pages: Iterable[List[Dict[str, Any]]], output: BinaryIO, columns: List[str] = None,
+                         header: bool = True, flattener: RecordFlattener = None) -> int:
+        """Encode pages of records to CSV incrementally and return the row count
+
+        The header is fixed by ``columns`` or by the keys of the first page;
+        keys that first appear in later pages are ignored. Pass ``header=False``
+        to append to output that already has one. With a ``flattener`` the
+        columns are its layout and each record is written as its flat rows
+        (the returned count is still of records).
+        """
         try:
-            output = BytesIO()
-            
-            if not data:
-                workbook = xlsxwriter.Workbook(output, {'in_memory': True})
-                worksheet = workbook.add_worksheet()
-                workbook.close()
-                return output.getvalue()
-            
-            df = pd.DataFrame(data)
-            
-            if columns:
-                existing_columns = [col for col in columns if col in df.columns]
-                df = df[existing_columns]
-            
-            df = df.fillna('')
-            
-            workbook = xlsxwriter.Workbook(output, {'in_memory': True})
-            worksheet = workbook.add_worksheet()
-            
-            header_format = workbook.add_format({
-                'bold': True,
-                'bg_color': '#4F81BD',
-                'font_color': 'white',
-                'border': 1,
-                'align': 'center',
-                'valign': 'vcenter'
-            })
+            writer = None
+            buffer = StringIO()
+            row_count = 0
             
-            cell_format = workbook.add_format({
-                'border': 1,
-                'valign': 'top',
-                'text_wrap': True
-            })
+            if flattener is not None:
+                writer = csv.writer(buffer, lineterminator='\n')
+                if header:
+                    writer.writerow(flattener.columns)
             
-            for col_num, column in enumerate(df.columns):
-                worksheet.write(0, col_num, column, header_format)
+            for page in pages:
+                if not page:
+                    continue
                 
-                column_width = max(len(str(column)), 
-                                  df[column].astype(str).str.len().max() if not df.empty else 0)
-                worksheet.set_column(col_num, col_num, min(column_width + 2, 50))
-            
-            for row_num, row_data in enumerate(df.values, start=1):
-                for col_num, cell_value in enumerate(row_data):
-                    worksheet.write(row_num, col_num, cell_value, cell_format)
-            
-            worksheet.freeze_panes(1, 0)
+                row_count += len(page)
+                if flattener is not None:
+                    page = flattener.rows(page)
+                elif writer is None:
+                    if not columns:
+                        columns = list(dict.fromkeys(key for row in page for key in row))
+                    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore', lineterminator='\n')
+                    if header:
+                        writer.writeheader()
+                
+                writer.writerows(page)
+                
+                output.write(buffer.getvalue().encode('utf-8'))
+                buffer.seek(0)
+                buffer.truncate()
             
-            workbook.close()
-            output.seek(0)
+            if buffer.tell():
+                output.write(buffer.getvalue().encode('utf-8'))
             
-            return output.getvalue()
+            return row_count
+        except Exception as e:
+            logger.error(f"Error streaming CSV: {str(e)}")
+            raise
+
+    @staticmethod
+    def merge_csv_snapshot(snapshot: BinaryIO, changes: List[Dict[str, Any]], key: str = 'id',
+                           size: int = 250) -> Tuple[List[str], Iterator[List[Dict[str, Any]]]]:
+        """Merge changed records into a previous CSV export without loading it
+
+        Returns the merged header and an iterator of pages: snapshot rows in
+        their original order with changed records swapped in by ``key``,
+        followed by records the snapshot did not contain.
+        """
+        reader = csv.DictReader(codecs.getreader('utf-8')(snapshot))
+        columns = list(reader.fieldnames or [])
+        columns.extend(dict.fromkeys(k for record in changes for k in record if k not in columns))
+        
+        pending = {str(record.get(key)): record for record in changes}
+        
+        def merged_rows():
+            for row in reader:
+                yield pending.pop(row.get(key), row)
+            yield from pending.values()
+        
+        return columns, FileProcessor.iter_batches(merged_rows(), size)
+
+    @staticmethod
+    def iter_batches(rows: Iterable[Dict[str, Any]], size: int = 250) -> Iterator[List[Dict[str, Any]]]:
+        """Group a record iterator into lists of at most ``size`` records"""
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @staticmethod
+    def spill_records(pages: Iterable[List[Dict[str, Any]]], output: BinaryIO) -> int:
+        """Append pages of records to a JSON-lines spill file and return the record count"""
+        count = 0
+        for page in pages:
+            if page:
+                output.write(''.join(json.dumps(record, default=str) + '\n' for record in page).encode('utf-8'))
+                count += len(page)
+        return count
+
+    @staticmethod
+    def iter_spilled_records(spill: BinaryIO) -> Iterator[Dict[str, Any]]:
+        """Read records back from a spill file written by ``spill_records``"""
+        spill.seek(0)
+        for line in spill:
+            yield json.loads(line)
+
+    @staticmethod
+    def write_excel(data: List[Dict[str, Any]], columns: List[str] = None) -> bytes:
+        """Write data to Excel bytes with formatting"""
+        try:
+            if columns:
+                present = set(key for row in data for key in row)
+                columns = [col for col in columns if col in present]
             
+            with tempfile.TemporaryFile() as output:
+                FileProcessor.write_excel_stream(data, output, columns)
+                output.seek(0)
+                return output.read()
         except Exception as e:
             logger.error(f"Error writing Excel: {str(e)}")
             raise
@@ -123,55 +278,97 @@ class FileProcessor:
     def write_multi_sheet_excel(sheets_data: Dict[str, List[Dict[str, Any]]]) -> bytes:
         """Write multiple sheets to Excel file"""
         try:
-            output = BytesIO()
-            workbook = xlsxwriter.Workbook(output, {'in_memory': True})
-            
-            header_format = workbook.add_format({
-                'bold': True,
-                'bg_color': '#4F81BD',
-                'font_color': 'white',
-                'border': 1,
-                'align': 'center',
-                'valign': 'vcenter'
-            })
-            
-            cell_format = workbook.add_format({
-                'border': 1,
-                'valign': 'top',
-                'text_wrap': True
+            with tempfile.TemporaryFile() as output:
+                FileProcessor.write_multi_sheet_excel_stream(sheets_data, output)
+                output.seek(0)
+                return output.read()
+        except Exception as e:
+            logger.error(f"Error writing multi-sheet Excel: {str(e)}")
+            raise
+
+    @staticmethod
+    def write_excel_stream(rows: Iterable[Dict[str, Any]], output: Union[str, BinaryIO],
+                           columns: List[str] = None) -> int:
+        """Write a row iterator to a single-sheet workbook in constant memory"""
+        return FileProcessor.write_multi_sheet_excel_stream({'Sheet1': rows}, output, {'Sheet1': columns})
+
+    @staticmethod
+    def write_multi_sheet_excel_stream(sheets: Dict[str, Iterable[Dict[str, Any]]], output: Union[str, BinaryIO],
+                                       columns: Dict[str, List[str]] = None) -> int:
+        """Write one row iterator per sheet using xlsxwriter's constant_memory mode
+
+        Rows are flushed to a temp file as they are written, so only the
+        column-width sample is held in memory. Returns the total row count.
+        """
+        try:
+            workbook = xlsxwriter.Workbook(output, {
+                'constant_memory': True,
+                'tmpdir': tempfile.gettempdir()
             })
+            header_format = workbook.add_format(EXCEL_HEADER_FORMAT)
+            cell_format = workbook.add_format(EXCEL_CELL_FORMAT)
+            columns = columns or {}
+            total_rows = 0
             
-            for sheet_name, data in sheets_data.items():
+            for sheet_name, rows in sheets.items():
                 worksheet = workbook.add_worksheet(sheet_name[:31])
-                
-                if not data:
-                    continue
-                
-                df = pd.DataFrame(data)
-                df = df.fillna('')
-                
-                for col_num, column in enumerate(df.columns):
-                    worksheet.write(0, col_num, column, header_format)
-                    
-                    column_width = max(len(str(column)), 
-                                      df[column].astype(str).str.len().max() if not df.empty else 0)
-                    worksheet.set_column(col_num, col_num, min(column_width + 2, 50))
-                
-                for row_num, row_data in enumerate(df.values, start=1):
-                    for col_num, cell_value in enumerate(row_data):
-                        worksheet.write(row_num, col_num, cell_value, cell_format)
-                
-                worksheet.freeze_panes(1, 0)
+                total_rows += FileProcessor._write_sheet_rows(
+                    worksheet, rows, columns.get(sheet_name), header_format, cell_format
+                )
             
-            workbook.close()
-            output.seek(0)
+            if not sheets:
+                workbook.add_worksheet()
             
-            return output.getvalue()
+            workbook.close()
+            return total_rows
             
         except Exception as e:
-            logger.error(f"Error writing multi-sheet Excel: {str(e)}")
+            logger.error(f"Error writing streaming Excel: {str(e)}")
             raise
 
+    @staticmethod
+    def _write_sheet_rows(worksheet, rows: Iterable[Dict[str, Any]], columns: List[str],
+                          header_format, cell_format) -> int:
+        rows = iter(rows)
+        sample = list(islice(rows, EXCEL_WIDTH_SAMPLE_SIZE))
+        
+        if not sample and not columns:
+            return 0
+        
+        if not columns:
+            columns = list(dict.fromkeys(key for row in sample for key in row))
+        
+        for col_num, column in enumerate(columns):
+            sample_width = max((len(str(row.get(column) or '')) for row in sample), default=0)
+            worksheet.set_column(col_num, col_num, min(max(len(str(column)), sample_width) + 2, 50))
+        
+        worksheet.write_row(0, 0, columns, header_format)
+        worksheet.freeze_panes(1, 0)
+        
+        write_string = worksheet.write_string
+        write_number = worksheet.write_number
+        write_boolean = worksheet.write_boolean
+        write_blank = worksheet.write_blank
+        row_num = 0
+        
+        for row_num, row in enumerate(chain(sample, rows), start=1):
+            for col_num, column in enumerate(columns):
+                value = row.get(column)
+                value_type = type(value)
+                if value_type is str and value:
+                    write_string(row_num, col_num, value, cell_format)
+                elif value_type is int or (value_type is float and value == value):
+                    write_number(row_num, col_num, value, cell_format)
+                elif value_type is bool:
+                    write_boolean(row_num, col_num, value, cell_format)
+                elif value is None or value_type is str or value_type is float:
+                    # Blank like the old fillna('') writer, for None, '' and NaN
+                    write_blank(row_num, col_num, None, cell_format)
+                else:
+                    write_string(row_num, col_num, str(value), cell_format)
+        
+        return row_num
+
     @staticmethod
     def get_column_mapping(entity_type: str) -> Dict[str, str]:
         """Get column mapping for different entity types"""
@@ -297,3 +494,44 @@ class FileProcessor:
                     })
         
         return metafields
+
+    @staticmethod
+    def pivot_metafields(records: List[Dict[str, Any]], metafields: Iterable[Tuple[Any, str, str, Any]]) -> List[Dict[str, Any]]:
+        """Spread (owner_id, namespace, key, value) tuples into ``Metafield:ns[key]`` columns on their owners"""
+        by_owner: Dict[Any, Dict[str, Any]] = {}
+        
+        for owner_id, namespace, key, value in metafields:
+            by_owner.setdefault(owner_id, {})[f"Metafield:{namespace}[{key}]"] = value
+        
+        if by_owner:
+            for record in records:
+                values = by_owner.get(record.get('id'))
+                if values:
+                    record.update(values)
+        
+        return records
+
+    @staticmethod
+    def compile_metafield_columns(columns: Iterable[str]) -> List[Dict[str, str]]:
+        """Parse ``Metafield:namespace[key]`` headers once per file
+
+        Returns one entry per metafield column with its namespace and key, so
+        rows can be read with plain lookups instead of re-parsing headers.
+        """
+        layout = []
+        
+        for column in columns:
+            column = str(column)
+            if not column.startswith('Metafield:'):
+                continue
+            
+            parts = column.replace('Metafield:', '').split('[')
+            if len(parts) == 2:
+                layout.append({
+                    'column': column,
+                    'namespace': parts[0].strip(),
+                    'key': parts[1].replace(']', '').strip()
+                })
+        
+        return layout
+
@@ -0,0 +1,103 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING
+from config import mongodb, IMPORT_CHECKPOINT_ROWS, IMPORT_ROWS_TTL, JOB_ERROR_LIMIT
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ImportCheckpoint:
+    """Row-level progress for an import job so a retry resumes instead of replaying
+
+    The job document holds the contiguous prefix of rows already handled, the
+    counters at that point (per chunk for chunked imports) and the metafield
+    errors of rows whose metafield batches were already flushed, since those
+    rows are not replayed. Rows that create records also leave an
+    idempotency record (row hash -> Shopify ID) in ``import_rows`` as soon as
+    the create succeeds, so rows finished after the last checkpoint are not
+    created a second time. Those records are removed when the job finishes
+    and expire after IMPORT_ROWS_TTL seconds if it never does.
+    """
+
+    def __init__(self, job_id: str, every: int = IMPORT_CHECKPOINT_ROWS, database=None, chunk: int = None):
+        self.job_id = job_id
+        self.field = 'import_checkpoint' if chunk is None else f'import_checkpoints.{chunk}'
+        self.every = every
+        self.db = database if database is not None else mongodb
+        self.rows_done = 0
+        self.success_count = 0
+        self.error_count = 0
+        self.metafield_errors: List[Tuple[int, str]] = []
+        self.metafield_error_count = 0
+        self.created: Dict[str, Any] = {}
+
+    def load(self) -> 'ImportCheckpoint':
+        """Read the saved checkpoint and the creates already recorded for this job"""
+        self.db.import_rows.create_index([('job_id', ASCENDING), ('row_hash', ASCENDING)], unique=True)
+        self.db.import_rows.create_index('created_at', expireAfterSeconds=IMPORT_ROWS_TTL)
+
+        job = self.db.jobs.find_one({'_id': ObjectId(self.job_id)}, {self.field: 1}) or {}
+        state = job
+        for part in self.field.split('.'):
+            state = state.get(part) or {}
+        self.rows_done = state.get('rows_done', 0)
+        self.success_count = state.get('success_count', 0)
+        self.error_count = state.get('error_count', 0)
+        self.metafield_errors = [(index, message) for index, message in state.get('metafield_errors') or []]
+        self.metafield_error_count = state.get('metafield_error_count', len(self.metafield_errors))
+
+        self.created = {
+            record['row_hash']: record['shopify_id']
+            for record in self.db.import_rows.find({'job_id': self.job_id}, {'row_hash': 1, 'shopify_id': 1})
+        }
+        if self.rows_done or self.created:
+            logger.info(f"Resuming import {self.job_id} after row {self.rows_done} with {len(self.created)} recorded creates")
+        return self
+
+    @staticmethod
+    def row_hash(index: int, row: Dict[str, Any]) -> str:
+        payload = json.dumps([index, row], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def created_id(self, row_hash: str) -> Optional[Any]:
+        return self.created.get(row_hash)
+
+    def record_create(self, row_hash: str, index: int, shopify_id: Any):
+        """Remember that this row created ``shopify_id``; safe to call from worker threads"""
+        self.db.import_rows.update_one(
+            {'job_id': self.job_id, 'row_hash': row_hash},
+            {'$set': {'row_index': index, 'shopify_id': shopify_id, 'created_at': datetime.utcnow()}},
+            upsert=True
+        )
+
+    @staticmethod
+    def clear(job_id: str, database=None) -> int:
+        """Drop the job's idempotency records once it can no longer be retried"""
+        db = database if database is not None else mongodb
+        return db.import_rows.delete_many({'job_id': job_id}).deleted_count
+
+    def due(self, rows_done: int) -> bool:
+        return rows_done - self.rows_done >= self.every
+
+    def total_metafield_errors(self, metafield_errors: List[Tuple[int, str]]) -> int:
+        """Count of ``metafield_errors`` (which start with the restored ones) plus those not kept past the cap"""
+        return self.metafield_error_count - len(self.metafield_errors) + len(metafield_errors)
+
+    def save(self, rows_done: int, success_count: int, error_count: int,
+             metafield_errors: List[Tuple[int, str]] = None):
+        self.rows_done = rows_done
+        state = {
+            'rows_done': rows_done,
+            'success_count': success_count,
+            'error_count': error_count,
+            'saved_at': datetime.utcnow()
+        }
+        if metafield_errors:
+            state['metafield_errors'] = [[int(index), message] for index, message in metafield_errors[:JOB_ERROR_LIMIT]]
+            state['metafield_error_count'] = self.total_metafield_errors(metafield_errors)
+        
+        self.db.jobs.update_one({'_id': ObjectId(self.job_id)}, {'$set': {self.field: state}})
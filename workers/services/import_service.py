@@ -1,12 +1,75 @@
 import pandas as pd
 from io import BytesIO
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Iterable, Iterator
+from services.file_processor import FileProcessor
+
+PRODUCT_SET_FIELDS = {
+    'handle': 'handle',
+    'title': 'title',
+    'body_html': 'descriptionHtml',
+    'vendor': 'vendor',
+    'product_type': 'productType',
+    'template_suffix': 'templateSuffix',
+}
+
+# (Option Name column, Option Value column) in normalized product rows
+OPTION_COLUMNS = [('option1', 'option1_value'), ('option2', 'option2_value'), ('option3', 'option3_value')]
+
+VARIANT_SET_FIELDS = {
+    'price': 'price',
+    'compare_at_price': 'compareAtPrice',
+    'barcode': 'barcode',
+    'taxable': 'taxable',
+}
 
 class ImportService:
     @staticmethod
     def parse_csv(file_content: bytes) -> pd.DataFrame:
         return pd.read_csv(BytesIO(file_content))
         
+    @staticmethod
+    def chunk_ranges(df: pd.DataFrame, size: int, group_columns: List[str] = None) -> List[Tuple[int, int]]:
+        """Split row positions into [start, end) ranges of about ``size`` rows
+
+        Rows sharing a value in the first present ``group_columns`` column (e.g.
+        a product's variant rows under one Handle) never straddle two ranges;
+        blank values continue the group above them.
+        """
+        total = len(df)
+        column = next((c for c in group_columns or [] if c in df.columns), None)
+        
+        if column is None:
+            starts = list(range(total))
+        else:
+            values = df[column].astype(str).str.strip().replace('', pd.NA).ffill()
+            starts = [0] + list((values.ne(values.shift()) & values.notna()).to_numpy().nonzero()[0][1:])
+        
+        boundaries = [0]
+        for start in starts:
+            if start - boundaries[-1] >= size:
+                boundaries.append(int(start))
+        boundaries.append(total)
+        
+        return list(zip(boundaries[:-1], boundaries[1:]))
+
+    @staticmethod
+    def iter_chunks(batches: Iterable[pd.DataFrame], size: int, group_columns: List[str] = None) -> Iterator[pd.DataFrame]:
+        """Re-cut a stream of DataFrame batches into ``chunk_ranges``-style chunks
+
+        Only the trailing, possibly incomplete range is held back and joined
+        with the next batch, so memory stays around one chunk plus one batch.
+        """
+        pending = None
+        for batch in batches:
+            pending = batch if pending is None else pd.concat([pending, batch])
+            ranges = ImportService.chunk_ranges(pending, size, group_columns)
+            for start, end in ranges[:-1]:
+                yield pending.iloc[start:end]
+            pending = pending.iloc[ranges[-1][0]:]
+        
+        if pending is not None and len(pending):
+            yield pending
+
     @staticmethod
     def parse_excel(file_content: bytes, sheet_name: str = 0) -> pd.DataFrame:
         return pd.read_excel(BytesIO(file_content), sheet_name=sheet_name)
@@ -81,3 +144,251 @@ class ImportService:
             customer_data['addresses'] = [address]
             
         return customer_data
+
+    @staticmethod
+    def _text_column(df: pd.DataFrame, column: str, default: str = '') -> pd.Series:
+        """String-coerce a column, replacing nulls (or a missing column) with default"""
+        if column not in df.columns:
+            return pd.Series(default, index=df.index, dtype=object)
+        values = df[column]
+        return values.astype(str).where(values.notna(), default)
+
+    @staticmethod
+    def _present_mask(df: pd.DataFrame, column: str) -> pd.Series:
+        if column not in df.columns:
+            return pd.Series(False, index=df.index)
+        return df[column].notna()
+
+    @staticmethod
+    def _required_errors(df: pd.DataFrame, column: str) -> pd.Series:
+        """Row-number-prefixed messages for rows missing a required column"""
+        if column in df.columns:
+            missing = df[column].isna() | (df[column] == '')
+        else:
+            missing = pd.Series(True, index=df.index)
+        return ImportService._error_messages(df.index[missing], f"Missing required field: {column}")
+
+    @staticmethod
+    def _error_messages(index: pd.Index, message: str) -> pd.Series:
+        return pd.Series('Row ' + (index.to_series() + 2).astype(str) + ': ' + message, index=index)
+
+    @staticmethod
+    def transform_products(df: pd.DataFrame) -> Tuple[List[Tuple[int, Dict[str, Any]]], List[str]]:
+        """Validate and convert a whole product DataFrame column by column
+
+        Returns (row index, payload) pairs for valid rows and the error report
+        for invalid ones, matching validate_product_row/row_to_product.
+        """
+        errors = ImportService._required_errors(df, 'Title')
+
+        if 'Inventory Quantity' in df.columns:
+            raw_quantity = df['Inventory Quantity']
+            quantity = pd.to_numeric(raw_quantity, errors='coerce')
+            bad_quantity = raw_quantity.notna() & quantity.isna()
+            bad_quantity = bad_quantity[~bad_quantity.index.isin(errors.index)]
+            errors = pd.concat([errors, ImportService._error_messages(
+                bad_quantity.index[bad_quantity], "Invalid Inventory Quantity"
+            )])
+            quantity = quantity.fillna(0)
+        else:
+            quantity = pd.Series(0, index=df.index)
+
+        valid = ~df.index.isin(errors.index)
+        text = ImportService._text_column
+        present = ImportService._present_mask
+
+        columns = [
+            df.index,
+            text(df, 'Title'),
+            text(df, 'Body HTML'),
+            text(df, 'Vendor'),
+            text(df, 'Product Type'),
+            text(df, 'Tags'),
+            text(df, 'SKU'),
+            text(df, 'Price', '0'),
+            quantity,
+            text(df, 'Compare At Price'),
+            present(df, 'Compare At Price'),
+            text(df, 'Barcode'),
+            present(df, 'Barcode'),
+        ]
+        columns = [column[valid] for column in columns]
+
+        payloads = []
+        for (index, title, body_html, vendor, product_type, tags, sku, price, qty,
+             compare_at_price, has_compare_at_price, barcode, has_barcode) in zip(*columns):
+            variant = {'sku': sku, 'price': price, 'inventory_quantity': int(qty)}
+            if has_compare_at_price:
+                variant['compare_at_price'] = compare_at_price
+            if has_barcode:
+                variant['barcode'] = barcode
+
+            payloads.append((index, {
+                'title': title,
+                'body_html': body_html,
+                'vendor': vendor,
+                'product_type': product_type,
+                'tags': tags,
+                'variants': [variant],
+            }))
+
+        return payloads, errors.sort_index().tolist()
+
+    @staticmethod
+    def transform_customers(df: pd.DataFrame) -> Tuple[List[Tuple[int, Dict[str, Any]]], List[str]]:
+        """Validate and convert a whole customer DataFrame column by column"""
+        errors = ImportService._required_errors(df, 'Email')
+        valid = ~df.index.isin(errors.index)
+        text = ImportService._text_column
+        present = ImportService._present_mask
+
+        has_address = present(df, 'Address 1') | present(df, 'City') | present(df, 'Country')
+
+        columns = [
+            df.index,
+            text(df, 'Email'),
+            text(df, 'First Name'),
+            text(df, 'Last Name'),
+            text(df, 'Phone'),
+            has_address,
+            text(df, 'Address 1'),
+            text(df, 'Address 2'),
+            text(df, 'City'),
+            text(df, 'Province'),
+            text(df, 'Zip'),
+            text(df, 'Country'),
+        ]
+        columns = [column[valid] for column in columns]
+
+        payloads = []
+        for (index, email, first_name, last_name, phone, address_present,
+             address1, address2, city, province, zip_code, country) in zip(*columns):
+            customer_data = {
+                'email': email,
+                'first_name': first_name,
+                'last_name': last_name,
+                'phone': phone,
+            }
+            if address_present:
+                customer_data['addresses'] = [{
+                    'address1': address1,
+                    'address2': address2,
+                    'city': city,
+                    'province': province,
+                    'zip': zip_code,
+                    'country': country,
+                }]
+            payloads.append((index, customer_data))
+
+        return payloads, errors.sort_index().tolist()
+
+    @staticmethod
+    def rows_to_product_set_input(rows: List[Dict[str, Any]], command: str = 'UPDATE') -> Dict[str, Any]:
+        """Convert one product's normalized rows into a GraphQL ProductSetInput
+
+        As in Shopify's product CSV, the first row carries the product fields
+        and option names and every row with variant columns is one variant.
+        productSet replaces the lists it is given, so variants and options
+        are only sent when the rows carry variant columns; rows that only edit
+        product fields leave the product's variants alone. ``NEW`` drops the
+        ``id`` so the product is created. Raises ValueError for rows that
+        cannot form a product.
+        """
+        rows = [{k: v for k, v in row.items() if v is not None and v != ''} for row in rows]
+        first = rows[0]
+        product_input = {PRODUCT_SET_FIELDS[k]: v for k, v in first.items() if k in PRODUCT_SET_FIELDS}
+
+        if first.get('id') and command != 'NEW':
+            product_input['id'] = f"gid://shopify/Product/{int(float(first['id']))}"
+        elif not first.get('title'):
+            raise ValueError("Missing required field: Title")
+        if first.get('tags'):
+            product_input['tags'] = [tag.strip() for tag in str(first['tags']).split(',') if tag.strip()]
+        if first.get('status'):
+            product_input['status'] = str(first['status']).upper()
+
+        options = [(str(first[name]), value) for name, value in OPTION_COLUMNS if first.get(name)]
+        variants = []
+        for row in rows:
+            variant = {VARIANT_SET_FIELDS[k]: v for k, v in row.items() if k in VARIANT_SET_FIELDS}
+            if row.get('sku'):
+                variant['inventoryItem'] = {'sku': str(row['sku'])}
+            if row.get('inventory_policy'):
+                variant['inventoryPolicy'] = str(row['inventory_policy']).upper()
+            values = [{'optionName': name, 'name': str(row[value])} for name, value in options if row.get(value)]
+            if values:
+                variant['optionValues'] = values
+            if variant:
+                variants.append(variant)
+
+        if variants:
+            if options:
+                if any(len(variant.get('optionValues', ())) != len(options) for variant in variants):
+                    raise ValueError(f"Every variant row needs a value for {', '.join(name for name, _ in options)}")
+                product_input['productOptions'] = [
+                    {'name': name, 'values': [{'name': v} for v in dict.fromkeys(str(row[value]) for row in rows if row.get(value))]}
+                    for name, value in options
+                ]
+            elif len(variants) == 1:
+                variants[0]['optionValues'] = [{'optionName': 'Title', 'name': 'Default Title'}]
+                product_input['productOptions'] = [{'name': 'Title', 'values': [{'name': 'Default Title'}]}]
+            else:
+                raise ValueError("Several variant rows need Option1 Name and Option1 Value columns")
+            product_input['variants'] = variants
+
+        metafields = {}
+        for row in rows:
+            for mf in FileProcessor.extract_metafields(row):
+                metafields.setdefault((mf['namespace'], mf['key']), {
+                    'namespace': mf['namespace'], 'key': mf['key'], 'value': str(mf['value']),
+                    'type': 'single_line_text_field'
+                })
+        if metafields:
+            product_input['metafields'] = list(metafields.values())
+
+        return product_input
+
+    @staticmethod
+    def group_product_rows(df: pd.DataFrame) -> List[List[int]]:
+        """Row positions per product: rows sharing a Handle, blank Handles continuing the product above"""
+        column = next((c for c in ['Handle', 'handle'] if c in df.columns), None)
+        if column is None:
+            return [[position] for position in range(len(df))]
+
+        handles = df[column].where(df[column].notna(), '').astype(str).str.strip().replace('', pd.NA).ffill()
+        groups: Dict[Any, List[int]] = {}
+        for position, handle in enumerate(handles):
+            groups.setdefault(('row', position) if pd.isna(handle) else handle, []).append(position)
+        return list(groups.values())
+
+    @staticmethod
+    def transform_product_set_inputs(df: pd.DataFrame, command_mode: str = 'UPDATE') -> Tuple[
+            List[Tuple[List[int], Dict[str, Any]]], List[Tuple[List[int], str]]]:
+        """One ProductSetInput per product of a file in display or API column names
+
+        Returns (row indexes, input) pairs and (row indexes, message) errors
+        for products whose rows cannot be converted. A product's command is
+        its first row's ``Command``, or ``command_mode`` when that is blank.
+        """
+        mapping = FileProcessor.get_column_mapping('products')
+        df = df.rename(columns={k: v for k, v in mapping.items() if k in df.columns})
+        records = df.to_dict('records')
+        indexes = list(df.index)
+
+        inputs, errors = [], []
+        for positions in ImportService.group_product_rows(df):
+            rows = [records[position] for position in positions]
+            row_indexes = [indexes[position] for position in positions]
+            command = str(rows[0].get('command') or command_mode).strip().upper()
+            try:
+                inputs.append((row_indexes, ImportService.rows_to_product_set_input(rows, command)))
+            except ValueError as e:
+                errors.append((row_indexes, str(e)))
+        return inputs, errors
+
+    @staticmethod
+    def row_label(indexes: List[int]) -> str:
+        """``Row 2`` or ``Rows 2-4`` for DataFrame indexes (header is row 1)"""
+        if len(indexes) == 1:
+            return f"Row {indexes[0] + 2}"
+        return f"Rows {indexes[0] + 2}-{indexes[-1] + 2}"
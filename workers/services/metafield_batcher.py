@@ -0,0 +1,120 @@
+from typing import List, Dict, Any, Tuple
+from config import METAFIELDS_SET_BATCH_SIZE
+import logging
+
+logger = logging.getLogger(__name__)
+
+OWNER_TYPES = {
+    'products': 'Product',
+    'customers': 'Customer',
+    'custom_collections': 'Collection',
+    'smart_collections': 'Collection',
+    'pages': 'Page',
+    'draft_orders': 'DraftOrder',
+}
+
+METAFIELDS_SET_MUTATION = """
+    mutation ($metafields: [MetafieldsSetInput!]!) {
+        metafieldsSet(metafields: $metafields) {
+            metafields {
+                id
+            }
+            userErrors {
+                field
+                message
+                elementIndex
+            }
+        }
+    }
+"""
+
+DEFAULT_METAFIELD_TYPE = 'single_line_text_field'
+
+
+class MetafieldBatcher:
+    """Collects metafield writes across rows and sends them through metafieldsSet
+
+    Each flush writes up to METAFIELDS_SET_BATCH_SIZE metafields (the API's
+    per-call limit) in one GraphQL call. User errors are mapped back to the
+    row that contributed the failing metafield.
+    """
+
+    def __init__(self, entity_service, entity: str, batch_size: int = METAFIELDS_SET_BATCH_SIZE):
+        if entity not in OWNER_TYPES:
+            raise ValueError(f"Metafields are not supported for {entity}")
+
+        self.entity_service = entity_service
+        self.owner_type = OWNER_TYPES[entity]
+        self.batch_size = batch_size
+        self.pending: List[Tuple[int, Dict[str, Any]]] = []
+        self.errors: List[Tuple[int, str]] = []
+        self.written = 0
+        self.calls = 0
+
+    def add(self, row_index: int, owner_id: Any, metafields: List[Dict[str, Any]]):
+        """Queue a row's metafields, flushing whenever a full batch is ready"""
+        owner_gid = f"gid://shopify/{self.owner_type}/{int(float(owner_id))}"
+
+        for mf in metafields:
+            if mf['value'] is None or mf['value'] == '':
+                continue
+            self.pending.append((row_index, {
+                'ownerId': owner_gid,
+                'namespace': mf['namespace'],
+                'key': mf['key'],
+                'value': str(mf['value']),
+                'type': mf.get('type') or DEFAULT_METAFIELD_TYPE
+            }))
+
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """Write everything queued so far"""
+        while self.pending:
+            batch = self.pending[:self.batch_size]
+            del self.pending[:self.batch_size]
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: List[Tuple[int, Dict[str, Any]]]):
+        self.calls += 1
+        self.entity_service.count_call('METAFIELD')
+        try:
+            data = self.entity_service.graphql(METAFIELDS_SET_MUTATION, {'metafields': [item for _, item in batch]})
+        except Exception as e:
+            logger.error(f"metafieldsSet failed for {len(batch)} metafields: {str(e)}")
+            for row_index, item in batch:
+                self.errors.append((row_index, self._describe(item, str(e))))
+            return
+
+        user_errors = (data.get('metafieldsSet') or {}).get('userErrors') or []
+        failed = set()
+
+        for error in user_errors:
+            position = self._element_index(error)
+            if position is None or position >= len(batch):
+                # Unattributable errors fail the whole batch
+                failed.update(range(len(batch)))
+                for row_index, item in batch:
+                    self.errors.append((row_index, self._describe(item, error.get('message', ''))))
+                continue
+
+            failed.add(position)
+            row_index, item = batch[position]
+            self.errors.append((row_index, self._describe(item, error.get('message', ''))))
+
+        self.written += len(batch) - len(failed)
+
+    @staticmethod
+    def _element_index(error: Dict[str, Any]):
+        if error.get('elementIndex') is not None:
+            return int(error['elementIndex'])
+
+        field = error.get('field') or []
+        if len(field) >= 2 and field[0] == 'metafields' and str(field[1]).isdigit():
+            return int(field[1])
+        return None
+
+    @staticmethod
+    def _describe(item: Dict[str, Any], message: str) -> str:
+        return f"Metafield {item['namespace']}.{item['key']}: {message}"
@@ -0,0 +1,253 @@
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from config import mongodb, MIRROR_WRITE_BATCH_SIZE
+from services.watermark_service import WatermarkService
+import logging
+
+logger = logging.getLogger(__name__)
+
+MIRROR_ENTITIES = {
+    'products': {
+        'collection': 'mirror_products',
+        'filters': {'status': 'status', 'product_type': 'product_type', 'vendor': 'vendor'},
+    },
+    'customers': {
+        'collection': 'mirror_customers',
+        'filters': {'created_at_min': '_created_at', 'updated_at_min': '_updated_at'},
+    },
+    'orders': {
+        'collection': 'mirror_orders',
+        'filters': {
+            'financial_status': 'financial_status',
+            'fulfillment_status': 'fulfillment_status',
+            'created_at_min': '_created_at',
+            'updated_at_min': '_updated_at',
+        },
+    },
+    'custom_collections': {
+        'collection': 'mirror_custom_collections',
+        'filters': {},
+    },
+    'smart_collections': {
+        'collection': 'mirror_smart_collections',
+        'filters': {},
+    },
+}
+
+# Shopify webhook topic prefix -> mirrored entity
+WEBHOOK_TOPICS = {
+    'products': 'products',
+    'customers': 'customers',
+    'orders': 'orders',
+    'collections': None,
+}
+
+RANGE_FILTERS = ['created_at_min', 'updated_at_min']
+
+INTERNAL_FIELDS = ['_id', 'shop', '_created_at', '_updated_at', '_mirrored_at']
+
+# Mirror states that already have a load queued, running or done
+LOAD_STATES = ['queued', 'loading', 'ready']
+
+# (database, collection) pairs whose indexes this process has already ensured
+_indexed = set()
+
+
+class MirrorService:
+    """Per-shop copy of Shopify entities in MongoDB, kept current by webhooks
+
+    Records keep their REST shape (the shape webhooks deliver) plus internal
+    fields for filtering. Writes only land if they are at least as new as the
+    stored record, so late or replayed webhooks cannot roll a record back.
+    Mirror readiness per shop and entity is tracked in ``mirror_state``.
+    Indexes are ensured before the first write of each process, since the
+    unique (shop, id) index is what turns a stale guarded upsert into a
+    duplicate key error instead of a second copy of the record.
+    """
+
+    def __init__(self, shop: str, database=None):
+        self.shop = shop
+        self.db = database if database is not None else mongodb
+
+    @staticmethod
+    def supports(entity: str) -> bool:
+        return entity in MIRROR_ENTITIES
+
+    def collection(self, entity: str):
+        return self.db[MIRROR_ENTITIES[entity]['collection']]
+
+    def ensure_indexes(self, entity: str):
+        collection = self.collection(entity)
+        if (self.db.name, collection.name) in _indexed:
+            return
+        
+        collection.create_index([('shop', ASCENDING), ('id', ASCENDING)], unique=True)
+        collection.create_index([('shop', ASCENDING), ('_updated_at', ASCENDING)])
+        for field in set(MIRROR_ENTITIES[entity]['filters'].values()) - {'_updated_at'}:
+            collection.create_index([('shop', ASCENDING), (field, ASCENDING)])
+        _indexed.add((self.db.name, collection.name))
+
+    def ensure_state_index(self):
+        if (self.db.name, 'mirror_state') in _indexed:
+            return
+        self.db.mirror_state.create_index([('shop', ASCENDING), ('entity', ASCENDING)], unique=True)
+        _indexed.add((self.db.name, 'mirror_state'))
+
+    def state(self, entity: str) -> Optional[Dict[str, Any]]:
+        return self.db.mirror_state.find_one({'shop': self.shop, 'entity': entity})
+
+    def set_state(self, entity: str, **fields):
+        self.db.mirror_state.update_one(
+            {'shop': self.shop, 'entity': entity},
+            {'$set': dict(fields, updated_at=datetime.utcnow())},
+            upsert=True
+        )
+
+    def is_ready(self, entity: str) -> bool:
+        return (self.state(entity) or {}).get('status') == 'ready'
+
+    def claim_load(self, entity: str) -> bool:
+        """Mark ``entity`` as queued for its initial load unless a load is already queued, running or done
+
+        Returns True for the one caller that should enqueue ``mirror_load``;
+        a failed load can be claimed again.
+        """
+        self.ensure_state_index()
+        try:
+            result = self.db.mirror_state.update_one(
+                {'shop': self.shop, 'entity': entity, 'status': {'$nin': LOAD_STATES}},
+                {'$set': {'status': 'queued', 'updated_at': datetime.utcnow()}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return bool(result.upserted_id or result.modified_count)
+
+    def _write_op(self, record: Dict[str, Any], mirrored_at: datetime) -> UpdateOne:
+        updated_at = WatermarkService.parse_timestamp(record.get('updated_at'))
+        document = dict(
+            record,
+            shop=self.shop,
+            _created_at=WatermarkService.parse_timestamp(record.get('created_at')),
+            _updated_at=updated_at,
+            _mirrored_at=mirrored_at
+        )
+
+        selector = {'shop': self.shop, 'id': record['id']}
+        if updated_at is not None:
+            selector['$or'] = [{'_updated_at': {'$lte': updated_at}}, {'_updated_at': None}]
+
+        return UpdateOne(selector, {'$set': document}, upsert=True)
+
+    def upsert(self, entity: str, records: List[Dict[str, Any]], mirrored_at: datetime = None) -> int:
+        """Write records unless a newer version is already mirrored; returns records written"""
+        if not records:
+            return 0
+
+        self.ensure_indexes(entity)
+        mirrored_at = mirrored_at or datetime.utcnow()
+        ops = [self._write_op(record, mirrored_at) for record in records if record.get('id') is not None]
+
+        try:
+            result = self.collection(entity).bulk_write(ops, ordered=False)
+            return result.upserted_count + result.modified_count
+        except BulkWriteError as e:
+            # A duplicate key means the guarded selector missed a newer stored record
+            stale = [error for error in e.details.get('writeErrors', []) if error.get('code') == 11000]
+            if len(stale) != len(e.details.get('writeErrors', [])):
+                raise
+            return e.details.get('nUpserted', 0) + e.details.get('nModified', 0)
+
+    def delete(self, entity: str, record_id: Any) -> int:
+        return self.collection(entity).delete_one({'shop': self.shop, 'id': record_id}).deleted_count
+
+    def load(self, entity: str, pages) -> int:
+        """Replace the shop's mirror of ``entity`` with freshly fetched pages
+
+        Records not seen by the load and not touched by a webhook while it ran
+        are removed afterwards, which drops records deleted in Shopify.
+        """
+        self.ensure_indexes(entity)
+        self.set_state(entity, status='loading')
+        started_at = datetime.utcnow()
+        total = 0
+
+        for page in pages:
+            for start in range(0, len(page), MIRROR_WRITE_BATCH_SIZE):
+                self.upsert(entity, page[start:start + MIRROR_WRITE_BATCH_SIZE], started_at)
+            total += len(page)
+
+        removed = self.collection(entity).delete_many({'shop': self.shop, '_mirrored_at': {'$lt': started_at}}).deleted_count
+        self.set_state(entity, status='ready', loaded_at=started_at, record_count=total)
+        logger.info(f"Mirrored {total} {entity} for {self.shop}, removed {removed} stale records")
+        return total
+
+    def apply_webhook(self, topic: str, payload: Dict[str, Any]) -> Optional[str]:
+        """Apply one webhook (e.g. ``products/update``) and return the entity it touched"""
+        resource, _, action = topic.replace('-', '/').partition('/')
+        if resource not in WEBHOOK_TOPICS or not payload.get('id'):
+            logger.warning(f"Ignoring webhook {topic} for {self.shop}")
+            return None
+
+        entity = WEBHOOK_TOPICS[resource]
+        if entity is None:
+            entity = 'smart_collections' if 'rules' in payload else 'custom_collections'
+
+        if action == 'delete':
+            if resource == 'collections':
+                for collection_entity in ['custom_collections', 'smart_collections']:
+                    self.delete(collection_entity, payload['id'])
+            else:
+                self.delete(entity, payload['id'])
+        else:
+            self.upsert(entity, [payload])
+
+        return entity
+
+    def can_serve(self, entity: str, filters: Dict = None) -> bool:
+        """Whether an export with these filters can be answered from the mirror"""
+        if not self.supports(entity) or not self.is_ready(entity):
+            return False
+
+        supported = MIRROR_ENTITIES[entity]['filters']
+        for key, value in (filters or {}).items():
+            if not value or (entity == 'orders' and key == 'status' and value == 'any'):
+                continue
+            if key not in supported:
+                return False
+        return True
+
+    def build_query(self, entity: str, filters: Dict = None) -> Dict[str, Any]:
+        query = {'shop': self.shop}
+        supported = MIRROR_ENTITIES[entity]['filters']
+
+        for key, value in (filters or {}).items():
+            if not value or key not in supported:
+                continue
+            if key in RANGE_FILTERS:
+                query[supported[key]] = {'$gte': WatermarkService.parse_timestamp(value)}
+            else:
+                query[supported[key]] = value
+
+        return query
+
+    def iter_pages(self, entity: str, filters: Dict = None, size: int = 250,
+                   fields: List[str] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Yield mirrored records in id order, in pages of ``size``, limited to ``fields`` if given"""
+        if fields:
+            projection = dict({field: 1 for field in fields}, _id=0)
+        else:
+            projection = {field: 0 for field in INTERNAL_FIELDS}
+        cursor = self.collection(entity).find(self.build_query(entity, filters), projection) \
+            .sort('id', ASCENDING).batch_size(size)
+
+        page = []
+        for record in cursor:
+            page.append(record)
+            if len(page) >= size:
+                yield page
+                page = []
+        if page:
+            yield page
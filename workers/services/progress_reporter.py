@@ -0,0 +1,280 @@
+import json
+import time
+import redis
+from typing import Any, Dict, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from config import (
+    mongodb, redis_client, PROGRESS_FLUSH_INTERVAL, PROGRESS_FLUSH_ROWS, JOB_ERROR_LIMIT,
+    PROGRESS_MILESTONE_PERCENT, PROGRESS_MILESTONE_INTERVAL, PROGRESS_EVENT_TTL
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressReporter:
+    """Coalesces a task's progress into periodic events and job document writes
+
+    Counters and error messages are buffered in memory and flushed every
+    ``interval`` seconds or every ``every`` processed rows, whichever comes
+    first. Each flush publishes a compact event on the ``job_progress:<id>``
+    Redis channel and stores it under ``job_status:<id>`` for late readers.
+    The job document is only written at milestones (every
+    PROGRESS_MILESTONE_PERCENT of the total, every PROGRESS_MILESTONE_INTERVAL
+    seconds, when errors are queued, and on exit); errors go out in a single
+    ``$push: {$each: ...}`` capped at ``error_limit`` per job (per chunk for
+    chunked jobs), counting errors a previous run of the task already
+    stored. Leaving the context flushes whatever is pending, on success
+    and on failure.
+
+    A reporter for one ``chunk`` of a larger job keeps its own latest event
+    under ``job_status:<id>:<chunk>`` and in the ``job_status:<id>:chunks``
+    hash, and publishes (and stores under ``job_status:<id>``) the job-wide
+    event summed over every chunk's latest event, out of ``job_total`` rows
+    when given. It stores its absolute counters under ``chunks.<n>`` on the
+    job document and raises the job-level counters to the sum over all
+    chunks with ``$max``, so a resumed chunk never counts the same rows twice
+    and racing chunks never move the job totals backwards.
+    """
+
+    def __init__(self, task, job_id: str, total: int = None, processed: int = 0, success: int = 0,
+                 errors: int = 0, label: str = 'rows', interval: float = PROGRESS_FLUSH_INTERVAL,
+                 every: int = PROGRESS_FLUSH_ROWS, error_limit: int = JOB_ERROR_LIMIT, collection=None,
+                 client=None, chunk: int = None, job_total: int = None):
+        self.task = task
+        self.job_id = job_id
+        self.total = total
+        self.label = label
+        self.processed = processed
+        self.success_count = success
+        self.error_count = errors
+        self.interval = interval
+        self.every = every
+        self.error_limit = error_limit
+        self.collection = collection if collection is not None else mongodb.jobs
+        self.client = client if client is not None else redis_client
+        self.chunk = chunk
+        self.job_total = job_total
+        self.channel = f"job_progress:{job_id}"
+        self.status_key = f"job_status:{job_id}"
+        self.chunk_key = None if chunk is None else f"job_status:{job_id}:{chunk}"
+        self.chunks_key = f"job_status:{job_id}:chunks"
+        self.extra: Dict[str, Any] = {}
+        self.pending_errors: List[str] = []
+        self.errors_stored = self.stored_errors()
+        self.started_at = time.monotonic()
+        self._started_processed = processed
+        self._flushed_at = self.started_at
+        self._flushed_processed = processed
+        self._stored_at = self.started_at
+        self._stored_milestone = self._milestone()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.flush(store=True)
+        except Exception as e:
+            if exc_type is None:
+                raise
+            logger.error(f"Error flushing progress for job {self.job_id}: {str(e)}")
+
+    @property
+    def percent(self) -> Optional[int]:
+        if not self.total:
+            return None
+        return min(100, int(self.processed / self.total * 100))
+
+    @property
+    def rate(self) -> float:
+        """Rows per second processed by this reporter so far"""
+        elapsed = time.monotonic() - self.started_at
+        return (self.processed - self._started_processed) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[int]:
+        """Estimated seconds remaining, when the total is known"""
+        rate = self.rate
+        if not self.total or rate <= 0:
+            return None
+        return int(max(0, self.total - self.processed) / rate)
+
+    def _milestone(self) -> Optional[int]:
+        percent = self.percent
+        return None if percent is None else percent // PROGRESS_MILESTONE_PERCENT
+
+    def stage(self, message: str):
+        """Report a coarse stage change (download, parse, ...) straight away"""
+        self.task.update_state(state='PROGRESS', meta={'status': message})
+        event = {'job_id': self.job_id, 'status': message}
+        if self.chunk is not None:
+            event['chunk'] = self.chunk
+        self.publish(event)
+
+    def success(self, count: int = 1):
+        self.processed += count
+        self.success_count += count
+        self.maybe_flush()
+
+    def failure(self, message: str):
+        self.processed += 1
+        self.error_count += 1
+        self.record_errors([message])
+        self.maybe_flush()
+
+    def advance(self, count: int):
+        """Count processed records without classifying them (exports)"""
+        self.processed += count
+        self.maybe_flush()
+
+    def stored_errors(self) -> int:
+        """Error messages already on the job document from this job (or chunk)"""
+        if self.chunk is None:
+            job = self.collection.find_one({'_id': ObjectId(self.job_id)}, {'errors': 1}) or {}
+            return len(job.get('errors') or [])
+        
+        job = self.collection.find_one({'_id': ObjectId(self.job_id)}, {f'chunks.{self.chunk}.errors_stored': 1}) or {}
+        return ((job.get('chunks') or {}).get(str(self.chunk)) or {}).get('errors_stored', 0)
+
+    def record_errors(self, messages: List[str]):
+        """Queue error messages for the job document without touching the counters"""
+        room = self.error_limit - self.errors_stored - len(self.pending_errors)
+        if room > 0:
+            self.pending_errors.extend(messages[:room])
+
+    def set(self, **extra):
+        """Attach extra fields (throughput, ...) to the next flush"""
+        self.extra.update(extra)
+
+    def maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= self.interval or self.processed - self._flushed_processed >= self.every:
+            self.flush()
+
+    def event(self) -> Dict[str, Any]:
+        """Compact progress event for subscribers"""
+        event = {
+            'job_id': self.job_id,
+            'processed': self.processed,
+            'total': self.total,
+            'success': self.success_count,
+            'errors': self.error_count,
+            'progress': self.percent,
+            'throughput': self.extra.get('throughput', round(self.rate, 2)),
+            'eta': self.eta
+        }
+        if self.chunk is not None:
+            event['chunk'] = self.chunk
+        return event
+
+    def publish(self, event: Dict[str, Any]):
+        """Publish an event and keep it as the job's latest status; never fails the task"""
+        try:
+            if self.chunk is not None:
+                if 'processed' not in event:
+                    self.client.setex(self.chunk_key, PROGRESS_EVENT_TTL, json.dumps(event))
+                    return
+                event = self.job_event(event)
+            
+            payload = json.dumps(event)
+            pipe = self.client.pipeline(transaction=False)
+            pipe.setex(self.status_key, PROGRESS_EVENT_TTL, payload)
+            pipe.publish(self.channel, payload)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not publish progress for job {self.job_id}: {str(e)}")
+
+    def job_event(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Record this chunk's event and return the job-wide event summed over all chunks"""
+        payload = json.dumps(event)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.setex(self.chunk_key, PROGRESS_EVENT_TTL, payload)
+        pipe.hset(self.chunks_key, str(self.chunk), payload)
+        pipe.expire(self.chunks_key, PROGRESS_EVENT_TTL)
+        pipe.hvals(self.chunks_key)
+        chunks = [json.loads(value) for value in pipe.execute()[-1]]
+        
+        processed = sum(chunk['processed'] for chunk in chunks)
+        total = self.job_total or sum(chunk.get('total') or 0 for chunk in chunks) or None
+        throughput = sum(chunk.get('throughput') or 0 for chunk in chunks)
+        return {
+            'job_id': self.job_id,
+            'processed': processed,
+            'total': total,
+            'success': sum(chunk['success'] for chunk in chunks),
+            'errors': sum(chunk['errors'] for chunk in chunks),
+            'progress': min(100, int(processed / total * 100)) if total else None,
+            'throughput': round(throughput, 2),
+            'eta': int(max(0, total - processed) / throughput) if total and throughput > 0 else None,
+            'chunks': len(chunks)
+        }
+
+    def flush(self, store: bool = False):
+        """Publish the current counters, writing the job document at milestones"""
+        event = self.event()
+        status = f'Processed {self.processed}/{self.total} {self.label}' if self.total else f'Processed {self.processed} {self.label}'
+        self.task.update_state(state='PROGRESS', meta=dict(event, status=status))
+        self.publish(event)
+        
+        now = time.monotonic()
+        milestone = self._milestone()
+        store = (
+            store
+            or bool(self.pending_errors)
+            or milestone != self._stored_milestone
+            or now - self._stored_at >= PROGRESS_MILESTONE_INTERVAL
+        )
+        
+        if store:
+            self.store()
+            self._stored_at = now
+            self._stored_milestone = milestone
+        
+        self._flushed_at = now
+        self._flushed_processed = self.processed
+
+    def store(self):
+        """Write the counters and queued errors to the job document"""
+        if self.chunk is None:
+            fields = dict(
+                self.extra,
+                processed_records=self.processed,
+                success_count=self.success_count,
+                error_count=self.error_count
+            )
+            if self.percent is not None:
+                fields['progress'] = self.percent
+            update = {'$set': fields}
+        else:
+            fields = dict(
+                self.extra,
+                processed_records=self.processed,
+                success_count=self.success_count,
+                error_count=self.error_count
+            )
+            fields['errors_stored'] = self.errors_stored + len(self.pending_errors)
+            update = {'$set': {f'chunks.{self.chunk}.{key}': value for key, value in fields.items()}}
+        
+        if self.pending_errors:
+            update['$push'] = {'errors': {'$each': self.pending_errors}}
+        
+        if self.chunk is None:
+            self.collection.update_one({'_id': ObjectId(self.job_id)}, update)
+        else:
+            job = self.collection.find_one_and_update(
+                {'_id': ObjectId(self.job_id)}, update, {'chunks': 1}, return_document=ReturnDocument.AFTER
+            ) or {}
+            self.collection.update_one({'_id': ObjectId(self.job_id)}, {'$max': self.chunk_totals(job)})
+
+        self.errors_stored += len(self.pending_errors)
+        self.pending_errors = []
+
+    @staticmethod
+    def chunk_totals(job: Dict[str, Any]) -> Dict[str, int]:
+        """Job-level counters summed over the ``chunks.<n>`` counters of a chunked job"""
+        chunks = (job.get('chunks') or {}).values()
+        return {
+            field: sum(chunk.get(field, 0) for chunk in chunks)
+            for field in ['processed_records', 'success_count', 'error_count']
+        }
@@ -0,0 +1,226 @@
+import shopify
+import redis
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from config import (
+    redis_client, SHOPIFY_REST_RATE, SHOPIFY_REST_BURST, SHOPIFY_GRAPHQL_RATE,
+    SHOPIFY_GRAPHQL_BURST, SHOPIFY_GRAPHQL_QUERY_COST, SHOPIFY_MAX_RETRIES
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Thread-safe in-process token bucket mirroring Shopify's leaky bucket"""
+
+    def __init__(self, rate: float = SHOPIFY_REST_RATE, capacity: int = SHOPIFY_REST_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, cost: float = 1) -> float:
+        """Block until ``cost`` tokens are available and return the seconds waited"""
+        cost = min(cost, self.capacity)
+        waited = 0.0
+
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return waited
+                delay = (cost - self.tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+
+def throttle_delay(error: Exception, default: float = 2.0) -> Optional[float]:
+    """Seconds to back off if ``error`` is a Shopify 429 response, otherwise None"""
+    response = getattr(error, 'response', None)
+    if getattr(response, 'code', None) != 429:
+        return None
+
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After') or headers.get('retry-after') or default)
+    except (TypeError, ValueError):
+        return default
+
+
+ACQUIRE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at', 'rate', 'capacity')
+rate = tonumber(state[3]) or rate
+capacity = tonumber(state[4]) or capacity
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate) - cost
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now),
+    'rate', tostring(rate), 'capacity', tostring(capacity))
+redis.call('EXPIRE', KEYS[1], 3600)
+if tokens >= 0 then
+    return '0'
+end
+return tostring(-tokens / rate)
+"""
+
+SYNC_SCRIPT = """
+local available = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local rate = tonumber(ARGV[3])
+local refund = tonumber(ARGV[4])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate + refund, available)
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now),
+    'rate', tostring(rate), 'capacity', tostring(capacity))
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(tokens)
+"""
+
+BUCKETS = {
+    'rest': (SHOPIFY_REST_RATE, SHOPIFY_REST_BURST),
+    'graphql': (SHOPIFY_GRAPHQL_RATE, SHOPIFY_GRAPHQL_BURST),
+}
+
+REST_CALL_LIMIT_HEADER = 'x-shopify-shop-api-call-limit'
+
+
+class ShopRateLimiter:
+    """Per-shop token bucket stored in Redis and shared by every worker process
+
+    Callers reserve tokens up front (the bucket may go negative) and sleep off
+    any debt, so concurrent jobs for the same shop queue behind each other at
+    the refill rate instead of racing into 429s. The bucket is corrected from
+    REST call-limit headers and GraphQL throttleStatus after each response.
+    Falls back to an in-process bucket if Redis is unreachable.
+    """
+
+    def __init__(self, shop: str, bucket: str = 'rest', client=None,
+                 max_retries: int = SHOPIFY_MAX_RETRIES):
+        self.shop = shop
+        self.bucket = bucket
+        self.key = f"shopify_rate:{shop}:{bucket}"
+        self.rate, self.capacity = BUCKETS[bucket]
+        self.client = client or redis_client
+        self.max_retries = max_retries
+        self._acquire_script = self.client.register_script(ACQUIRE_SCRIPT)
+        self._sync_script = self.client.register_script(SYNC_SCRIPT)
+        self._fallback = TokenBucket(self.rate, self.capacity)
+
+    def acquire(self, cost: float = 1) -> float:
+        """Reserve ``cost`` tokens, sleeping while the shop's bucket is in debt"""
+        try:
+            delay = float(self._acquire_script(keys=[self.key], args=[self.rate, self.capacity, cost]))
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter Redis unavailable for {self.shop}, using local bucket: {str(e)}")
+            return self._fallback.acquire(cost)
+
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def sync(self, available: float, capacity: float, rate: float, refund: float = 0):
+        """Clamp the shared bucket to what Shopify reports as available"""
+        try:
+            self._sync_script(keys=[self.key], args=[available, capacity, rate, refund])
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter sync failed for {self.shop}: {str(e)}")
+
+    def observe_rest(self, headers: Dict[str, str]):
+        """Update from an ``X-Shopify-Shop-Api-Call-Limit: used/capacity`` header"""
+        value = next((v for k, v in (headers or {}).items() if k.lower() == REST_CALL_LIMIT_HEADER), None)
+        if not value:
+            return
+
+        try:
+            used, capacity = (float(part) for part in value.split('/'))
+        except ValueError:
+            return
+
+        # Shopify leaks REST buckets at capacity/20 per second (40 -> 2/s, 400 -> 20/s)
+        self.sync(capacity - used, capacity, capacity / 20)
+
+    def observe_graphql(self, extensions: Dict[str, Any], reserved: float = 0):
+        """Update from a GraphQL response's ``extensions.cost`` block"""
+        cost = (extensions or {}).get('cost') or {}
+        status = cost.get('throttleStatus')
+        if not status:
+            return
+
+        actual = cost.get('actualQueryCost')
+        refund = reserved - actual if actual is not None else 0
+        self.sync(
+            status['currentlyAvailable'],
+            status['maximumAvailable'],
+            status['restoreRate'],
+            max(refund, 0)
+        )
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run one REST call through the bucket, retrying on 429"""
+        attempt = 0
+        while True:
+            self.acquire(1)
+            try:
+                result = fn(*args, **kwargs)
+                self.observe_rest(self._last_response_headers())
+                return result
+            except Exception as e:
+                delay = throttle_delay(e)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logger.warning(f"Throttled on {self.shop}, retrying in {delay}s (attempt {attempt})")
+                self.sync(0, self.capacity, self.rate)
+                time.sleep(delay)
+
+    def graphql_call(self, execute: Callable[[str, Dict], Dict[str, Any]], query: str,
+                     variables: Dict = None, cost: float = SHOPIFY_GRAPHQL_QUERY_COST) -> Dict[str, Any]:
+        """Run one GraphQL request through the bucket, retrying on THROTTLED errors
+
+        ``execute`` returns the decoded response body (data, errors, extensions).
+        """
+        attempt = 0
+        while True:
+            self.acquire(cost)
+            result = execute(query, variables or {})
+            self.observe_graphql(result.get('extensions'), cost)
+
+            throttled = any(
+                (error.get('extensions') or {}).get('code') == 'THROTTLED'
+                for error in result.get('errors') or []
+            )
+            if not throttled or attempt >= self.max_retries:
+                return result
+
+            attempt += 1
+            status = ((result.get('extensions') or {}).get('cost') or {}).get('throttleStatus') or {}
+            delay = cost / (status.get('restoreRate') or self.rate)
+            logger.warning(f"GraphQL throttled on {self.shop}, retrying in {delay:.1f}s (attempt {attempt})")
+            time.sleep(delay)
+
+    @staticmethod
+    def _last_response_headers() -> Dict[str, str]:
+        try:
+            response = shopify.ShopifyResource.connection.response
+        except ValueError:
+            return {}
+        return getattr(response, 'headers', None) or {}
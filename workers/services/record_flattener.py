@@ -0,0 +1,175 @@
+from itertools import chain
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per-entity flat layouts: one row per ``explode`` child (parent values repeated),
+# ``join`` lists collapsed into one comma separated cell, dotted paths into objects
+FLATTEN_SCHEMAS = {
+    'products': {
+        'explode': 'variants',
+        'join': ['images', 'options'],
+        'columns': [
+            'id', 'title', 'handle', 'body_html', 'vendor', 'product_type', 'tags', 'status',
+            'published_at', 'created_at', 'updated_at', 'options.name', 'images.src',
+            'variants.id', 'variants.title', 'variants.sku', 'variants.barcode', 'variants.price',
+            'variants.compare_at_price', 'variants.inventory_quantity', 'variants.inventory_policy',
+            'variants.option1', 'variants.option2', 'variants.option3', 'variants.weight',
+            'variants.weight_unit', 'variants.requires_shipping', 'variants.taxable',
+        ],
+    },
+    'orders': {
+        'explode': 'line_items',
+        'join': ['discount_codes'],
+        'columns': [
+            'id', 'name', 'order_number', 'email', 'created_at', 'updated_at', 'currency',
+            'financial_status', 'fulfillment_status', 'subtotal_price', 'total_tax', 'total_discounts',
+            'total_price', 'discount_codes.code', 'tags', 'customer.id', 'customer.first_name',
+            'customer.last_name', 'shipping_address.address1', 'shipping_address.city',
+            'shipping_address.province', 'shipping_address.zip', 'shipping_address.country',
+            'line_items.id', 'line_items.product_id', 'line_items.variant_id', 'line_items.sku',
+            'line_items.title', 'line_items.variant_title', 'line_items.quantity', 'line_items.price',
+            'line_items.total_discount', 'line_items.fulfillment_status',
+        ],
+    },
+    'draft_orders': {
+        'explode': 'line_items',
+        'join': [],
+        'columns': [
+            'id', 'name', 'email', 'status', 'created_at', 'updated_at', 'currency', 'subtotal_price',
+            'total_tax', 'total_price', 'customer.id', 'line_items.id', 'line_items.product_id',
+            'line_items.variant_id', 'line_items.sku', 'line_items.title', 'line_items.quantity',
+            'line_items.price',
+        ],
+    },
+    'customers': {
+        'explode': 'addresses',
+        'join': [],
+        'columns': [
+            'id', 'email', 'first_name', 'last_name', 'phone', 'state', 'tags', 'orders_count',
+            'total_spent', 'verified_email', 'created_at', 'updated_at', 'addresses.id',
+            'addresses.default', 'addresses.company', 'addresses.address1', 'addresses.address2',
+            'addresses.city', 'addresses.province', 'addresses.zip', 'addresses.country',
+            'addresses.phone',
+        ],
+    },
+}
+
+ColumnSpec = Union[str, Tuple[str, Union[str, Sequence[str]]], Tuple[str, Union[str, Sequence[str]], Callable]]
+
+_EMPTY: Dict[str, Any] = {}
+_NO_CHILDREN = (_EMPTY,)
+
+
+def _join(items: Any, path: Tuple[str, ...]) -> str:
+    values = []
+    for item in items or ():
+        for key in path:
+            item = item.get(key) if isinstance(item, dict) else None
+        if item is not None and item != '':
+            values.append(str(item))
+    return ', '.join(values)
+
+
+def _lookup(source: str, path: Tuple[str, ...]) -> str:
+    expr = source
+    for key in path[:-1]:
+        expr = f"({expr}.get({key!r}) or _EMPTY)"
+    return f"{expr}.get({path[-1]!r})"
+
+
+class RecordFlattener:
+    """Flattens nested Shopify records into rows with a fixed column order
+
+    Each column is a label and a path into the record: ``'title'``,
+    ``'shipping_address.city'`` or ``'variants.sku'``. The layout is compiled
+    once into a single generated function, so flattening a record is one call
+    that reads each parent value once and builds a tuple per child row. A
+    record yields one row per item of its ``explode`` list (a single row with
+    blank child cells if the list is empty), and paths into ``join`` lists
+    collapse the list into one comma separated cell.
+    """
+
+    def __init__(self, columns: Iterable[ColumnSpec], explode: str = None, join: Iterable[str] = ()):
+        self.spec = [self._parse(column) for column in columns]
+        self.explode = explode
+        self.join = set(join)
+        self.columns = [label for label, _, _ in self.spec]
+        self.flatten = self._compile()
+
+    @classmethod
+    def for_entity(cls, entity: str, columns: List[str] = None) -> 'RecordFlattener':
+        """The entity's flat layout, limited to (or extended by) ``columns`` if given"""
+        schema = FLATTEN_SCHEMAS.get(entity)
+        if schema is None:
+            raise ValueError(f"Flattened exports are only supported for {', '.join(FLATTEN_SCHEMAS)}")
+        return cls(columns or schema['columns'], schema['explode'], schema['join'])
+
+    @property
+    def fields(self) -> List[str]:
+        """Top-level fields the layout reads, for projecting the fetch"""
+        return list(dict.fromkeys(path[0] for _, path, _ in self.spec))
+
+    def extend(self, keys: Iterable[str]) -> 'RecordFlattener':
+        """Copy of the layout with extra top-level columns, e.g. pivoted ``Metafield:`` keys"""
+        extra = [(key, (key,)) for key in keys if key not in self.columns]
+        if not extra:
+            return self
+        return RecordFlattener(self.spec + extra, self.explode, self.join)
+
+    def rows(self, records: Iterable[Dict[str, Any]]) -> List[tuple]:
+        return list(chain.from_iterable(map(self.flatten, records)))
+
+    def iter_rows(self, pages: Iterable[List[Dict[str, Any]]]) -> Iterator[tuple]:
+        for page in pages:
+            yield from self.rows(page)
+
+    def flatten_pages(self, pages: Iterable[List[Dict[str, Any]]]) -> Iterator[List[Dict[str, Any]]]:
+        """Pages of flat row dicts, for writers that take records"""
+        columns = self.columns
+        for page in pages:
+            yield [dict(zip(columns, row)) for row in self.rows(page)]
+
+    @staticmethod
+    def _parse(column: ColumnSpec) -> Tuple[str, Tuple[str, ...], Callable]:
+        if isinstance(column, str):
+            return column, tuple(column.split('.')), None
+        label, path, *transform = column
+        path = tuple(path.split('.')) if isinstance(path, str) else tuple(path)
+        return label, path, transform[0] if transform else None
+
+    def _compile(self) -> Callable[[Dict[str, Any]], List[tuple]]:
+        namespace = {'_EMPTY': _EMPTY, '_NO_CHILDREN': _NO_CHILDREN, '_join': _join}
+        lines = ['def flatten(record):']
+        cells = []
+        explodes = False
+
+        for index, (label, path, transform) in enumerate(self.spec):
+            root, rest = path[0], path[1:]
+            is_child = bool(rest) and root == self.explode
+            if is_child:
+                expr = _lookup('child', rest)
+                explodes = True
+            elif rest and root in self.join:
+                expr = f"_join(record.get({root!r}), {rest!r})"
+            else:
+                expr = _lookup('record', path)
+            if transform is not None:
+                namespace[f'_t{index}'] = transform
+                expr = f"_t{index}({expr})"
+
+            if is_child:
+                cells.append(expr)
+            else:
+                lines.append(f"    c{index} = {expr}")
+                cells.append(f"c{index}")
+
+        row = f"({', '.join(cells)},)" if cells else '()'
+        if explodes:
+            lines.append(f"    return [{row} for child in record.get({self.explode!r}) or _NO_CHILDREN]")
+        else:
+            lines.append(f"    return [{row}]")
+
+        exec('\n'.join(lines), namespace)
+        return namespace['flatten']
@@ -0,0 +1,351 @@
+import io
+import tempfile
+import threading
+import zlib
+from typing import List, Dict, Any
+import zstandard
+from config import S3_MULTIPART_PART_SIZE, S3_DOWNLOAD_CHUNK_SIZE, EXPORT_GZIP_LEVEL, EXPORT_ZSTD_LEVEL
+import logging
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIONS = {
+    'gzip': {'extension': 'gz', 'content_type': 'application/gzip'},
+    'zstd': {'extension': 'zst', 'content_type': 'application/zstd'},
+}
+
+COMPRESSION_MODES = ['file', 'transfer']
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """Writable file object that uploads to S3 in multipart chunks as they fill
+
+    Only one part is buffered at a time, so memory stays flat regardless of the
+    object size. Objects smaller than a single part fall back to put_object.
+    """
+
+    def __init__(self, client, bucket: str, key: str, content_type: str,
+                 part_size: int = S3_MULTIPART_PART_SIZE, **extra_args):
+        super().__init__()
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_size = part_size
+        self.extra_args = extra_args
+        self.upload_id = None
+        self.parts: List[Dict[str, Any]] = []
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._aborted = False
+        self.stash_key = None
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed S3MultipartWriter")
+
+        self._buffer.extend(data)
+        self.bytes_written += len(data)
+
+        while len(self._buffer) >= self.part_size:
+            chunk = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._upload_part(chunk)
+
+        return len(data)
+
+    def _upload_part(self, chunk: bytes):
+        if self.upload_id is None:
+            response = self.client.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                ContentType=self.content_type,
+                **self.extra_args
+            )
+            self.upload_id = response['UploadId']
+
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=chunk
+        )
+        self.parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            if not self._aborted:
+                if self.upload_id is None:
+                    self.client.put_object(
+                        Bucket=self.bucket,
+                        Key=self.key,
+                        Body=bytes(self._buffer),
+                        ContentType=self.content_type,
+                        **self.extra_args
+                    )
+                else:
+                    if self._buffer:
+                        self._upload_part(bytes(self._buffer))
+                    self.client.complete_multipart_upload(
+                        Bucket=self.bucket,
+                        Key=self.key,
+                        UploadId=self.upload_id,
+                        MultipartUpload={'Parts': self.parts}
+                    )
+                self._buffer.clear()
+                self._discard_stash()
+        finally:
+            super().close()
+
+    def checkpoint(self, stash_key: str) -> Dict[str, Any]:
+        """Persist the unsent buffer to ``stash_key`` and return the state needed to resume
+
+        Parts already uploaded stay attached to the open multipart upload;
+        the tail smaller than a part is stored as its own object.
+        """
+        self.client.put_object(Bucket=self.bucket, Key=stash_key, Body=bytes(self._buffer))
+        self.stash_key = stash_key
+        return {
+            'upload_id': self.upload_id,
+            'parts': list(self.parts),
+            'bytes_written': self.bytes_written,
+            'stash_key': stash_key
+        }
+
+    @classmethod
+    def resume(cls, client, bucket: str, key: str, content_type: str, state: Dict[str, Any],
+               part_size: int = S3_MULTIPART_PART_SIZE, **extra_args) -> 'S3MultipartWriter':
+        """Reopen a writer from a ``checkpoint`` state"""
+        writer = cls(client, bucket, key, content_type, part_size, **extra_args)
+        writer.upload_id = state.get('upload_id')
+        writer.parts = list(state.get('parts') or [])
+        writer.bytes_written = state.get('bytes_written', 0)
+        writer.stash_key = state.get('stash_key')
+        
+        if writer.stash_key:
+            body = client.get_object(Bucket=bucket, Key=writer.stash_key)['Body'].read()
+            writer._buffer.extend(body)
+        return writer
+
+    def detach(self):
+        """Close without completing or aborting, leaving the upload for a resumed writer"""
+        self._aborted = True
+        self._buffer.clear()
+        super().close()
+
+    def _discard_stash(self):
+        if self.stash_key:
+            try:
+                self.client.delete_object(Bucket=self.bucket, Key=self.stash_key)
+            except Exception as e:
+                logger.error(f"Error removing checkpoint stash {self.stash_key}: {str(e)}")
+
+    def abort(self):
+        """Discard everything written so far"""
+        self._aborted = True
+        self._buffer.clear()
+
+        if self.upload_id is not None:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            except Exception as e:
+                logger.error(f"Error aborting multipart upload {self.key}: {str(e)}")
+
+        self._discard_stash()
+        super().close()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+
+class CompressedWriter(io.RawIOBase):
+    """Writable wrapper that gzip- or zstd-compresses into another writer as data arrives
+
+    Compression happens in the same pass as the write, so no uncompressed copy
+    is kept. ``checkpoint`` ends the current gzip member / zstd frame before
+    checkpointing the inner writer: concatenated members decode as one stream,
+    so a resumed export just starts a new one.
+    """
+
+    def __init__(self, inner, compression: str):
+        super().__init__()
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unsupported compression: {compression}")
+        self.inner = inner
+        self.compression = compression
+        self._compressor = None
+        self._started = False
+
+    @property
+    def key(self) -> str:
+        return self.inner.key
+
+    def writable(self) -> bool:
+        return True
+
+    def _new_compressor(self):
+        if self.compression == 'gzip':
+            return zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return zstandard.ZstdCompressor(level=EXPORT_ZSTD_LEVEL).compressobj()
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed CompressedWriter")
+        if self._compressor is None:
+            self._compressor = self._new_compressor()
+            self._started = True
+
+        compressed = self._compressor.compress(data)
+        if compressed:
+            self.inner.write(compressed)
+        return len(data)
+
+    def _finish_member(self):
+        if self._compressor is not None:
+            self.inner.write(self._compressor.flush())
+            self._compressor = None
+
+    def checkpoint(self, stash_key: str) -> Dict[str, Any]:
+        self._finish_member()
+        return self.inner.checkpoint(stash_key)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if not self._started:
+                # An empty export is still a valid (empty) compressed file
+                self._compressor = self._new_compressor()
+            self._finish_member()
+            self.inner.close()
+        finally:
+            super().close()
+
+    def detach(self):
+        self.inner.detach()
+        super().close()
+
+    def abort(self):
+        self.inner.abort()
+        super().close()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def export_upload(content_type: str, compression: str = None, mode: str = 'file') -> Dict[str, Any]:
+    """S3 upload settings for an export file, optionally compressed
+
+    ``file`` mode stores a .gz/.zst file with the compressor's content type.
+    ``transfer`` mode keeps the original name and content type and sets
+    ContentEncoding, so browsers and HTTP clients decompress the download
+    transparently.
+    """
+    if not compression:
+        return {'content_type': content_type, 'extra_args': {}, 'compression': None, 'suffix': ''}
+    if compression not in COMPRESSIONS or mode not in COMPRESSION_MODES:
+        raise ValueError(f"Unsupported compression: {compression} ({mode})")
+
+    if mode == 'transfer':
+        return {
+            'content_type': content_type,
+            'extra_args': {'ContentEncoding': compression},
+            'compression': compression,
+            'suffix': ''
+        }
+    return {
+        'content_type': COMPRESSIONS[compression]['content_type'],
+        'extra_args': {},
+        'compression': compression,
+        'suffix': f".{COMPRESSIONS[compression]['extension']}"
+    }
+
+
+def open_upload(client, bucket: str, key: str, upload: Dict[str, Any], state: Dict[str, Any] = None):
+    """Multipart writer for ``upload`` settings, resumed from ``state`` if given and compressing if configured"""
+    if state:
+        writer = S3MultipartWriter.resume(client, bucket, key, upload['content_type'], state, **upload['extra_args'])
+    else:
+        writer = S3MultipartWriter(client, bucket, key, upload['content_type'], **upload['extra_args'])
+    return CompressedWriter(writer, upload['compression']) if upload['compression'] else writer
+
+class S3DownloadSpool(io.RawIOBase):
+    """Readable file object over an S3 body that downloads ahead into a temp file
+
+    A background thread drains the body to disk at network speed while the
+    reader consumes it at its own pace, so parsing can start on the first
+    bytes without holding the object in memory or leaving the S3 connection
+    idle while a slow import works through the rows already read.
+    """
+
+    def __init__(self, body, chunk_size: int = S3_DOWNLOAD_CHUNK_SIZE):
+        super().__init__()
+        self._file = tempfile.TemporaryFile()
+        self._written = 0
+        self._position = 0
+        self._done = False
+        self._error = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._download, args=(body, chunk_size), daemon=True)
+        self._thread.start()
+
+    def _download(self, body, chunk_size: int):
+        try:
+            for chunk in iter(lambda: body.read(chunk_size), b''):
+                with self._condition:
+                    if self.closed:
+                        return
+                    self._file.seek(self._written)
+                    self._file.write(chunk)
+                    self._written += len(chunk)
+                    self._condition.notify_all()
+        except Exception as e:
+            with self._condition:
+                self._error = e
+        finally:
+            body.close()
+            with self._condition:
+                self._done = True
+                self._condition.notify_all()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        with self._condition:
+            while self._position >= self._written and not self._done:
+                self._condition.wait()
+            if self._error is not None:
+                raise self._error
+            
+            available = min(len(buffer), self._written - self._position)
+            if available <= 0:
+                return 0
+            self._file.seek(self._position)
+            read = self._file.readinto(memoryview(buffer)[:available])
+            self._position += read
+            return read
+
+    def close(self):
+        with self._condition:
+            if not self.closed:
+                super().close()
+                self._file.close()
@@ -1,12 +1,14 @@
 import shopify
-from typing import List, Dict, Any, Optional
+from typing import Iterator, List, Dict, Any, Optional
 from config import SHOPIFY_API_VERSION
+from services.rate_limiter import ShopRateLimiter
 
 class ShopifyService:
     def __init__(self, shop: str, access_token: str):
         self.shop = shop
         self.access_token = access_token
         self.session = None
+        self.rate_limiter = ShopRateLimiter(shop, 'rest')
         
     def __enter__(self):
         self.session = shopify.Session(self.shop, SHOPIFY_API_VERSION, self.access_token)
@@ -15,96 +17,57 @@ class ShopifyService:
         
     def __exit__(self, exc_type, exc_val, exc_tb):
         shopify.ShopifyResource.clear_session()
+
+    def call(self, fn, *args, **kwargs):
+        """Run a REST call through the shop's shared rate limiter"""
+        return self.rate_limiter.call(fn, *args, **kwargs)
         
-    def get_products(self, limit: int = 250) -> List[Dict[str, Any]]:
-        products = []
-        page_info = None
+    def iter_pages(self, resource_class, limit: int = 250, **params) -> Iterator[List[Dict[str, Any]]]:
+        """Yield one page of records at a time, following each page's Link header cursor"""
+        batch = self.call(resource_class.find, limit=limit, **params)
         
-        while True:
-            if page_info:
-                batch = shopify.Product.find(limit=limit, page_info=page_info)
-            else:
-                batch = shopify.Product.find(limit=limit)
-                
-            if not batch:
-                break
-                
-            for product in batch:
-                products.append(product.to_dict())
-                
-            if not hasattr(shopify.Product, 'next_page_info') or not shopify.Product.next_page_info:
+        while batch:
+            yield [item.to_dict() for item in batch]
+            
+            if not (hasattr(batch, 'has_next_page') and batch.has_next_page()):
                 break
                 
-            page_info = shopify.Product.next_page_info
-            
-        return products
+            batch = self.call(batch.next_page, no_cache=True)
         
-    def get_customers(self, limit: int = 250) -> List[Dict[str, Any]]:
-        customers = []
-        page_info = None
+    def iter_products(self, limit: int = 250) -> Iterator[List[Dict[str, Any]]]:
+        return self.iter_pages(shopify.Product, limit)
         
-        while True:
-            if page_info:
-                batch = shopify.Customer.find(limit=limit, page_info=page_info)
-            else:
-                batch = shopify.Customer.find(limit=limit)
-                
-            if not batch:
-                break
-                
-            for customer in batch:
-                customers.append(customer.to_dict())
-                
-            if not hasattr(shopify.Customer, 'next_page_info') or not shopify.Customer.next_page_info:
-                break
-                
-            page_info = shopify.Customer.next_page_info
-            
-        return customers
+    def iter_customers(self, limit: int = 250) -> Iterator[List[Dict[str, Any]]]:
+        return self.iter_pages(shopify.Customer, limit)
         
-    def get_orders(self, limit: int = 250, status: str = 'any') -> List[Dict[str, Any]]:
-        orders = []
-        page_info = None
+    def iter_orders(self, limit: int = 250, status: str = 'any') -> Iterator[List[Dict[str, Any]]]:
+        return self.iter_pages(shopify.Order, limit, status=status)
         
-        while True:
-            if page_info:
-                batch = shopify.Order.find(limit=limit, status=status, page_info=page_info)
-            else:
-                batch = shopify.Order.find(limit=limit, status=status)
-                
-            if not batch:
-                break
-                
-            for order in batch:
-                orders.append(order.to_dict())
-                
-            if not hasattr(shopify.Order, 'next_page_info') or not shopify.Order.next_page_info:
-                break
-                
-            page_info = shopify.Order.next_page_info
-            
-        return orders
+    def get_products(self, limit: int = 250) -> List[Dict[str, Any]]:
+        return [product for page in self.iter_products(limit) for product in page]
+        
+    def get_customers(self, limit: int = 250) -> List[Dict[str, Any]]:
+        return [customer for page in self.iter_customers(limit) for customer in page]
+        
+    def get_orders(self, limit: int = 250, status: str = 'any') -> List[Dict[str, Any]]:
+        return [order for page in self.iter_orders(limit, status) for order in page]
         
     def create_product(self, product_data: Dict[str, Any]) -> Dict[str, Any]:
         product = shopify.Product(product_data)
-        product.save()
+        self.call(product.save)
         return product.to_dict()
         
     def update_product(self, product_id: int, product_data: Dict[str, Any]) -> Dict[str, Any]:
-        product = shopify.Product.find(product_id)
-        for key, value in product_data.items():
-            setattr(product, key, value)
-        product.save()
+        product = shopify.Product(dict(product_data, id=product_id))
+        self.call(product.save)
         return product.to_dict()
         
     def create_customer(self, customer_data: Dict[str, Any]) -> Dict[str, Any]:
         customer = shopify.Customer(customer_data)
-        customer.save()
+        self.call(customer.save)
         return customer.to_dict()
         
     def update_customer(self, customer_id: int, customer_data: Dict[str, Any]) -> Dict[str, Any]:
-        customer = shopify.Customer.find(customer_id)
-        for key, value in customer_data.items():
-            setattr(customer, key, value)
-        customer.save()
+        customer = shopify.Customer(dict(customer_data, id=customer_id))
+        self.call(customer.save)
         return customer.to_dict()
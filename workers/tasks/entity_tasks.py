@@ -1,9 +1,35 @@
+from celery import chord, group
 from celery_app import app
-from config import mongodb, s3_client, S3_BUCKET
+from config import (
+    mongodb, s3_client, S3_BUCKET, BULK_EXPORT_THRESHOLD, BULK_IMPORT_THRESHOLD, IMPORT_CONCURRENCY,
+    IMPORT_READ_BATCH_ROWS, IMPORT_CHUNK_ROWS, IMPORT_CHUNK_THRESHOLD, JOB_ERROR_LIMIT, EXPORT_ENTITY_CONCURRENCY,
+    S3_DOWNLOAD_CHUNK_SIZE
+)
 from services.entity_service import EntityService
+from services.bulk_operation_service import BulkOperationService, BULK_MUTATIONS
+from services.import_service import ImportService
+from services.s3_stream import S3MultipartWriter, S3DownloadSpool, export_upload, open_upload
+from services.concurrent_executor import ConcurrentExecutor
+from services.metafield_batcher import MetafieldBatcher, OWNER_TYPES as METAFIELD_OWNER_TYPES
+from services.watermark_service import WatermarkService
+from services.mirror_service import MirrorService
+from services.export_checkpoint import ExportCheckpoint
+from services.import_checkpoint import ImportCheckpoint
+from services.progress_reporter import ProgressReporter
 from services.file_processor import FileProcessor
+from services.columnar_writer import ColumnarWriter, COLUMNAR_FORMATS
+from tasks.mirror_tasks import mirror_load
+from services.record_flattener import RecordFlattener, FLATTEN_SCHEMAS
 from bson import ObjectId
+from celery.exceptions import SoftTimeLimitExceeded
 from datetime import datetime
+from collections import Counter
+from contextlib import ExitStack, closing, contextmanager
+from itertools import chain, islice
+import io
+import shutil
+import tempfile
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,6 +54,301 @@ ENTITY_METHODS = {
     'inventory': 'get_inventory_levels'
 }
 
+METAFIELD_ENTITIES = ['products', 'customers']
+
+INCREMENTAL_ENTITIES = ['products', 'customers', 'orders']
+INCREMENTAL_MODES = ['merge', 'delta']
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet',
+    'feather': 'application/vnd.apache.arrow.file'
+}
+
+# format_type -> file extension for export_entity; anything else exports CSV
+EXPORT_FORMATS = {
+    'xlsx': 'xlsx',
+    'parquet': 'parquet',
+    'feather': 'feather',
+    'arrow': 'feather'
+}
+
+def needs_record_count(entity: str, params: dict, filters: dict) -> bool:
+    """Whether picking the export strategy depends on the entity's record count"""
+    strategy = (params or {}).get('export_strategy', 'auto')
+    return strategy not in ('rest', 'bulk') and BulkOperationService.supports(entity, filters)
+
+def should_use_bulk_export(entity_service: EntityService, entity: str, params: dict, filters: dict,
+                           record_count: int = None) -> bool:
+    """Pick the GraphQL bulk strategy explicitly, for metafield exports or when the entity is large
+
+    Pass ``record_count`` when it is already known to save the count request.
+    """
+    strategy = (params or {}).get('export_strategy', 'auto')
+    
+    if strategy == 'rest' or not BulkOperationService.supports(entity, filters):
+        return False
+    if strategy == 'bulk':
+        return True
+    if (params or {}).get('include_metafields') and entity in METAFIELD_ENTITIES:
+        # The bulk query nests each owner's metafields; REST pages need a GraphQL pass of their own
+        return True
+    
+    if record_count is None:
+        record_count = entity_service.count_records(entity, filters)
+    return record_count >= BULK_EXPORT_THRESHOLD
+
+def export_projection(params: dict, incremental: str = None):
+    """Output columns and fields to fetch for ``params['columns']``, or (None, None) for whole records
+
+    ``id`` is always fetched (metafields and merges key on it) and
+    incremental exports also fetch ``updated_at`` for their watermark.
+    """
+    columns = params.get('columns')
+    if isinstance(columns, str):
+        columns = columns.split(',')
+    columns = [column.strip() for column in columns or [] if column and column.strip()]
+    if not columns:
+        return None, None
+    
+    if incremental and 'id' not in columns:
+        columns.insert(0, 'id')
+    fields = list(dict.fromkeys(['id'] + columns + (['updated_at'] if incremental else [])))
+    return columns, fields
+
+def with_metafield_columns(columns, records: list):
+    """Append the pivoted ``Metafield:`` columns present in ``records`` to a projection"""
+    if not columns:
+        return columns
+    metafield_columns = dict.fromkeys(key for record in records for key in record if key.startswith('Metafield:'))
+    return columns + [column for column in metafield_columns if column not in columns]
+
+@contextmanager
+def spool_metafield_pages(pages, columns: list = None):
+    """Spill pages to a temp file and yield (columns, pages) with every ``Metafield:`` column
+
+    Owners carry different metafields, so a streamed header is only complete
+    after the last page; the records wait on disk rather than in memory.
+    """
+    keys = {}
+    
+    def collect(pages):
+        for page in pages:
+            for record in page:
+                keys.update(dict.fromkeys(record))
+            yield page
+    
+    with tempfile.TemporaryFile() as spill:
+        FileProcessor.spill_records(collect(pages), spill)
+        columns = columns or [key for key in keys if not key.startswith('Metafield:')]
+        yield with_metafield_columns(columns, [keys]), FileProcessor.iter_batches(FileProcessor.iter_spilled_records(spill))
+
+def with_owner_metafields(entity_service: EntityService, entity: str, pages):
+    """Pivot each REST page's metafields onto its records as the page streams past"""
+    for page in pages:
+        if page:
+            FileProcessor.pivot_metafields(page, entity_service.get_owner_metafields(entity, [record['id'] for record in page]))
+        yield page
+
+def export_flattener(entity: str, params: dict, columns: list, fields: list, incremental: str = None):
+    """Flat layout for ``params['flatten']`` exports plus the columns and fields it implies"""
+    if not params.get('flatten'):
+        return None, columns, fields
+    if incremental:
+        raise ValueError("Flattened exports cannot be incremental")
+    
+    flattener = RecordFlattener.for_entity(entity, columns)
+    return flattener, flattener.columns, list(dict.fromkeys(['id'] + flattener.fields))
+
+def flat_pages(flattener: RecordFlattener, pages):
+    """Pages as flat row dicts for writers that take records, unchanged without a flattener"""
+    return pages if flattener is None else flattener.flatten_pages(pages)
+
+def iter_export_pages(entity_service: EntityService, shop: str, access_token: str, entity: str,
+                      filters: dict, include_metafields: bool, use_bulk: bool, fields: list = None,
+                      strict: bool = False):
+    """Page iterator for the streaming export path, or None if the entity needs the buffered path
+
+    With ``strict`` a failed page request raises instead of ending the export early.
+    Metafields come nested in the bulk query; REST pages fetch theirs page by page.
+    """
+    if use_bulk:
+        bulk_service = BulkOperationService(shop, access_token)
+        return FileProcessor.iter_batches(bulk_service.iter_records(entity, filters, include_metafields, fields))
+    
+    resource = entity_service.paginated_resource(entity, filters, fields)
+    if resource is None:
+        return None
+    
+    resource_class, resource_params = resource
+    pages = entity_service.iter_pages(resource_class, resource_params, strict=strict)
+    if include_metafields and entity in METAFIELD_ENTITIES:
+        pages = with_owner_metafields(entity_service, entity, pages)
+    return pages
+
+def track_pages(progress: ProgressReporter, pages):
+    """Pass pages through while counting exported records"""
+    for page in pages:
+        progress.advance(len(page))
+        yield page
+
+def is_resumable_export(entity_service: EntityService, entity: str, params: dict, filters: dict,
+                        file_ext: str, include_metafields: bool, record_count: int = None) -> bool:
+    """Streaming CSV exports over REST pagination can checkpoint their cursor"""
+    if file_ext != 'csv' or not params.get('streaming', True) or not params.get('resumable', True):
+        return False
+    if params.get('source') == 'mirror' or (include_metafields and entity in METAFIELD_ENTITIES):
+        return False
+    if entity_service.paginated_resource(entity, filters) is None:
+        return False
+    
+    return not should_use_bulk_export(entity_service, entity, params, filters, record_count)
+
+def run_checkpointed_csv_export(progress: ProgressReporter, entity_service: EntityService, entity: str, filters: dict,
+                                s3_key: str, upload: dict, checkpoint: ExportCheckpoint, columns: list = None,
+                                fields: list = None, flattener: RecordFlattener = None):
+    """Stream a REST export to S3, checkpointing as it goes
+
+    Returns the record count, or None if the export stopped at its time
+    budget (or hit the soft time limit) and must be continued by a new task.
+    """
+    resource_class, resource_params = entity_service.paginated_resource(entity, filters, fields)
+    cursor_pages = entity_service.iter_page_cursors(resource_class, resource_params, strict=True, start_from=checkpoint.cursor)
+    
+    if checkpoint.resuming:
+        writer = open_upload(s3_client, S3_BUCKET, s3_key, upload, checkpoint.state['upload'])
+        columns = checkpoint.state['columns']
+    else:
+        writer = open_upload(s3_client, S3_BUCKET, s3_key, upload)
+        first = next(cursor_pages, None)
+        if not columns:
+            columns = list(dict.fromkeys(key for row in first[0] for key in row)) if first else None
+        cursor_pages = chain([first], cursor_pages) if first else iter(())
+        checkpoint.state.update(s3_key=s3_key, columns=columns)
+    
+    pages = track_pages(progress, checkpoint.pages(cursor_pages, writer))
+    try:
+        FileProcessor.write_csv_stream(pages, writer, columns, header=not checkpoint.resuming, flattener=flattener)
+    except SoftTimeLimitExceeded:
+        if not checkpoint.saved:
+            writer.abort()
+            raise
+        # Parts uploaded after the last checkpoint are re-sent by the continuation
+        writer.detach()
+        return None
+    except Exception:
+        writer.abort()
+        raise
+    
+    if checkpoint.handed_off:
+        writer.detach()
+        return None
+    
+    writer.close()
+    return checkpoint.records
+
+def iter_mirror_pages(shop: str, access_token: str, entity: str, filters: dict, include_metafields: bool,
+                      fields: list = None):
+    """Page iterator served from the MongoDB mirror, or None if the mirror cannot answer
+
+    The first mirror export of a shop and entity queues the initial
+    ``mirror_load``; exports fall back to Shopify until it is ready.
+    """
+    mirror = MirrorService(shop)
+    if mirror.supports(entity) and mirror.claim_load(entity):
+        logger.info(f"Queueing initial mirror load of {entity} for {shop}")
+        mirror_load.apply_async(args=[shop, access_token, [entity]])
+    
+    if (include_metafields and entity in METAFIELD_ENTITIES) or not mirror.can_serve(entity, filters):
+        logger.info(f"Mirror cannot serve {entity} export for {shop}, fetching from Shopify")
+        return None
+    
+    return mirror.iter_pages(entity, filters, fields=fields)
+
+def fetch_export_records(entity_service: EntityService, shop: str, access_token: str, entity: str,
+                         filters: dict, include_metafields: bool, use_bulk: bool, fields: list = None,
+                         strict: bool = False) -> list:
+    """Fetch a whole entity into memory for exports that cannot stream
+
+    With ``strict`` paginated entities raise on a failed page instead of returning what was fetched.
+    """
+    if use_bulk:
+        bulk_service = BulkOperationService(shop, access_token)
+        return list(bulk_service.iter_records(entity, filters, include_metafields, fields))
+    
+    method_name = ENTITY_METHODS[entity]
+    method = getattr(entity_service, method_name)
+    resource = entity_service.paginated_resource(entity, filters, fields) if fields or strict else None
+    if resource is not None:
+        data = entity_service.fetch_paginated(*resource, strict=strict)
+    elif method_name in ['get_products', 'get_customers', 'get_orders', 'get_custom_collections', 'get_smart_collections']:
+        data = method(filters)
+    else:
+        data = method()
+    
+    if entity in METAFIELD_ENTITIES and include_metafields:
+        metafields = entity_service.get_owner_metafields(entity, [record['id'] for record in data])
+        FileProcessor.pivot_metafields(data, metafields)
+    
+    return data
+
+def snapshot_exists(s3_key: str) -> bool:
+    try:
+        s3_client.head_object(Bucket=S3_BUCKET, Key=s3_key)
+        return True
+    except Exception as e:
+        logger.warning(f"Incremental snapshot {s3_key} unavailable, running a full export: {str(e)}")
+        return False
+
+def run_incremental_export(progress: ProgressReporter, entity_service: EntityService, shop: str, access_token: str, entity: str,
+                           params: dict, filters: dict, mode: str, s3_key: str, content_type: str,
+                           columns: list = None, fields: list = None) -> int:
+    """Export records changed since the shop's watermark, merged into the last snapshot for mode='merge'
+
+    The first run for a shop/entity/filter combination (or ``full_refresh``)
+    exports everything and sets the baseline. Pages are fetched strictly:
+    a failed request fails the export before the watermark moves, so
+    changes that were never fetched are not skipped by later runs.
+    """
+    watermark = WatermarkService(shop, entity, dict(filters or {}, columns=columns) if columns else filters, mode)
+    previous = None if params.get('full_refresh') else watermark.load()
+    if previous and mode == 'merge' and not snapshot_exists(previous['snapshot_key']):
+        previous = None
+    
+    fetch_filters = dict(filters or {})
+    if previous:
+        fetch_filters['updated_at_min'] = previous['updated_at']
+    
+    include_metafields = bool(params.get('include_metafields'))
+    use_bulk = should_use_bulk_export(entity_service, entity, params, fetch_filters)
+    pages = iter_export_pages(
+        entity_service, shop, access_token, entity, fetch_filters, include_metafields, use_bulk, fields, strict=True
+    )
+    if pages is None:
+        data = fetch_export_records(
+            entity_service, shop, access_token, entity, fetch_filters, include_metafields, use_bulk, fields, strict=True
+        )
+        columns = with_metafield_columns(columns, data)
+        pages = [data]
+    pages = watermark.track(track_pages(progress, pages))
+    
+    with S3MultipartWriter(s3_client, S3_BUCKET, s3_key, content_type) as writer:
+        if previous and mode == 'merge':
+            changes = [record for page in pages for record in page]
+            logger.info(f"Merging {len(changes)} changed {entity} into {previous['snapshot_key']}")
+            snapshot = s3_client.get_object(Bucket=S3_BUCKET, Key=previous['snapshot_key'])['Body']
+            columns, merged = FileProcessor.merge_csv_snapshot(snapshot, changes)
+            total_records = FileProcessor.write_csv_stream(merged, writer, columns)
+        elif include_metafields and entity in METAFIELD_ENTITIES:
+            with spool_metafield_pages(pages, columns) as (columns, pages):
+                total_records = FileProcessor.write_csv_stream(pages, writer, columns)
+        else:
+            total_records = FileProcessor.write_csv_stream(pages, writer, columns)
+    
+    watermark.save(s3_key, total_records)
+    return total_records
+
 @app.task(bind=True, name='tasks.export_entity')
 def export_entity(self, job_id: str, shop: str, access_token: str, entity: str, params: dict, filters: dict, format_type: str = 'csv'):
     """Universal export task for all entities"""
@@ -40,51 +361,110 @@ def export_entity(self, job_id: str, shop: str, access_token: str, entity: str,
         if entity not in ENTITY_METHODS:
             raise ValueError(f"Unsupported entity: {entity}")
         
-        with EntityService(shop, access_token) as entity_service:
-            self.update_state(state='PROGRESS', meta={'status': f'Fetching {entity} from Shopify'})
-            
-            method_name = ENTITY_METHODS[entity]
-            method = getattr(entity_service, method_name)
-            
-            if method_name in ['get_products', 'get_customers', 'get_orders', 'get_custom_collections', 'get_smart_collections']:
-                data = method(filters)
-            else:
-                data = method()
-            
-            self.update_state(state='PROGRESS', meta={'status': f'Processing {len(data)} {entity}'})
-            
-            if entity == 'products' and params.get('include_metafields'):
-                for product in data:
-                    metafields = entity_service.get_metafields('products', product['id'])
-                    for mf in metafields:
-                        product[f"Metafield:{mf['namespace']}[{mf['key']}]"] = mf['value']
-            
-            if entity == 'customers' and params.get('include_metafields'):
-                for customer in data:
-                    metafields = entity_service.get_metafields('customers', customer['id'])
-                    for mf in metafields:
-                        customer[f"Metafield:{mf['namespace']}[{mf['key']}]"] = mf['value']
+        file_ext = EXPORT_FORMATS.get(format_type, 'csv')
+        compression = params.get('compression')
+        if compression and (file_ext != 'csv' or params.get('incremental')):
+            raise ValueError("Compression is only supported for full CSV exports")
+        upload = export_upload(CONTENT_TYPES[file_ext], compression, params.get('compression_mode', 'file'))
+        content_type = upload['content_type']
+        checkpoint = ExportCheckpoint.load(job_id)
+        filename = checkpoint.state.get('filename') or f"{entity}_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{file_ext}{upload['suffix']}"
+        s3_key = f"exports/{shop}/{filename}"
+        checkpoint.state['filename'] = filename
+        include_metafields = bool(params.get('include_metafields'))
+        incremental = params.get('incremental')
+        columns, fields = export_projection(params, incremental)
+        flattener, columns, fields = export_flattener(entity, params, columns, fields, incremental)
+        
+        if incremental and (incremental not in INCREMENTAL_MODES or entity not in INCREMENTAL_ENTITIES or file_ext != 'csv'):
+            raise ValueError(f"Incremental {incremental} exports are only supported for {', '.join(INCREMENTAL_ENTITIES)} as CSV")
+        
+        with EntityService(shop, access_token) as entity_service, \
+                ProgressReporter(self, job_id, processed=checkpoint.records, label=entity) as progress:
+            progress.stage(f'Fetching {entity} from Shopify')
             
-            self.update_state(state='PROGRESS', meta={'status': f'Generating {format_type.upper()} file'})
+            # Counted once here, both to pick the strategy and to report progress out of a total
+            record_count = None
+            if not incremental and not checkpoint.resuming and params.get('source') != 'mirror' \
+                    and needs_record_count(entity, params, filters):
+                record_count = entity_service.count_records(entity, filters)
+                progress.total = record_count or None
             
-            if format_type == 'xlsx':
-                file_content = FileProcessor.write_excel(data)
-                content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                file_ext = 'xlsx'
+            if incremental:
+                total_records = run_incremental_export(
+                    progress, entity_service, shop, access_token, entity, params, filters, incremental, s3_key, content_type,
+                    columns, fields
+                )
+            elif checkpoint.resuming or is_resumable_export(
+                    entity_service, entity, params, filters, file_ext, include_metafields, record_count):
+                total_records = run_checkpointed_csv_export(
+                    progress, entity_service, entity, filters, s3_key, upload, checkpoint, columns, fields, flattener
+                )
+                
+                if total_records is None:
+                    mongodb.jobs.update_one({'_id': ObjectId(job_id)}, {'$inc': {'continuations': 1}})
+                    export_entity.apply_async(args=[job_id, shop, access_token, entity, params, filters, format_type])
+                    return {'status': 'continued', 'records': checkpoint.records}
             else:
-                file_content = FileProcessor.write_csv(data)
-                content_type = 'text/csv'
-                file_ext = 'csv'
-            
-            filename = f"{entity}_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{file_ext}"
-            s3_key = f"exports/{shop}/{filename}"
-            
-            s3_client.put_object(
-                Bucket=S3_BUCKET,
-                Key=s3_key,
-                Body=file_content,
-                ContentType=content_type
-            )
+                pages = None
+                use_bulk = False
+                if params.get('source') == 'mirror':
+                    pages = iter_mirror_pages(shop, access_token, entity, filters, include_metafields, fields)
+                
+                if pages is None:
+                    use_bulk = should_use_bulk_export(entity_service, entity, params, filters, record_count)
+                    if params.get('streaming', True):
+                        pages = iter_export_pages(
+                            entity_service, shop, access_token, entity, filters, include_metafields, use_bulk, fields
+                        )
+                
+                if pages is not None:
+                    pages = track_pages(progress, pages)
+                    with ExitStack() as stack:
+                        if include_metafields and entity in METAFIELD_ENTITIES:
+                            columns, pages = stack.enter_context(spool_metafield_pages(pages, columns))
+                            if flattener is not None:
+                                flattener = flattener.extend(columns)
+                        
+                        if file_ext == 'xlsx':
+                            with tempfile.TemporaryFile() as spool:
+                                FileProcessor.write_excel_stream(chain.from_iterable(flat_pages(flattener, pages)), spool, columns)
+                                spool.seek(0)
+                                s3_client.upload_fileobj(spool, S3_BUCKET, s3_key, ExtraArgs={'ContentType': content_type})
+                        elif file_ext in COLUMNAR_FORMATS:
+                            with open_upload(s3_client, S3_BUCKET, s3_key, upload) as writer:
+                                ColumnarWriter.write_stream(flat_pages(flattener, pages), writer, file_ext, columns)
+                        else:
+                            with open_upload(s3_client, S3_BUCKET, s3_key, upload) as writer:
+                                FileProcessor.write_csv_stream(pages, writer, columns, flattener=flattener)
+                    # Counted by track_pages, so flattened exports report records rather than rows
+                    total_records = progress.processed
+                else:
+                    data = fetch_export_records(
+                        entity_service, shop, access_token, entity, filters, include_metafields, use_bulk, fields
+                    )
+                    columns = with_metafield_columns(columns, data)
+                    if flattener is not None:
+                        flattener = flattener.extend(columns)
+                    
+                    progress.advance(len(data))
+                    progress.stage(f'Generating {format_type.upper()} file from {len(data)} {entity}')
+                    
+                    if file_ext in COLUMNAR_FORMATS:
+                        with open_upload(s3_client, S3_BUCKET, s3_key, upload) as writer:
+                            ColumnarWriter.write_stream(flat_pages(flattener, [data]), writer, file_ext, columns)
+                    elif file_ext == 'csv':
+                        with open_upload(s3_client, S3_BUCKET, s3_key, upload) as writer:
+                            FileProcessor.write_csv_stream([data], writer, columns, flattener=flattener)
+                    else:
+                        rows = list(chain.from_iterable(flat_pages(flattener, [data])))
+                        s3_client.put_object(
+                            Bucket=S3_BUCKET,
+                            Key=s3_key,
+                            Body=FileProcessor.write_excel(rows, columns),
+                            ContentType=content_type
+                        )
+                    total_records = len(data)
             
             file_url = s3_client.generate_presigned_url(
                 'get_object',
@@ -101,13 +481,14 @@ def export_entity(self, job_id: str, shop: str, access_token: str, entity: str,
                         'file_key': s3_key,
                         'file_url': file_url,
                         'filename': filename,
-                        'total_records': len(data),
+                        'total_records': total_records,
                         'progress': 100
-                    }
+                    },
+                    '$unset': {'checkpoint': ''}
                 }
             )
             
-        return {'status': 'completed', 'file_url': file_url, 'total_records': len(data)}
+        return {'status': 'completed', 'file_url': file_url, 'total_records': total_records}
         
     except Exception as e:
         logger.error(f"Export {entity} failed: {str(e)}", exc_info=True)
@@ -123,128 +504,456 @@ def export_entity(self, job_id: str, shop: str, access_token: str, entity: str,
         )
         raise
 
-@app.task(bind=True, name='tasks.import_entity')
-def import_entity(self, job_id: str, shop: str, access_token: str, entity: str, file_key: str, params: dict, command_mode: str = 'UPDATE'):
-    """Universal import task for all entities"""
-    try:
-        mongodb.jobs.update_one(
-            {'_id': ObjectId(job_id)},
-            {'$set': {'status': 'processing', 'started_at': datetime.utcnow()}}
-        )
-        
-        self.update_state(state='PROGRESS', meta={'status': 'Downloading file'})
-        
-        file_obj = s3_client.get_object(Bucket=S3_BUCKET, Key=file_key)
-        file_content = file_obj['Body'].read()
+def should_use_bulk_import(entity: str, df, params: dict, command_mode: str, total_rows: int = None) -> bool:
+    """Pick the staged bulk mutation strategy explicitly or for large files that only create products
+
+    productSet replaces a product's variants and options with the ones in
+    the file, so it is only picked automatically when every row is NEW and
+    no row names an existing product. ``total_rows`` overrides ``len(df)``
+    when ``df`` is only the first batch of a streamed file.
+    """
+    strategy = (params or {}).get('import_strategy', 'auto')
+    
+    if strategy == 'rest' or entity != 'products':
+        return False
+    
+    mode = command_mode.upper()
+    commands = set(str(value).strip().upper() or mode for value in df['Command']) if 'Command' in df.columns else {mode}
+    if 'DELETE' in commands:
+        return False
+    if strategy == 'bulk':
+        return True
+    
+    new_only = commands == {'NEW'} and not ('id' in df.columns and any(str(value).strip() for value in df['id']))
+    return new_only and (total_rows if total_rows is not None else len(df)) >= BULK_IMPORT_THRESHOLD
+
+def run_bulk_product_import(task, job_id: str, shop: str, access_token: str, df, command_mode: str = 'UPDATE') -> dict:
+    """Import products through one productSet bulk mutation per staged JSONL file
+
+    Rows are grouped into one input per product (Handle), carrying all of
+    its variants. Submitted operation IDs are kept on the job document as
+    ``bulk_operations`` so a redelivered task polls them rather than
+    creating every product again.
+    """
+    started_at = time.monotonic()
+    total_rows = len(df)
+    inputs, invalid = ImportService.transform_product_set_inputs(df, command_mode)
+    row_indexes = [indexes for indexes, _ in inputs]
+    
+    job = mongodb.jobs.find_one({'_id': ObjectId(job_id)}, {'bulk_operations': 1}) or {}
+    submitted = {int(number): operation_id for number, operation_id in (job.get('bulk_operations') or {}).items()}
+    if submitted:
+        logger.info(f"Import {job_id} resuming {len(submitted)} submitted bulk operations")
+    
+    def record_operation(number: int, operation_id: str):
+        mongodb.jobs.update_one({'_id': ObjectId(job_id)}, {'$set': {f'bulk_operations.{number}': operation_id}})
+    
+    task.update_state(state='PROGRESS', meta={'status': f'Running bulk import of {len(inputs)} products'})
+    
+    bulk_service = BulkOperationService(shop, access_token)
+    results = bulk_service.run_bulk_mutation(
+        BULK_MUTATIONS['productSet'],
+        ({'input': product_input} for _, product_input in inputs),
+        submitted,
+        record_operation
+    )
+    
+    success_count = 0
+    error_count = 0
+    errors = []
+    answered = set()
+    
+    def fail(indexes: list, message: str):
+        nonlocal error_count
+        error_count += len(indexes)
+        errors.append(f"{ImportService.row_label(indexes)}: {message}")
+    
+    for indexes, message in invalid:
+        fail(indexes, message)
+    
+    for position, line in results:
+        if position >= len(row_indexes):
+            continue
+        answered.add(position)
+        indexes = row_indexes[position]
+        payload = (line.get('data') or {}).get('productSet') or {}
         
-        file_ext = file_key.split('.')[-1].lower()
-        if file_ext not in ['csv', 'xlsx', 'xls']:
-            raise ValueError(f"Unsupported file format: {file_ext}")
+        if line.get('errors'):
+            fail(indexes, str(line['errors']))
+        elif payload.get('userErrors'):
+            fail(indexes, '; '.join(error.get('message', '') for error in payload['userErrors']))
+        elif payload.get('product'):
+            success_count += len(indexes)
+        else:
+            fail(indexes, "No result returned")
+    
+    for position, indexes in enumerate(row_indexes):
+        if position not in answered:
+            fail(indexes, "No result returned")
+    
+    elapsed = time.monotonic() - started_at
+    throughput = round(total_rows / elapsed, 2) if elapsed > 0 else 0.0
+    
+    with ProgressReporter(task, job_id, total_rows, total_rows, success_count, error_count) as progress:
+        progress.record_errors(errors)
+    
+    return finish_import(job_id, total_rows, success_count, error_count, errors, throughput)
+
+def finish_import(job_id: str, total_rows: int, success_count: int, error_count: int, errors: list,
+                  throughput: float, api_calls: dict = None) -> dict:
+    status = 'completed' if error_count == 0 else 'completed_with_errors'
+    
+    mongodb.jobs.update_one(
+        {'_id': ObjectId(job_id)},
+        {
+            '$set': {
+                'status': status,
+                'completed_at': datetime.utcnow(),
+                'total_records': total_rows,
+                'success_count': success_count,
+                'error_count': error_count,
+                'throughput': throughput,
+                'api_calls': api_calls or {},
+                'progress': 100
+            }
+        }
+    )
+    ImportCheckpoint.clear(job_id)
+    
+    return {
+        'status': status,
+        'total': total_rows,
+        'success': success_count,
+        'errors': error_count,
+        'throughput': throughput,
+        'api_calls': api_calls or {},
+        'error_messages': errors[:100]
+    }
+
+def run_row_import(task, job_id: str, shop: str, access_token: str, entity: str, batches, params: dict,
+                   command_mode: str, chunk: int = None, error_limit: int = JOB_ERROR_LIMIT,
+                   total_rows: int = None, job_total: int = None) -> dict:
+    """Write rows from a stream of DataFrame batches through the REST API on a concurrent executor
+
+    Used for whole files and for single chunks of a chunked import; resumes
+    from the (chunk's) row checkpoint. Rows go out as soon as the first batch
+    is parsed; ``total_rows`` may be an estimate and only drives progress.
+    """
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is None:
+        raise ValueError("File is empty")
+    
+    with EntityService(shop, access_token, bool(params.get('fetch_on_conflict'))) as entity_service:
+        checkpoint = ImportCheckpoint(job_id, chunk=chunk).load()
+        first_index = first.index[0] if len(first) else 0
+        rows_read = 0
+        errors = []
         
-        self.update_state(state='PROGRESS', meta={'status': 'Processing file'})
+        metafield_layout = FileProcessor.compile_metafield_columns(first.columns)
+        metafield_batcher = None
+        if metafield_layout:
+            if entity in METAFIELD_OWNER_TYPES:
+                metafield_batcher = MetafieldBatcher(entity_service, entity)
+                # Rows before the checkpoint are not replayed, so their flushed batches' errors come from it
+                metafield_batcher.errors = list(checkpoint.metafield_errors)
+            else:
+                logger.warning(f"Ignoring metafield columns: {entity} does not support metafields")
         
-        if file_ext in ['xlsx', 'xls']:
-            df = FileProcessor.read_file(file_content, f'.{file_ext}')
-        else:
-            df = FileProcessor.read_file(file_content, '.csv')
+        def write_row(item):
+            index, row_data = item
+            
+            command = row_data.get('Command', command_mode).upper()
+            if command not in ['NEW', 'UPDATE', 'DELETE', 'REPLACE']:
+                command = 'UPDATE'
+            
+            clean_data = {k: v for k, v in row_data.items() if not k.startswith('Metafield:') and k != 'Command'}
+            
+            creates = command == 'NEW' or not clean_data.get('id')
+            if not creates:
+                return entity_service.create_or_update(entity, clean_data, command)
+            
+            row_hash = ImportCheckpoint.row_hash(index, row_data)
+            created_id = checkpoint.created_id(row_hash)
+            if created_id is not None:
+                return {'id': created_id, 'replayed': True}
+            
+            result = entity_service.create_or_update(entity, clean_data, command)
+            if result.get('id'):
+                checkpoint.record_create(row_hash, index, result['id'])
+            return result
         
-        if df.empty:
-            raise ValueError("File is empty")
+        def read_rows():
+            nonlocal rows_read
+            for batch in chain([first], batches):
+                for index, row in batch.iterrows():
+                    rows_read += 1
+                    yield index, row.to_dict()
         
-        df = df.fillna('')
+        rows = islice(read_rows(), checkpoint.rows_done, None)
+        concurrency = params.get('concurrency', IMPORT_CONCURRENCY)
         
-        with EntityService(shop, access_token) as entity_service:
-            total_rows = len(df)
-            success_count = 0
-            error_count = 0
-            errors = []
-            
-            for index, row in df.iterrows():
-                try:
-                    row_data = row.to_dict()
-                    
-                    command = row_data.get('Command', command_mode).upper()
-                    if command not in ['NEW', 'UPDATE', 'DELETE', 'REPLACE']:
-                        command = 'UPDATE'
-                    
-                    metafields = FileProcessor.extract_metafields(row_data)
-                    
-                    clean_data = {k: v for k, v in row_data.items() if not k.startswith('Metafield:') and k != 'Command'}
+        with ProgressReporter(task, job_id, total_rows, checkpoint.rows_done, checkpoint.success_count,
+                              checkpoint.error_count, error_limit=error_limit, chunk=chunk,
+                              job_total=job_total) as progress, \
+                ConcurrentExecutor(shop, access_token, concurrency) as executor:
+            for (index, row_data), result, row_error in executor.map(write_row, rows):
+                if row_error is None:
+                    progress.success()
                     
-                    result = entity_service.create_or_update(entity, clean_data, command)
-                    
-                    if metafields and result.get('id'):
-                        for mf in metafields:
-                            try:
-                                entity_service.set_metafield(
-                                    entity,
-                                    result['id'],
-                                    mf['namespace'],
-                                    mf['key'],
-                                    mf['value'],
-                                    mf['type']
-                                )
-                            except Exception as mf_error:
-                                logger.warning(f"Metafield error on row {index + 2}: {str(mf_error)}")
-                    
-                    success_count += 1
-                    
-                    if (index + 1) % 10 == 0:
-                        progress = int(((index + 1) / total_rows) * 100)
-                        self.update_state(state='PROGRESS', meta={
-                            'status': f'Processing row {index + 1}/{total_rows}',
-                            'progress': progress,
-                            'success': success_count,
-                            'errors': error_count
-                        })
-                        
-                        mongodb.jobs.update_one(
-                            {'_id': ObjectId(job_id)},
-                            {
-                                '$set': {
-                                    'progress': progress,
-                                    'processed_records': index + 1,
-                                    'success_count': success_count,
-                                    'error_count': error_count
-                                }
-                            }
-                        )
-                    
-                except Exception as row_error:
-                    error_count += 1
+                    if metafield_batcher and result.get('id') and not result.get('deleted'):
+                        metafield_batcher.add(index, result['id'], [
+                            {'namespace': mf['namespace'], 'key': mf['key'], 'value': row_data.get(mf['column'])}
+                            for mf in metafield_layout
+                        ])
+                else:
                     error_msg = f"Row {index + 2}: {str(row_error)}"
                     errors.append(error_msg)
                     logger.error(error_msg)
-                    
-                    if len(errors) <= 100:
-                        mongodb.jobs.update_one(
-                            {'_id': ObjectId(job_id)},
-                            {'$push': {'errors': error_msg}}
-                        )
+                    progress.failure(error_msg)
+                
+                progress.set(throughput=round(executor.throughput, 2))
+                
+                rows_done = index - first_index + 1
+                if checkpoint.due(rows_done):
+                    if metafield_batcher:
+                        metafield_batcher.flush()
+                    checkpoint.save(rows_done, progress.success_count, progress.error_count,
+                                    metafield_batcher.errors if metafield_batcher else None)
+            
+            throughput = round(executor.throughput, 2)
+            progress.total = rows_read
+            
+            if metafield_batcher:
+                metafield_batcher.flush()
+                metafield_errors = [f"Row {index + 2}: {message}" for index, message in metafield_batcher.errors]
+                for error_msg in metafield_errors:
+                    logger.warning(error_msg)
+                errors.extend(metafield_errors)
+                progress.record_errors(metafield_errors)
+                progress.set(metafield_error_count=checkpoint.total_metafield_errors(metafield_batcher.errors))
+    
+    return {
+        'total': rows_read,
+        'success': progress.success_count,
+        'error_count': progress.error_count,
+        'errors': errors,
+        'throughput': throughput,
+        'api_calls': dict(entity_service.call_counts)
+    }
+
+def should_chunk_import(total_rows: int, params: dict) -> bool:
+    """Split large files across workers unless the job opts out"""
+    chunked = (params or {}).get('chunked')
+    if chunked is not None:
+        return bool(chunked)
+    return total_rows >= IMPORT_CHUNK_THRESHOLD
+
+def dispatch_chunked_import(task, job_id: str, shop: str, access_token: str, entity: str, batches,
+                            params: dict, command_mode: str) -> dict:
+    """Cut the streamed file into Handle-aligned chunk files and run them as a chord
+
+    Chunks share the shop's rate budget through the Redis limiter; the chord
+    callback folds their results into the final job counts. ``chunked_at`` is
+    only set once the chord is dispatched: a task redelivered before that
+    rewrites the same chunk keys and dispatches them itself.
+    """
+    job = mongodb.jobs.find_one({'_id': ObjectId(job_id)}, {'chunked_at': 1}) or {}
+    if job.get('chunked_at'):
+        logger.info(f"Import {job_id} was already split into chunks")
+        return {'status': 'chunked'}
+    
+    task.update_state(state='PROGRESS', meta={'status': 'Splitting file into chunks'})
+    
+    size = int(params.get('chunk_size', IMPORT_CHUNK_ROWS))
+    chunk_keys = []
+    starts = []
+    total_rows = 0
+    for chunk_df in ImportService.iter_chunks(batches, size, ['Handle', 'handle']):
+        chunk_key = f"imports/{shop}/chunks/{job_id}/{len(chunk_keys)}.csv"
+        s3_client.put_object(
+            Bucket=S3_BUCKET,
+            Key=chunk_key,
+            Body=chunk_df.to_csv(index=False).encode('utf-8'),
+            ContentType='text/csv'
+        )
+        chunk_keys.append(chunk_key)
+        starts.append(int(chunk_df.index[0]))
+        total_rows += len(chunk_df)
+    
+    mongodb.jobs.update_one(
+        {'_id': ObjectId(job_id)},
+        {'$set': {
+            'chunk_count': len(chunk_keys),
+            'total_records': total_rows,
+            'processed_records': 0,
+            'success_count': 0,
+            'error_count': 0
+        }}
+    )
+    
+    error_limit = max(1, JOB_ERROR_LIMIT // len(chunk_keys))
+    chunks = group(
+        import_entity_chunk.s(
+            job_id, shop, access_token, entity, chunk_key, start, number, params, command_mode, error_limit, total_rows
+        )
+        for number, (chunk_key, start) in enumerate(zip(chunk_keys, starts))
+    )
+    chord(chunks)(finish_chunked_import.s(job_id, total_rows, chunk_keys))
+    mongodb.jobs.update_one({'_id': ObjectId(job_id)}, {'$set': {'chunked_at': datetime.utcnow()}})
+    
+    return {'status': 'chunked', 'chunks': len(chunk_keys)}
+
+@app.task(bind=True, name='tasks.import_entity_chunk', acks_late=True, reject_on_worker_lost=True)
+def import_entity_chunk(self, job_id: str, shop: str, access_token: str, entity: str, chunk_key: str, start: int,
+                        chunk: int, params: dict, command_mode: str = 'UPDATE', error_limit: int = JOB_ERROR_LIMIT,
+                        job_total: int = None):
+    """Import one row range of a chunked import_entity job"""
+    try:
+        file_obj = s3_client.get_object(Bucket=S3_BUCKET, Key=chunk_key)
+        df = FileProcessor.read_file(file_obj['Body'].read(), '.csv').fillna('')
+        df.index = range(start, start + len(df))
         
-        status = 'completed' if error_count == 0 else 'completed_with_errors'
+        result = run_row_import(self, job_id, shop, access_token, entity, [df], params, command_mode, chunk, error_limit,
+                                total_rows=len(df), job_total=job_total)
+        result['errors'] = result['errors'][:error_limit]
+        return result
         
+    except Exception as e:
+        logger.error(f"Import {entity} chunk {chunk} failed: {str(e)}", exc_info=True)
         mongodb.jobs.update_one(
             {'_id': ObjectId(job_id)},
             {
                 '$set': {
-                    'status': status,
-                    'completed_at': datetime.utcnow(),
-                    'total_records': total_rows,
-                    'success_count': success_count,
-                    'error_count': error_count,
-                    'progress': 100
+                    'status': 'failed',
+                    'error': f"Chunk {chunk}: {str(e)}",
+                    'failed_at': datetime.utcnow()
                 }
             }
         )
+        raise
+
+@app.task(bind=True, name='tasks.finish_chunked_import')
+def finish_chunked_import(self, results: list, job_id: str, total_rows: int, chunk_keys: list):
+    """Chord callback folding chunk results into the final job counts"""
+    try:
+        api_calls = Counter()
+        for result in results:
+            api_calls.update(result['api_calls'])
         
-        return {
-            'status': status,
-            'total': total_rows,
-            'success': success_count,
-            'errors': error_count,
-            'error_messages': errors[:100]
-        }
+        job = mongodb.jobs.find_one({'_id': ObjectId(job_id)}, {'started_at': 1}) or {}
+        elapsed = (datetime.utcnow() - job['started_at']).total_seconds() if job.get('started_at') else 0
+        throughput = round(total_rows / elapsed, 2) if elapsed > 0 else 0.0
+        
+        for chunk_key in chunk_keys:
+            try:
+                s3_client.delete_object(Bucket=S3_BUCKET, Key=chunk_key)
+            except Exception as e:
+                logger.warning(f"Could not remove import chunk {chunk_key}: {str(e)}")
+        
+        return finish_import(
+            job_id,
+            total_rows,
+            sum(result['success'] for result in results),
+            sum(result['error_count'] for result in results),
+            list(chain.from_iterable(result['errors'] for result in results)),
+            throughput,
+            dict(api_calls)
+        )
+        
+    except Exception as e:
+        logger.error(f"Finishing chunked import {job_id} failed: {str(e)}", exc_info=True)
+        mongodb.jobs.update_one(
+            {'_id': ObjectId(job_id)},
+            {
+                '$set': {
+                    'status': 'failed',
+                    'error': str(e),
+                    'failed_at': datetime.utcnow()
+                }
+            }
+        )
+        raise
+
+@contextmanager
+def open_import_batches(file_key: str, file_ext: str):
+    """Start reading an uploaded import file from S3 in IMPORT_READ_BATCH_ROWS batches
+
+    CSV files are parsed from a spool the S3 body downloads into, so rows
+    can be written while the rest of the file downloads. .xlsx workbooks
+    are downloaded to a temp file (the zip directory sits at the end) and
+    read with openpyxl in read_only mode. Either way memory stays at about
+    one batch. Yields the first batch, an iterator over the remaining
+    batches and the file's row count (estimated when it spans more than
+    one batch); leaving the context stops the download and removes the
+    spool files, whether or not the batches were read to the end.
+    """
+    file_obj = s3_client.get_object(Bucket=S3_BUCKET, Key=file_key)
+    estimated_rows = None
+    
+    with ExitStack() as stack:
+        if file_ext == 'csv':
+            stream = stack.enter_context(io.BufferedReader(S3DownloadSpool(file_obj['Body'])))
+            batches = FileProcessor.iter_csv_batches(stream, IMPORT_READ_BATCH_ROWS)
+            stack.callback(batches.close)
+        elif file_ext == 'xlsx':
+            spool = stack.enter_context(tempfile.TemporaryFile())
+            with closing(file_obj['Body']) as body:
+                shutil.copyfileobj(body, spool, S3_DOWNLOAD_CHUNK_SIZE)
+            estimated_rows = FileProcessor.excel_row_count(spool) or 0
+            batches = FileProcessor.iter_excel_batches(spool, IMPORT_READ_BATCH_ROWS)
+            stack.callback(batches.close)
+        else:
+            with closing(file_obj['Body']) as body:
+                df = FileProcessor.read_file(body.read(), f'.{file_ext}').fillna('')
+            batches = iter([df])
+        
+        first = next(batches, None)
+        if first is None or first.empty:
+            raise ValueError("File is empty")
+        
+        if len(first) < IMPORT_READ_BATCH_ROWS or file_ext not in ['csv', 'xlsx']:
+            estimated_rows = len(first)
+        elif estimated_rows is None:
+            batch_bytes = len(first.to_csv(index=False).encode('utf-8'))
+            estimated_rows = int(file_obj.get('ContentLength', 0) * len(first) / batch_bytes) if batch_bytes else 0
+        
+        yield first, batches, max(estimated_rows, len(first))
+
+@app.task(bind=True, name='tasks.import_entity', acks_late=True, reject_on_worker_lost=True)
+def import_entity(self, job_id: str, shop: str, access_token: str, entity: str, file_key: str, params: dict, command_mode: str = 'UPDATE'):
+    """Universal import task for all entities"""
+    try:
+        mongodb.jobs.update_one(
+            {'_id': ObjectId(job_id)},
+            {'$set': {'status': 'processing', 'started_at': datetime.utcnow()}}
+        )
+        
+        file_ext = file_key.split('.')[-1].lower()
+        if file_ext not in ['csv', 'xlsx', 'xls']:
+            raise ValueError(f"Unsupported file format: {file_ext}")
+        
+        self.update_state(state='PROGRESS', meta={'status': 'Reading file'})
+        
+        with open_import_batches(file_key, file_ext) as (first, batches, estimated_rows):
+            if should_use_bulk_import(entity, first, params, command_mode, estimated_rows):
+                df = FileProcessor.collect_batches(chain([first], batches))
+                if should_use_bulk_import(entity, df, params, command_mode):
+                    return run_bulk_product_import(self, job_id, shop, access_token, df, command_mode)
+                first, batches, estimated_rows = df, iter(()), len(df)
+            
+            if should_chunk_import(estimated_rows, params):
+                return dispatch_chunked_import(self, job_id, shop, access_token, entity, chain([first], batches), params, command_mode)
+            
+            result = run_row_import(
+                self, job_id, shop, access_token, entity, chain([first], batches), params, command_mode,
+                total_rows=estimated_rows
+            )
+        
+        return finish_import(
+            job_id, result['total'], result['success'], result['error_count'], result['errors'],
+            result['throughput'], result['api_calls']
+        )
         
     except Exception as e:
         logger.error(f"Import {entity} failed: {str(e)}", exc_info=True)
@@ -374,34 +1083,45 @@ def export_multi_entity(self, job_id: str, shop: str, access_token: str, entitie
         if format_type != 'xlsx':
             raise ValueError("Multi-entity export only supports Excel format")
         
-        sheets_data = {}
-        
-        with EntityService(shop, access_token) as entity_service:
-            for entity in entities:
-                if entity not in ENTITY_METHODS:
-                    continue
-                
-                self.update_state(state='PROGRESS', meta={'status': f'Fetching {entity}'})
-                
-                method_name = ENTITY_METHODS[entity]
-                method = getattr(entity_service, method_name)
-                data = method()
-                
-                sheets_data[entity] = data
-        
-        self.update_state(state='PROGRESS', meta={'status': 'Generating Excel file'})
-        
-        file_content = FileProcessor.write_multi_sheet_excel(sheets_data)
-        
+        entities = [entity for entity in entities if entity in ENTITY_METHODS]
         filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
         s3_key = f"exports/{shop}/{filename}"
+        record_counts = {}
         
-        s3_client.put_object(
-            Bucket=S3_BUCKET,
-            Key=s3_key,
-            Body=file_content,
-            ContentType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        with ExitStack() as stack:
+            spills = {entity: stack.enter_context(tempfile.TemporaryFile()) for entity in entities}
+            concurrency = params.get('concurrency', EXPORT_ENTITY_CONCURRENCY)
+            
+            with EntityService(shop, access_token) as entity_service, \
+                    ConcurrentExecutor(shop, access_token, concurrency) as executor:
+                def spill_entity(entity):
+                    flattener = RecordFlattener.for_entity(entity) if params.get('flatten') and entity in FLATTEN_SCHEMAS else None
+                    fields = list(dict.fromkeys(['id'] + flattener.fields)) if flattener else None
+                    pages = iter_export_pages(entity_service, shop, access_token, entity, {}, False, False, fields)
+                    if pages is None:
+                        records = getattr(entity_service, ENTITY_METHODS[entity])()
+                        pages = [[records] if isinstance(records, dict) else records]
+                    return FileProcessor.spill_records(flat_pages(flattener, pages), spills[entity])
+                
+                self.update_state(state='PROGRESS', meta={'status': f'Fetching {len(entities)} entities'})
+                
+                for entity, count, error in executor.map(spill_entity, entities):
+                    if error is not None:
+                        raise error
+                    record_counts[entity] = count
+                    self.update_state(state='PROGRESS', meta={
+                        'status': f'Fetched {entity}',
+                        'completed': len(record_counts),
+                        'total': len(entities)
+                    })
+            
+            self.update_state(state='PROGRESS', meta={'status': 'Generating Excel file'})
+            
+            sheets = {entity: FileProcessor.iter_spilled_records(spill) for entity, spill in spills.items()}
+            with tempfile.TemporaryFile() as spool:
+                FileProcessor.write_multi_sheet_excel_stream(sheets, spool)
+                spool.seek(0)
+                s3_client.upload_fileobj(spool, S3_BUCKET, s3_key, ExtraArgs={'ContentType': CONTENT_TYPES['xlsx']})
         
         file_url = s3_client.generate_presigned_url(
             'get_object',
@@ -409,7 +1129,7 @@ def export_multi_entity(self, job_id: str, shop: str, access_token: str, entitie
             ExpiresIn=86400
         )
         
-        total_records = sum(len(data) for data in sheets_data.values())
+        total_records = sum(record_counts.values())
         
         mongodb.jobs.update_one(
             {'_id': ObjectId(job_id)},
@@ -2,6 +2,7 @@ from celery_app import app
 from config import mongodb, s3_client, S3_BUCKET
 from services.shopify_service import ShopifyService
 from services.export_service import ExportService
+from services.s3_stream import export_upload, open_upload
 from bson import ObjectId
 from datetime import datetime
 import logging
@@ -17,23 +18,15 @@ def export_products(self, job_id: str, shop: str, access_token: str, params: dic
         )
         
         with ShopifyService(shop, access_token) as shopify_service:
-            self.update_state(state='PROGRESS', meta={'status': 'Fetching products from Shopify'})
+            self.update_state(state='PROGRESS', meta={'status': 'Exporting products from Shopify'})
             
-            products = shopify_service.get_products()
-            
-            self.update_state(state='PROGRESS', meta={'status': f'Exporting {len(products)} products'})
-            
-            csv_content = ExportService.products_to_csv(products)
-            
-            filename = f"products_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            upload = export_upload('text/csv', params.get('compression'), params.get('compression_mode', 'file'))
+            filename = f"products_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv{upload['suffix']}"
             s3_key = f"exports/{shop}/{filename}"
             
-            s3_client.put_object(
-                Bucket=S3_BUCKET,
-                Key=s3_key,
-                Body=csv_content,
-                ContentType='text/csv'
-            )
+            # Pages are flattened and uploaded as they arrive instead of building the whole CSV first
+            with open_upload(s3_client, S3_BUCKET, s3_key, upload) as writer:
+                total_records = ExportService.write_products_csv(shopify_service.iter_products(), writer)
             
             file_url = s3_client.generate_presigned_url(
                 'get_object',
@@ -50,7 +43,7 @@ def export_products(self, job_id: str, shop: str, access_token: str, params: dic
                         'file_key': s3_key,
                         'file_url': file_url,
                         'filename': filename,
-                        'total_records': len(products)
+                        'total_records': total_records
                     }
                 }
             )
@@ -80,23 +73,15 @@ def export_customers(self, job_id: str, shop: str, access_token: str, params: di
         )
         
         with ShopifyService(shop, access_token) as shopify_service:
-            self.update_state(state='PROGRESS', meta={'status': 'Fetching customers from Shopify'})
-            
-            customers = shopify_service.get_customers()
-            
-            self.update_state(state='PROGRESS', meta={'status': f'Exporting {len(customers)} customers'})
+            self.update_state(state='PROGRESS', meta={'status': 'Exporting customers from Shopify'})
             
-            csv_content = ExportService.customers_to_csv(customers)
-            
-            filename = f"customers_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            upload = export_upload('text/csv', params.get('compression'), params.get('compression_mode', 'file'))
+            filename = f"customers_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv{upload['suffix']}"
             s3_key = f"exports/{shop}/{filename}"
             
-            s3_client.put_object(
-                Bucket=S3_BUCKET,
-                Key=s3_key,
-                Body=csv_content,
-                ContentType='text/csv'
-            )
+            # Pages are flattened and uploaded as they arrive instead of building the whole CSV first
+            with open_upload(s3_client, S3_BUCKET, s3_key, upload) as writer:
+                total_records = ExportService.write_customers_csv(shopify_service.iter_customers(), writer)
             
             file_url = s3_client.generate_presigned_url(
                 'get_object',
@@ -113,7 +98,7 @@ def export_customers(self, job_id: str, shop: str, access_token: str, params: di
                         'file_key': s3_key,
                         'file_url': file_url,
                         'filename': filename,
-                        'total_records': len(customers)
+                        'total_records': total_records
                     }
                 }
             )
@@ -143,23 +128,15 @@ def export_orders(self, job_id: str, shop: str, access_token: str, params: dict)
         )
         
         with ShopifyService(shop, access_token) as shopify_service:
-            self.update_state(state='PROGRESS', meta={'status': 'Fetching orders from Shopify'})
-            
-            orders = shopify_service.get_orders(status=params.get('status', 'any'))
+            self.update_state(state='PROGRESS', meta={'status': 'Exporting orders from Shopify'})
             
-            self.update_state(state='PROGRESS', meta={'status': f'Exporting {len(orders)} orders'})
-            
-            csv_content = ExportService.orders_to_csv(orders)
-            
-            filename = f"orders_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            upload = export_upload('text/csv', params.get('compression'), params.get('compression_mode', 'file'))
+            filename = f"orders_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv{upload['suffix']}"
             s3_key = f"exports/{shop}/{filename}"
             
-            s3_client.put_object(
-                Bucket=S3_BUCKET,
-                Key=s3_key,
-                Body=csv_content,
-                ContentType='text/csv'
-            )
+            # Pages are flattened and uploaded as they arrive instead of building the whole CSV first
+            with open_upload(s3_client, S3_BUCKET, s3_key, upload) as writer:
+                total_records = ExportService.write_orders_csv(shopify_service.iter_orders(status=params.get('status', 'any')), writer)
             
             file_url = s3_client.generate_presigned_url(
                 'get_object',
@@ -176,7 +153,7 @@ def export_orders(self, job_id: str, shop: str, access_token: str, params: dict)
                         'file_key': s3_key,
                         'file_url': file_url,
                         'filename': filename,
-                        'total_records': len(orders)
+                        'total_records': total_records
                     }
                 }
             )
@@ -2,6 +2,7 @@ from celery_app import app
 from config import mongodb, s3_client, S3_BUCKET
 from services.shopify_service import ShopifyService
 from services.import_service import ImportService
+from services.progress_reporter import ProgressReporter
 from bson import ObjectId
 from datetime import datetime
 import logging
@@ -26,35 +27,26 @@ def import_products(self, job_id: str, shop: str, access_token: str, file_key: s
         df = ImportService.parse_csv(file_content)
         
         total_rows = len(df)
-        success_count = 0
-        error_count = 0
-        errors = []
         
-        with ShopifyService(shop, access_token) as shopify_service:
-            for index, row in df.iterrows():
+        payloads, errors = ImportService.transform_products(df)
+        
+        with ShopifyService(shop, access_token) as shopify_service, \
+                ProgressReporter(self, job_id, total_rows, len(errors), 0, len(errors)) as progress:
+            progress.record_errors(errors)
+            
+            for index, product_data in payloads:
                 try:
-                    valid, error_msg = ImportService.validate_product_row(row)
-                    if not valid:
-                        errors.append(f"Row {index + 2}: {error_msg}")
-                        error_count += 1
-                        continue
-                        
-                    product_data = ImportService.row_to_product(row)
-                    
                     shopify_service.create_product(product_data)
-                    success_count += 1
-                    
-                    progress = int((index + 1) / total_rows * 100)
-                    self.update_state(
-                        state='PROGRESS',
-                        meta={'status': f'Processing row {index + 1}/{total_rows}', 'progress': progress}
-                    )
+                    progress.success()
                     
                 except Exception as e:
                     logger.error(f"Error importing product row {index + 2}: {str(e)}")
                     errors.append(f"Row {index + 2}: {str(e)}")
-                    error_count += 1
-                    
+                    progress.failure(errors[-1])
+        
+        success_count = progress.success_count
+        error_count = progress.error_count
+        
         mongodb.jobs.update_one(
             {'_id': ObjectId(job_id)},
             {
@@ -63,8 +55,7 @@ def import_products(self, job_id: str, shop: str, access_token: str, file_key: s
                     'completed_at': datetime.utcnow(),
                     'total_records': total_rows,
                     'success_count': success_count,
-                    'error_count': error_count,
-                    'errors': errors[:100]
+                    'error_count': error_count
                 }
             }
         )
@@ -108,35 +99,26 @@ def import_customers(self, job_id: str, shop: str, access_token: str, file_key:
         df = ImportService.parse_csv(file_content)
         
         total_rows = len(df)
-        success_count = 0
-        error_count = 0
-        errors = []
         
-        with ShopifyService(shop, access_token) as shopify_service:
-            for index, row in df.iterrows():
+        payloads, errors = ImportService.transform_customers(df)
+        
+        with ShopifyService(shop, access_token) as shopify_service, \
+                ProgressReporter(self, job_id, total_rows, len(errors), 0, len(errors)) as progress:
+            progress.record_errors(errors)
+            
+            for index, customer_data in payloads:
                 try:
-                    valid, error_msg = ImportService.validate_customer_row(row)
-                    if not valid:
-                        errors.append(f"Row {index + 2}: {error_msg}")
-                        error_count += 1
-                        continue
-                        
-                    customer_data = ImportService.row_to_customer(row)
-                    
                     shopify_service.create_customer(customer_data)
-                    success_count += 1
-                    
-                    progress = int((index + 1) / total_rows * 100)
-                    self.update_state(
-                        state='PROGRESS',
-                        meta={'status': f'Processing row {index + 1}/{total_rows}', 'progress': progress}
-                    )
+                    progress.success()
                     
                 except Exception as e:
                     logger.error(f"Error importing customer row {index + 2}: {str(e)}")
                     errors.append(f"Row {index + 2}: {str(e)}")
-                    error_count += 1
-                    
+                    progress.failure(errors[-1])
+        
+        success_count = progress.success_count
+        error_count = progress.error_count
+        
         mongodb.jobs.update_one(
             {'_id': ObjectId(job_id)},
             {
@@ -145,8 +127,7 @@ def import_customers(self, job_id: str, shop: str, access_token: str, file_key:
                     'completed_at': datetime.utcnow(),
                     'total_records': total_rows,
                     'success_count': success_count,
-                    'error_count': error_count,
-                    'errors': errors[:100]
+                    'error_count': error_count
                 }
             }
         )
@@ -0,0 +1,42 @@
+from celery_app import app
+from services.entity_service import EntityService
+from services.mirror_service import MirrorService, MIRROR_ENTITIES
+import logging
+
+logger = logging.getLogger(__name__)
+
+@app.task(bind=True, name='tasks.mirror_load')
+def mirror_load(self, shop: str, access_token: str, entities: list = None):
+    """Bulk-load a shop's entities into the MongoDB mirror"""
+    entities = entities or list(MIRROR_ENTITIES)
+    mirror = MirrorService(shop)
+    loaded = {}
+    
+    with EntityService(shop, access_token) as entity_service:
+        for entity in entities:
+            if not mirror.supports(entity):
+                logger.warning(f"Entity {entity} cannot be mirrored")
+                continue
+            
+            self.update_state(state='PROGRESS', meta={'status': f'Mirroring {entity}'})
+            
+            try:
+                resource_class, params = entity_service.paginated_resource(entity)
+                pages = entity_service.iter_pages(resource_class, params, strict=True)
+                loaded[entity] = mirror.load(entity, pages)
+            except Exception as e:
+                logger.error(f"Mirror load of {entity} for {shop} failed: {str(e)}", exc_info=True)
+                mirror.set_state(entity, status='failed', error=str(e))
+                raise
+    
+    return {'status': 'completed', 'loaded': loaded}
+
+@app.task(bind=True, name='tasks.mirror_webhook', max_retries=3, default_retry_delay=10)
+def mirror_webhook(self, shop: str, topic: str, payload: dict):
+    """Apply a Shopify webhook delivered through the backend to the mirror"""
+    try:
+        entity = MirrorService(shop).apply_webhook(topic, payload)
+        return {'status': 'applied' if entity else 'ignored', 'entity': entity}
+    except Exception as e:
+        logger.error(f"Mirror webhook {topic} for {shop} failed: {str(e)}")
+        raise self.retry(exc=e)
@@ -0,0 +1,171 @@
+"""Micro-benchmarks for the export/import hot paths, old implementation vs new
+
+Run from the workers directory: ``python tests/benchmark.py [case ...] [--rows N ...]``.
+Each case times the legacy code kept in the regression tests against the
+current code on the same generated data and reports rows/s for the best of
+``--repeat`` runs. Every implementation runs in its own subprocess so its
+peak RSS is measured alone; ``+run`` is how far the peak rose above what
+generating the input data already needed.
+"""
+import argparse
+from io import BytesIO
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+from services.export_service import ExportService
+from services.file_processor import FileProcessor
+from services.import_service import ImportService
+from services.record_flattener import FLATTEN_SCHEMAS, RecordFlattener
+import test_export_service
+import test_file_processor
+import test_import_service
+import test_record_flattener
+
+CASES = {}
+
+
+def case(function):
+    CASES[function.__name__] = function
+    return function
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def measure(name, label, rows, repeat):
+    """Time one implementation in this process and return its rows/s and peak RSS"""
+    function = CASES[name](rows)[label]
+    setup_rss = peak_rss_mb()
+    seconds = best_of(repeat, function)
+    peak_rss = peak_rss_mb()
+    return {'seconds': seconds, 'peak_rss': peak_rss, 'run_rss': peak_rss - setup_rss}
+
+
+def run_isolated(name, label, rows, repeat):
+    """``measure`` in a fresh interpreter, so no other implementation's peak is counted"""
+    command = [sys.executable, os.path.abspath(__file__), '--measure', name, label, '--rows', str(rows), '--repeat', str(repeat)]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+@case
+def write_excel(rows):
+    data = [{'id': i, 'title': f'Product {i}', 'sku': f'SKU-{i:08d}', 'price': i * 0.25, 'qty': i % 50,
+             'vendor': 'Acme', 'taxable': i % 2 == 0, 'tags': 'a, b, c'} for i in range(rows)]
+    
+    def stream():
+        with tempfile.TemporaryFile() as output:
+            FileProcessor.write_excel_stream(iter(data), output)
+    
+    return {
+        'legacy write_excel': lambda: test_file_processor.legacy_write_excel(data),
+        'write_excel_stream': stream,
+    }
+
+
+@case
+def read_excel(rows):
+    with tempfile.TemporaryFile() as spool:
+        FileProcessor.write_excel_stream(({'Handle': f'product-{i}', 'Title': f'Product {i}', 'Price': i * 0.25,
+                                           'Inventory Quantity': i % 50} for i in range(rows)), spool)
+        spool.seek(0)
+        content = spool.read()
+    
+    def batches():
+        for _ in FileProcessor.iter_excel_batches(BytesIO(content), 5000):
+            pass
+    
+    return {
+        'pd.read_excel': lambda: pd.read_excel(BytesIO(content)),
+        'iter_excel_batches': batches,
+    }
+
+
+@case
+def transform_products(rows):
+    df = pd.DataFrame({
+        'Title': [f'Product {i}' if i % 20 else None for i in range(rows)],
+        'Body HTML': '<p>Body</p>',
+        'Vendor': 'Acme',
+        'Tags': 'a, b',
+        'SKU': [f'SKU-{i}' for i in range(rows)],
+        'Price': [i * 0.25 for i in range(rows)],
+        'Inventory Quantity': [i % 50 for i in range(rows)],
+        'Barcode': [None if i % 3 else f'{i:013d}' for i in range(rows)],
+    })
+    legacy = test_import_service.legacy_transform
+    
+    return {
+        'iterrows + row_to_product': lambda: legacy(df, ImportService.validate_product_row, ImportService.row_to_product),
+        'transform_products': lambda: ImportService.transform_products(df),
+    }
+
+
+@case
+def flatten_products(rows):
+    """``rows`` variant rows, ten per product"""
+    product = test_export_service.PRODUCTS[0]
+    products = [dict(product, id=i, variants=[dict(product['variants'][0], id=i * 10 + v) for v in range(10)])
+                for i in range(max(1, rows // 10))]
+    schema = FLATTEN_SCHEMAS['products']
+    flattener = RecordFlattener.for_entity('products')
+    
+    return {
+        'legacy products_to_csv': lambda: test_export_service.LegacyExportService.products_to_csv(products),
+        'products_to_csv': lambda: ExportService.products_to_csv(products),
+        'naive dict flattening': lambda: test_record_flattener.naive_rows(
+            products, schema['columns'], schema['explode'], schema['join']
+        ),
+        'RecordFlattener.rows': lambda: flattener.rows(products),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cases', nargs='*', help=f"cases to run: {', '.join(CASES)} (default: all)")
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--measure', nargs=2, metavar=('CASE', 'LABEL'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.measure:
+        print(json.dumps(measure(*args.measure, args.rows[0], args.repeat)))
+        return
+    
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+    
+    for rows in args.rows:
+        for name in args.cases or CASES:
+            # Building a case's input is cheap next to timing it, so this only lists the labels
+            for label in CASES[name](0):
+                result = run_isolated(name, label, rows, args.repeat)
+                print(f"{rows:>9,} {name:<20} {label:<28} {result['seconds']:8.3f}s {rows / result['seconds']:12,.0f} rows/s"
+                      f" {result['peak_rss']:8.0f} MB peak RSS ({result['run_rss']:+.0f} MB run)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import fakeredis
+import mongomock
+import pytest
+
+# Modules import each other from the workers root (``from config import ...``)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    """mongomock and fakeredis in place of the MongoDB and Redis clients every worker module imported"""
+    import tasks.entity_tasks, tasks.export_tasks, tasks.import_tasks  # noqa: F401 - load every module first
+    from services import mirror_service
+    
+    database = mongomock.MongoClient().db
+    client = fakeredis.FakeRedis(decode_responses=True)
+    for name, module in list(sys.modules.items()):
+        if name == 'config' or name.startswith(('services.', 'tasks.')):
+            if hasattr(module, 'mongodb'):
+                monkeypatch.setattr(module, 'mongodb', database)
+            if hasattr(module, 'redis_client'):
+                monkeypatch.setattr(module, 'redis_client', client)
+    monkeypatch.setattr(mirror_service, '_indexed', set())
+    return SimpleNamespace(db=database, redis=client)
+
+
+class Task:
+    """Stands in for a bound Celery task"""
+    
+    def __init__(self):
+        self.states = []
+    
+    def update_state(self, state=None, meta=None):
+        self.states.append(meta)
+
+
+@pytest.fixture
+def task():
+    return Task()
@@ -0,0 +1,44 @@
+"""In-memory stand-in for the boto3 S3 client calls the workers make"""
+from io import BytesIO
+from itertools import count
+from typing import Dict
+
+
+class FakeS3:
+    """Keeps objects and open multipart uploads in dicts; ``deleted`` lists removed keys"""
+    
+    def __init__(self):
+        self.objects: Dict[str, bytes] = {}
+        self.uploads: Dict[str, Dict[int, bytes]] = {}
+        self.deleted = []
+        self._ids = count(1)
+    
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        self.objects[Key] = Body if isinstance(Body, bytes) else Body.encode('utf-8')
+    
+    def get_object(self, Bucket, Key):
+        body = self.objects[Key]
+        return {'Body': BytesIO(body), 'ContentLength': len(body)}
+    
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+        self.deleted.append(Key)
+    
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = f'upload-{next(self._ids)}'
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+    
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': f'"{UploadId}-{PartNumber}"'}
+    
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        self.objects[Key] = b''.join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+    
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+    
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return f"https://s3.example.com/{Params['Key']}"
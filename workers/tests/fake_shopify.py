@@ -0,0 +1,100 @@
+"""In-memory stand-in for the parts of Shopify's Admin GraphQL API the bulk workers use"""
+import json
+from itertools import count
+from typing import Any, Dict, List
+
+BUSY_MESSAGE = 'A bulk {kind} operation for this app and shop is already in progress: gid://shopify/BulkOperation/1.'
+
+
+class FakeResponse:
+    def __init__(self, lines: List[Dict[str, Any]] = None):
+        self.lines = lines or []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+    
+    def raise_for_status(self):
+        pass
+    
+    def iter_lines(self):
+        for line in self.lines:
+            yield json.dumps(line).encode('utf-8')
+        yield b''
+
+
+class FakeBulkShop:
+    """Serves bulk queries and mutations from canned JSONL
+
+    ``busy`` rejections are returned before a submission is accepted, each
+    operation is RUNNING for ``polls_until_done`` polls, and mutation results
+    echo the staged variables with their line numbers.
+    """
+    
+    def __init__(self, query_lines: List[Dict[str, Any]] = None, busy: int = 0, polls_until_done: int = 1,
+                 final_status: str = 'COMPLETED'):
+        self.query_lines = query_lines or []
+        self.busy = busy
+        self.polls_until_done = polls_until_done
+        self.final_status = final_status
+        self.operations: Dict[str, Dict[str, Any]] = {}
+        self.staged: Dict[str, List[Dict[str, Any]]] = {}
+        self.results: Dict[str, List[Dict[str, Any]]] = {}
+        self.submissions: List[Dict[str, Any]] = []
+        self.ids = count(1)
+    
+    def install(self, monkeypatch, service):
+        """Route ``service``'s GraphQL calls and the module's upload/download requests here"""
+        from services import bulk_operation_service
+        monkeypatch.setattr(service, '_post', self.graphql)
+        monkeypatch.setattr(bulk_operation_service.requests, 'get', self.download)
+        monkeypatch.setattr(bulk_operation_service.requests, 'post', self.upload)
+        return service
+    
+    def graphql(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        if 'bulkOperationRunQuery' in query:
+            return {'data': {'bulkOperationRunQuery': self.submit('query', variables, self.query_lines)}}
+        if 'bulkOperationRunMutation' in query:
+            lines = [{'data': {'productSet': {'product': {'id': f"gid://shopify/Product/{index + 1}"},
+                                              'userErrors': []}}, '__lineNumber': index}
+                     for index, _ in enumerate(self.staged[variables['stagedUploadPath']])]
+            return {'data': {'bulkOperationRunMutation': self.submit('mutation', variables, lines)}}
+        if 'stagedUploadsCreate' in query:
+            key = f"tmp/bulk/{next(self.ids)}/{variables['input'][0]['filename']}"
+            return {'data': {'stagedUploadsCreate': {'userErrors': [], 'stagedTargets': [{
+                'url': 'https://staged.example/upload', 'resourceUrl': None,
+                'parameters': [{'name': 'key', 'value': key}],
+            }]}}}
+        if 'node(id: $id)' in query:
+            return {'data': {'node': self.poll(variables['id'])}}
+        raise AssertionError(f"Unexpected GraphQL request: {query}")
+    
+    def submit(self, kind: str, variables: Dict[str, Any], lines: List[Dict[str, Any]]) -> Dict[str, Any]:
+        self.submissions.append(variables)
+        if self.busy:
+            self.busy -= 1
+            return {'bulkOperation': None, 'userErrors': [{'field': None, 'message': BUSY_MESSAGE.format(kind=kind)}]}
+        
+        operation_id = f"gid://shopify/BulkOperation/{next(self.ids)}"
+        self.operations[operation_id] = {'polls': 0}
+        self.results[f"https://results.example/{operation_id}"] = lines
+        return {'bulkOperation': {'id': operation_id, 'status': 'CREATED'}, 'userErrors': []}
+    
+    def poll(self, operation_id: str) -> Dict[str, Any]:
+        operation = self.operations[operation_id]
+        operation['polls'] += 1
+        if operation['polls'] < self.polls_until_done:
+            return {'id': operation_id, 'status': 'RUNNING', 'objectCount': '0'}
+        url = f"https://results.example/{operation_id}" if self.final_status == 'COMPLETED' else None
+        return {'id': operation_id, 'status': self.final_status, 'errorCode': None if url else 'INTERNAL_SERVER_ERROR',
+                'objectCount': str(len(self.results[f"https://results.example/{operation_id}"])), 'url': url}
+    
+    def upload(self, url: str, data: Dict[str, str], files: Dict[str, Any]):
+        _, handle, _ = files['file']
+        self.staged[data['key']] = [json.loads(line) for line in handle.read().splitlines()]
+        return FakeResponse()
+    
+    def download(self, url: str, stream: bool = False):
+        return FakeResponse(self.results[url])
@@ -0,0 +1,77 @@
+import fakeredis
+import pandas as pd
+import pytest
+from bson import ObjectId
+
+from services.bulk_operation_service import BulkOperationService
+from services.rate_limiter import ShopRateLimiter
+from tasks import entity_tasks
+from fake_shopify import FakeBulkShop
+
+SHOP = 'shop.myshopify.com'
+
+
+@pytest.fixture
+def shop(monkeypatch, backends):
+    limiter = ShopRateLimiter(SHOP, 'graphql', client=fakeredis.FakeRedis())
+    service = BulkOperationService(SHOP, 'token', poll_interval=0, timeout=60, limiter=limiter)
+    fake = FakeBulkShop()
+    fake.install(monkeypatch, service)
+    monkeypatch.setattr(entity_tasks, 'BulkOperationService', lambda shop, access_token: service)
+    return fake
+
+
+def variant_rows(count, **columns):
+    return pd.DataFrame(dict({
+        'Handle': ['shirt'] * count,
+        'Title': ['Shirt'] + [''] * (count - 1),
+        'Option1 Name': ['Size'] + [''] * (count - 1),
+        'Option1 Value': [f'S{i}' for i in range(count)],
+        'Variant Price': [f'{10 + i}.00' for i in range(count)],
+    }, **columns))
+
+
+def test_bulk_update_sends_one_product_with_all_its_variants(shop, backends, task):
+    job_id = backends.db.jobs.insert_one({'status': 'processing'}).inserted_id
+    df = variant_rows(3, id=[101, '', ''], Command=['UPDATE', '', ''])
+    
+    result = entity_tasks.run_bulk_product_import(task, str(job_id), SHOP, 'token', df, 'UPDATE')
+    
+    staged = [line['input'] for lines in shop.staged.values() for line in lines]
+    assert len(staged) == 1
+    assert staged[0]['id'] == 'gid://shopify/Product/101'
+    assert [variant['optionValues'][0]['name'] for variant in staged[0]['variants']] == ['S0', 'S1', 'S2']
+    assert (result['success'], result['errors']) == (3, 0)
+    assert backends.db.jobs.find_one({'_id': ObjectId(job_id)})['success_count'] == 3
+
+
+def test_bulk_import_counts_unconvertible_product_rows_as_errors(shop, backends, task):
+    job_id = backends.db.jobs.insert_one({'status': 'processing'}).inserted_id
+    df = pd.concat([variant_rows(2), pd.DataFrame({'Handle': ['hat', 'hat'], 'Variant Price': ['1', '2']})],
+                   ignore_index=True).fillna('')
+    
+    result = entity_tasks.run_bulk_product_import(task, str(job_id), SHOP, 'token', df, 'NEW')
+    
+    assert (result['success'], result['errors']) == (2, 2)
+    assert result['error_messages'] == ['Rows 4-5: Missing required field: Title']
+
+
+@pytest.mark.parametrize('columns, command_mode, expected', [
+    ({'Command': ['NEW'] * 4}, 'UPDATE', True),
+    ({'Command': [''] * 4}, 'NEW', True),
+    ({}, 'UPDATE', False),
+    ({'Command': ['NEW', 'NEW', 'UPDATE', 'NEW']}, 'NEW', False),
+    ({'id': [101, '', '', '']}, 'NEW', False),
+    ({'Command': ['NEW', 'DELETE', 'NEW', 'NEW']}, 'NEW', False),
+])
+def test_bulk_is_only_picked_automatically_for_new_only_files(monkeypatch, columns, command_mode, expected):
+    monkeypatch.setattr(entity_tasks, 'BULK_IMPORT_THRESHOLD', 4)
+    
+    assert entity_tasks.should_use_bulk_import('products', variant_rows(4, **columns), {}, command_mode) is expected
+
+
+def test_explicit_bulk_strategy_allows_updates_but_not_deletes():
+    params = {'import_strategy': 'bulk'}
+    
+    assert entity_tasks.should_use_bulk_import('products', variant_rows(2, id=[1, '']), params, 'UPDATE')
+    assert not entity_tasks.should_use_bulk_import('products', variant_rows(2), params, 'DELETE')
@@ -0,0 +1,140 @@
+import os
+
+import fakeredis
+import pytest
+
+from services import bulk_operation_service
+from services.bulk_operation_service import BulkOperationError, BulkOperationService
+from services.rate_limiter import ShopRateLimiter
+from fake_shopify import FakeBulkShop
+
+PRODUCT_LINES = [
+    {'id': 'gid://shopify/Product/1', 'title': 'Shirt', 'descriptionHtml': '<p>Soft</p>', 'tags': ['a', 'b'],
+     'status': 'ACTIVE'},
+    {'id': 'gid://shopify/ProductVariant/11', 'sku': 'S', 'price': '10.00', '__parentId': 'gid://shopify/Product/1'},
+    {'id': 'gid://shopify/ProductVariant/12', 'sku': 'M', 'price': '11.00', '__parentId': 'gid://shopify/Product/1'},
+    {'id': 'gid://shopify/Metafield/91', 'namespace': 'custom', 'key': 'fabric', 'value': 'cotton',
+     '__parentId': 'gid://shopify/Product/1'},
+    {'id': 'gid://shopify/Product/2', 'title': 'Hat', 'descriptionHtml': '', 'tags': [], 'status': 'DRAFT'},
+]
+
+
+@pytest.fixture
+def service(monkeypatch):
+    limiter = ShopRateLimiter('shop.myshopify.com', 'graphql', client=fakeredis.FakeRedis(decode_responses=True))
+    return BulkOperationService('shop.myshopify.com', 'token', poll_interval=0, timeout=60, limiter=limiter)
+
+
+def test_iter_records_runs_query_and_reassembles_rest_shaped_records(monkeypatch, service):
+    shop = FakeBulkShop(PRODUCT_LINES, polls_until_done=3)
+    shop.install(monkeypatch, service)
+    
+    records = list(service.iter_records('products', {'status': 'active'}))
+    
+    assert [record['id'] for record in records] == [1, 2]
+    assert records[0]['body_html'] == '<p>Soft</p>'
+    assert records[0]['tags'] == 'a, b'
+    assert [variant['id'] for variant in records[0]['variants']] == [11, 12]
+    assert records[0]['Metafield:custom[fabric]'] == 'cotton'
+    assert "status:'active'" in shop.submissions[0]['query']
+
+
+def test_run_query_waits_for_a_running_bulk_query(monkeypatch, service):
+    shop = FakeBulkShop(PRODUCT_LINES, busy=2)
+    shop.install(monkeypatch, service)
+    
+    operation_id = service.run_query(service.build_query('products'))
+    
+    assert operation_id in shop.operations
+    assert len(shop.submissions) == 3
+
+
+def test_run_query_gives_up_on_a_busy_shop_after_the_timeout(monkeypatch, service):
+    FakeBulkShop(busy=1).install(monkeypatch, service)
+    service.timeout = 0
+    
+    with pytest.raises(BulkOperationError, match='already in progress'):
+        service.run_query(service.build_query('products'))
+
+
+def test_run_query_raises_other_user_errors(monkeypatch, service):
+    def rejected(query, variables):
+        return {'data': {'bulkOperationRunQuery': {'userErrors': [{'field': ['query'], 'message': 'Invalid query'}]}}}
+    monkeypatch.setattr(service, '_post', rejected)
+    
+    with pytest.raises(BulkOperationError, match='Invalid query'):
+        service.run_query('{ nope }')
+
+
+def test_failed_operation_raises(monkeypatch, service):
+    FakeBulkShop(PRODUCT_LINES, final_status='FAILED').install(monkeypatch, service)
+    
+    with pytest.raises(BulkOperationError, match='failed'):
+        list(service.iter_records('products'))
+
+
+def test_build_query_projects_rest_fields():
+    query = BulkOperationService('shop.myshopify.com', 'token', limiter=object()).build_query(
+        'products', fields=['title', 'body_html'], include_metafields=False
+    )
+    
+    assert 'descriptionHtml' in query and 'title' in query and 'id' in query
+    assert 'vendor' not in query and 'variants' not in query and 'metafields' not in query
+
+
+def test_run_bulk_mutation_splits_inputs_and_keeps_positions(monkeypatch, service):
+    shop = FakeBulkShop()
+    shop.install(monkeypatch, service)
+    monkeypatch.setattr(bulk_operation_service, 'BULK_MUTATION_MAX_BYTES', 120)
+    inputs = [{'input': {'handle': f'product-{i}', 'title': f'Product {i}'}} for i in range(5)]
+    submitted = {}
+    
+    results = list(service.run_bulk_mutation('mutation', inputs, on_submit=submitted.__setitem__))
+    
+    assert [position for position, _ in results] == [0, 1, 2, 3, 4]
+    assert len(submitted) == len(shop.staged) > 1
+    assert [variables for batch in shop.staged.values() for variables in batch] == inputs
+
+
+def test_run_bulk_mutation_resumes_submitted_operations(monkeypatch, service):
+    shop = FakeBulkShop()
+    shop.install(monkeypatch, service)
+    monkeypatch.setattr(bulk_operation_service, 'BULK_MUTATION_MAX_BYTES', 120)
+    inputs = [{'input': {'handle': f'product-{i}', 'title': f'Product {i}'}} for i in range(5)]
+    first_run = {}
+    
+    stream = service.run_bulk_mutation('mutation', inputs, on_submit=first_run.__setitem__)
+    next(stream)
+    stream.close()
+    resumed = {}
+    results = list(service.run_bulk_mutation('mutation', inputs, submitted=first_run, on_submit=resumed.__setitem__))
+    
+    assert list(first_run) == [0]
+    assert 0 not in resumed and len(resumed) == len(shop.staged) - 1
+    assert [position for position, _ in results] == [0, 1, 2, 3, 4]
+
+
+def test_run_mutation_waits_for_a_running_bulk_mutation(monkeypatch, service):
+    shop = FakeBulkShop(busy=1)
+    shop.install(monkeypatch, service)
+    
+    results = list(service.run_bulk_mutation('mutation', [{'input': {'title': 'A'}}]))
+    
+    assert [position for position, _ in results] == [0]
+    assert len(shop.submissions) == 2
+
+
+def test_variable_files_are_removed(monkeypatch, service):
+    FakeBulkShop().install(monkeypatch, service)
+    paths = []
+    write_files = service._write_variable_files
+    
+    def tracked(variables):
+        for path, count in write_files(variables):
+            paths.append(path)
+            yield path, count
+    monkeypatch.setattr(service, '_write_variable_files', tracked)
+    
+    list(service.run_bulk_mutation('mutation', [{'input': {'title': 'A'}}]))
+    
+    assert paths and not any(os.path.exists(path) for path in paths)
@@ -0,0 +1,70 @@
+from decimal import Decimal
+from io import BytesIO
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from services.columnar_writer import ColumnarWriter
+
+PRODUCTS = [
+    {'id': 1, 'admin_graphql_api_id': 'gid://shopify/Product/1', 'title': 'Shirt', 'weight': 1,
+     'price': '19.99', 'variant_ids': [11, 12], 'taxable': True, 'updated_at': '2024-01-01T00:00:00Z'},
+    {'id': 2, 'admin_graphql_api_id': 'gid://shopify/Product/2', 'title': 'Hat', 'weight': 1.5,
+     'price': None, 'variant_ids': [], 'taxable': False, 'updated_at': None},
+]
+
+
+def read(format_type, content):
+    if format_type == 'parquet':
+        return pq.read_table(BytesIO(content))
+    return pa.ipc.open_file(BytesIO(content)).read_all()
+
+
+@pytest.mark.parametrize('format_type', ['parquet', 'feather'])
+def test_gid_and_mixed_number_columns_keep_every_value(format_type):
+    output = BytesIO()
+    
+    ColumnarWriter.write_stream([PRODUCTS], output, format_type)
+    
+    table = read(format_type, output.getvalue())
+    assert table.schema.field('id').type == pa.int64()
+    assert table.schema.field('admin_graphql_api_id').type == pa.string()
+    assert table.schema.field('weight').type == pa.float64()
+    assert table.column('admin_graphql_api_id').to_pylist() == ['gid://shopify/Product/1', 'gid://shopify/Product/2']
+    assert table.column('weight').to_pylist() == [1.0, 1.5]
+    assert table.column('price').to_pylist() == [Decimal('19.9900'), None]
+    assert table.column('variant_ids').to_pylist() == ['[11, 12]', '[]']
+
+
+def test_types_are_inferred_from_the_whole_first_row_group():
+    pages = [[{'id': 1, 'quantity': 1, 'order_id': 'draft'}], [{'id': 2, 'quantity': 2.5, 'order_id': 7}]]
+    output = BytesIO()
+    
+    ColumnarWriter.write_stream(pages, output, 'parquet', row_group_size=10)
+    
+    table = pq.read_table(BytesIO(output.getvalue()))
+    assert table.column('quantity').to_pylist() == [1.0, 2.5]
+    assert table.column('order_id').to_pylist() == ['draft', '7']
+
+
+def test_a_later_value_that_does_not_fit_raises_instead_of_writing_null():
+    pages = [[{'id': 1, 'quantity': 1}], [{'id': 2, 'quantity': 1.5}]]
+    
+    with pytest.raises(ValueError, match='quantity'):
+        ColumnarWriter.write_stream(pages, BytesIO(), 'parquet', row_group_size=1)
+
+
+def test_flattened_columns_are_typed_by_their_leaf():
+    rows = [{'variants.price': '10.00', 'line_items.id': 5, 'line_items.admin_graphql_api_id': 'gid://shopify/LineItem/5'}]
+    
+    schema, _ = ColumnarWriter.compile_schema(rows)
+    
+    assert [field.type for field in schema] == [pa.decimal128(18, 4), pa.int64(), pa.string()]
+
+
+def test_empty_export_writes_the_requested_columns():
+    output = BytesIO()
+    
+    assert ColumnarWriter.write_stream([[]], output, 'parquet', ['id', 'title']) == 0
+    assert pq.read_table(BytesIO(output.getvalue())).column_names == ['id', 'title']
@@ -0,0 +1,132 @@
+from io import BytesIO
+
+import pytest
+
+from fake_s3 import FakeS3
+from services.entity_service import EntityService
+from services.export_checkpoint import ExportCheckpoint
+from services.file_processor import FileProcessor
+from services.rate_limiter import ShopRateLimiter
+from services.s3_stream import export_upload
+from tasks import entity_tasks
+
+SHOP = 'shop.myshopify.com'
+
+
+class Record(dict):
+    def to_dict(self):
+        return dict(self)
+
+
+class Progress:
+    processed = 0
+    
+    def advance(self, count):
+        self.processed += count
+
+
+class Page(list):
+    """A REST page whose next_page serves the following one"""
+    
+    def __init__(self, pages, number):
+        super().__init__(Record(record) for record in pages[number])
+        self.pages, self.number = pages, number
+        self.next_page_url = f'https://{SHOP}/admin/api/products.json?page_info={number + 1}'
+    
+    def has_next_page(self):
+        return self.number + 1 < len(self.pages)
+    
+    def next_page(self, no_cache=False):
+        return Page(self.pages, self.number + 1)
+
+
+@pytest.fixture
+def service(monkeypatch, backends):
+    """An EntityService over REST pages of ``service.pages`` whose metafield lookups land in ``service.lookups``"""
+    service = EntityService(SHOP, 'token')
+    service.pages, service.lookups, service.metafields = [], [], {}
+    
+    class Products:
+        @staticmethod
+        def find(**params):
+            return Page(service.pages, 0)
+    
+    def get_owner_metafields(entity, owner_ids):
+        service.lookups.append(owner_ids)
+        return [(owner_id, *metafield) for owner_id in owner_ids for metafield in service.metafields.get(owner_id, [])]
+    
+    monkeypatch.setattr(ShopRateLimiter, '_last_response_headers', staticmethod(lambda: {}))
+    monkeypatch.setattr(service, 'paginated_resource', lambda entity, filters, fields=None: (Products, dict(filters)))
+    monkeypatch.setattr(service, 'get_owner_metafields', get_owner_metafields)
+    return service
+
+
+def test_metafield_exports_pick_the_bulk_query_unless_rest_is_asked_for(service, monkeypatch):
+    monkeypatch.setattr(service, 'count_records', lambda entity, filters: pytest.fail('no count needed'))
+    
+    assert entity_tasks.should_use_bulk_export(service, 'products', {'include_metafields': True}, {})
+    assert not entity_tasks.should_use_bulk_export(
+        service, 'products', {'include_metafields': True, 'export_strategy': 'rest'}, {}
+    )
+
+
+def test_rest_metafield_pages_stream_one_lookup_per_page(service):
+    service.pages = [[{'id': 1, 'title': 'Hat'}, {'id': 2, 'title': 'Scarf'}], [{'id': 3, 'title': 'Coat'}]]
+    service.metafields = {1: [('custom', 'fabric', 'wool')], 3: [('custom', 'care', 'dry clean')]}
+    
+    pages = entity_tasks.iter_export_pages(service, SHOP, 'token', 'products', {}, True, False)
+    
+    first = next(pages)
+    assert service.lookups == [[1, 2]]
+    assert first[0]['Metafield:custom[fabric]'] == 'wool'
+    assert [page[0]['id'] for page in pages] == [3]
+    assert service.lookups == [[1, 2], [3]]
+
+
+def test_streamed_header_includes_metafields_first_seen_on_a_later_page(service):
+    service.pages = [[{'id': 1, 'title': 'Hat'}], [{'id': 2, 'title': 'Coat'}]]
+    service.metafields = {2: [('custom', 'care', 'dry clean')]}
+    output = BytesIO()
+    
+    pages = entity_tasks.iter_export_pages(service, SHOP, 'token', 'products', {}, True, False)
+    with entity_tasks.spool_metafield_pages(pages) as (columns, pages):
+        assert FileProcessor.write_csv_stream(pages, output, columns) == 2
+    
+    assert output.getvalue().decode().splitlines() == [
+        'id,title,Metafield:custom[care]', '1,Hat,', '2,Coat,dry clean'
+    ]
+
+
+def test_projected_metafield_export_keeps_the_projection_first(service):
+    service.pages = [[{'id': 1, 'title': 'Hat', 'vendor': 'Acme'}]]
+    service.metafields = {1: [('custom', 'fabric', 'wool')]}
+    
+    pages = entity_tasks.iter_export_pages(service, SHOP, 'token', 'products', {}, True, False, ['id', 'title'])
+    with entity_tasks.spool_metafield_pages(pages, ['title']) as (columns, pages):
+        records = [record for page in pages for record in page]
+    
+    assert columns == ['title', 'Metafield:custom[fabric]']
+    assert records[0]['Metafield:custom[fabric]'] == 'wool'
+
+
+def test_export_hands_off_at_its_time_budget_and_the_continuation_finishes_the_file(service, backends, monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(entity_tasks, 's3_client', s3)
+    service.pages = [[{'id': 1, 'title': 'Hat'}], [{'id': 2, 'title': 'Scarf'}], [{'id': 3, 'title': 'Coat'}]]
+    job_id = str(backends.db.jobs.insert_one({'status': 'processing'}).inserted_id)
+    upload = export_upload('text/csv', None, 'file')
+    key = f'exports/{SHOP}/products.csv'
+    
+    handed_off = ExportCheckpoint(job_id, budget=0)
+    assert entity_tasks.run_checkpointed_csv_export(Progress(), service, 'products', {}, key, upload, handed_off) is None
+    assert key not in s3.objects
+    
+    continuation = ExportCheckpoint.load(job_id)
+    assert (continuation.resuming, continuation.records) == (True, 1)
+    assert continuation.cursor.endswith('page_info=1')
+    # The fake find serves page 0 whatever the cursor, so drop the page the first task already wrote
+    service.pages = service.pages[1:]
+    
+    assert entity_tasks.run_checkpointed_csv_export(Progress(), service, 'products', {}, key, upload, continuation) == 3
+    assert s3.objects[key].decode().splitlines() == ['id,title', '1,Hat', '2,Scarf', '3,Coat']
+    assert f'checkpoints/{key}' in s3.deleted
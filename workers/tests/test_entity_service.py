@@ -0,0 +1,46 @@
+import pytest
+
+from services.entity_service import EntityService
+
+SHOP = 'shop.myshopify.com'
+
+
+@pytest.fixture
+def service(backends):
+    return EntityService(SHOP, 'token')
+
+
+def test_fan_out_yields_children_in_parent_order(service):
+    parents = [{'id': number} for number in range(10)]
+    
+    results = list(service.fan_out(parents, lambda parent: [parent['id'] * 10], 'children'))
+    
+    assert results == [(parent, [parent['id'] * 10]) for parent in parents]
+
+
+def test_fan_out_raises_when_a_parent_fails(service):
+    def children(parent):
+        if parent['id'] == 3:
+            raise ConnectionError('connection reset')
+        return [parent['id']]
+    
+    results = []
+    with pytest.raises(ConnectionError):
+        for parent, rows in service.fan_out([{'id': number} for number in range(6)], children, 'children'):
+            results.append(parent['id'])
+    
+    assert results == [0, 1, 2]
+
+
+def test_blog_posts_fail_instead_of_dropping_a_blog(service, monkeypatch):
+    def fetch_paginated(resource_class, params=None, limit=250, strict=False):
+        if resource_class.__name__ == 'Blog':
+            return [{'id': 1, 'handle': 'news'}, {'id': 2, 'handle': 'guides'}]
+        if params['blog_id'] == 2:
+            raise ConnectionError('connection reset')
+        return [{'id': 10, 'title': 'Launch'}]
+    
+    monkeypatch.setattr(service, 'fetch_paginated', fetch_paginated)
+    
+    with pytest.raises(ConnectionError):
+        service.get_blog_posts()
@@ -0,0 +1,180 @@
+import copy
+from io import BytesIO
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from services.export_service import ExportService
+
+PRODUCTS = [
+    {
+        'id': 101, 'title': 'Shirt', 'handle': 'shirt', 'body_html': '<p>Soft, "cotton"</p>', 'vendor': 'Acme',
+        'product_type': 'Tops', 'tags': 'a, b', 'published_at': '2024-01-02T10:00:00Z', 'status': 'active',
+        'variants': [
+            {'id': 1001, 'sku': 'SH-S', 'price': '19.99', 'compare_at_price': '24.99', 'barcode': '0123',
+             'inventory_quantity': 5, 'weight': 0.2, 'weight_unit': 'kg'},
+            {'id': 1002, 'sku': 'SH-M', 'price': '19.99', 'compare_at_price': None, 'barcode': None,
+             'inventory_quantity': -1, 'weight': 0.25, 'weight_unit': 'kg'},
+        ],
+    },
+    {
+        'id': 102, 'title': 'Gift card', 'handle': 'gift-card', 'body_html': None, 'vendor': 'Acme',
+        'product_type': '', 'tags': '', 'published_at': None, 'status': 'draft',
+        'variants': [
+            {'id': 1003, 'sku': '', 'price': '50.00', 'compare_at_price': None, 'barcode': None,
+             'inventory_quantity': 0, 'weight': 0.0, 'weight_unit': 'lb'},
+        ],
+    },
+]
+
+CUSTOMERS = [
+    {
+        'id': 201, 'email': 'ann@example.com', 'first_name': 'Ann', 'last_name': 'Lee', 'phone': '+15550100',
+        'default_address': {'address1': '1 Main St', 'address2': None, 'city': 'Springfield', 'province': 'IL',
+                            'zip': '62701', 'country': 'United States'},
+        'total_spent': '120.50', 'orders_count': 3, 'state': 'enabled', 'tags': 'vip', 'created_at': '2023-05-01',
+    },
+    {
+        'id': 202, 'email': 'bob@example.com', 'first_name': 'Bob', 'last_name': 'Stone', 'phone': None,
+        'total_spent': '0.00', 'orders_count': 0, 'state': 'disabled', 'tags': '', 'created_at': '2023-06-01',
+    },
+]
+
+ORDERS = [
+    {
+        'id': 301, 'order_number': 1001, 'email': 'ann@example.com', 'created_at': '2024-02-01T09:00:00Z',
+        'total_price': '44.98', 'subtotal_price': '39.98', 'total_tax': '5.00', 'currency': 'USD',
+        'financial_status': 'paid', 'fulfillment_status': None,
+        'customer': {'id': 201, 'first_name': 'Ann', 'last_name': 'Lee'},
+        'shipping_address': {'address1': '1 Main St', 'city': 'Springfield', 'province': 'Illinois',
+                             'country': 'United States', 'zip': '62701'},
+    },
+    {
+        'id': 302, 'order_number': 1002, 'email': '', 'created_at': '2024-02-02T09:00:00Z',
+        'total_price': '50.00', 'subtotal_price': '50.00', 'total_tax': '0.00', 'currency': 'EUR',
+        'financial_status': 'pending', 'fulfillment_status': 'fulfilled',
+        'customer': {'id': 202, 'first_name': 'Bob', 'last_name': 'Stone'}, 'shipping_address': None,
+    },
+]
+
+
+class LegacyExportService:
+    """ExportService's CSV methods before RecordFlattener, as the regression oracle"""
+    
+    @staticmethod
+    def to_csv(rows: List[Dict[str, Any]]) -> bytes:
+        buffer = BytesIO()
+        pd.DataFrame(rows).to_csv(buffer, index=False, encoding='utf-8')
+        return buffer.getvalue()
+    
+    @staticmethod
+    def products_to_csv(products):
+        rows = []
+        for product in products:
+            base_row = {
+                'Product ID': product.get('id', ''),
+                'Title': product.get('title', ''),
+                'Handle': product.get('handle', ''),
+                'Body HTML': product.get('body_html', ''),
+                'Vendor': product.get('vendor', ''),
+                'Product Type': product.get('product_type', ''),
+                'Tags': product.get('tags', ''),
+                'Published': product.get('published_at', '') is not None,
+                'Status': product.get('status', ''),
+            }
+            for variant in product.get('variants', []):
+                row = base_row.copy()
+                row.update({
+                    'Variant ID': variant.get('id', ''),
+                    'SKU': variant.get('sku', ''),
+                    'Price': variant.get('price', ''),
+                    'Compare At Price': variant.get('compare_at_price', ''),
+                    'Barcode': variant.get('barcode', ''),
+                    'Inventory Quantity': variant.get('inventory_quantity', 0),
+                    'Weight': variant.get('weight', ''),
+                    'Weight Unit': variant.get('weight_unit', ''),
+                })
+                rows.append(row)
+        return LegacyExportService.to_csv(rows)
+    
+    @staticmethod
+    def customers_to_csv(customers):
+        rows = []
+        for customer in customers:
+            default_address = customer.get('default_address', {}) or {}
+            rows.append({
+                'Customer ID': customer.get('id', ''),
+                'Email': customer.get('email', ''),
+                'First Name': customer.get('first_name', ''),
+                'Last Name': customer.get('last_name', ''),
+                'Phone': customer.get('phone', ''),
+                'Address 1': default_address.get('address1', ''),
+                'Address 2': default_address.get('address2', ''),
+                'City': default_address.get('city', ''),
+                'Province': default_address.get('province', ''),
+                'Zip': default_address.get('zip', ''),
+                'Country': default_address.get('country', ''),
+                'Total Spent': customer.get('total_spent', 0),
+                'Orders Count': customer.get('orders_count', 0),
+                'State': customer.get('state', ''),
+                'Tags': customer.get('tags', ''),
+                'Created At': customer.get('created_at', ''),
+            })
+        return LegacyExportService.to_csv(rows)
+    
+    @staticmethod
+    def orders_to_csv(orders):
+        rows = []
+        for order in orders:
+            shipping_address = order.get('shipping_address', {}) or {}
+            rows.append({
+                'Order ID': order.get('id', ''),
+                'Order Number': order.get('order_number', ''),
+                'Email': order.get('email', ''),
+                'Created At': order.get('created_at', ''),
+                'Total Price': order.get('total_price', 0),
+                'Subtotal Price': order.get('subtotal_price', 0),
+                'Total Tax': order.get('total_tax', 0),
+                'Currency': order.get('currency', ''),
+                'Financial Status': order.get('financial_status', ''),
+                'Fulfillment Status': order.get('fulfillment_status', ''),
+                'Customer Name': f"{order.get('customer', {}).get('first_name', '')} {order.get('customer', {}).get('last_name', '')}",
+                'Shipping Address 1': shipping_address.get('address1', ''),
+                'Shipping City': shipping_address.get('city', ''),
+                'Shipping Province': shipping_address.get('province', ''),
+                'Shipping Country': shipping_address.get('country', ''),
+                'Shipping Zip': shipping_address.get('zip', ''),
+            })
+        return LegacyExportService.to_csv(rows)
+
+
+def test_products_to_csv_matches_legacy_export():
+    assert ExportService.products_to_csv(PRODUCTS) == LegacyExportService.products_to_csv(PRODUCTS)
+
+
+def test_customers_to_csv_matches_legacy_export():
+    assert ExportService.customers_to_csv(CUSTOMERS) == LegacyExportService.customers_to_csv(CUSTOMERS)
+
+
+def test_orders_to_csv_matches_legacy_export():
+    assert ExportService.orders_to_csv(ORDERS) == LegacyExportService.orders_to_csv(ORDERS)
+
+
+def test_products_without_variants_keep_one_row():
+    products = copy.deepcopy(PRODUCTS[:1])
+    products[0]['variants'] = []
+    
+    lines = ExportService.products_to_csv(products).decode('utf-8').splitlines()
+    
+    assert len(lines) == 2
+    assert lines[1].startswith('101,Shirt,shirt,')
+    assert lines[1].endswith(',True,active,,,,,,0,,')
+
+
+def test_orders_without_customer_export_blank_name():
+    orders = copy.deepcopy(ORDERS[:1])
+    orders[0]['customer'] = None
+    
+    rows = list(pd.read_csv(BytesIO(ExportService.orders_to_csv(orders)), keep_default_na=False)['Customer Name'])
+    
+    assert rows == ['']
@@ -0,0 +1,94 @@
+import csv
+from io import BytesIO, StringIO
+
+import pytest
+from bson import ObjectId
+
+from tasks import export_tasks
+
+SHOP = 'shop.myshopify.com'
+
+
+class Upload(BytesIO):
+    """Records every write so a test can see the CSV arrive page by page"""
+    
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+    
+    def write(self, data):
+        self.writes.append(bytes(data))
+        return super().write(data)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+
+
+class S3:
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return f"https://s3.example.com/{Params['Key']}"
+
+
+@pytest.fixture
+def export(monkeypatch, backends, task):
+    """Runs an export task over ``export.pages``; ``export.upload`` holds what was written"""
+    class Export:
+        pages = []
+        upload = Upload()
+    
+    class Shopify:
+        def __init__(self, shop, access_token):
+            pass
+        
+        def __enter__(self):
+            return self
+        
+        def __exit__(self, *exc):
+            return False
+        
+        def iter_pages(self, *args, **kwargs):
+            for page in Export.pages:
+                yield [dict(record) for record in page]
+        
+        iter_products = iter_customers = iter_orders = iter_pages
+    
+    def run(name):
+        job_id = str(backends.db.jobs.insert_one({'status': 'pending'}).inserted_id)
+        exporter = getattr(export_tasks, name)
+        monkeypatch.setattr(exporter, 'update_state', task.update_state)
+        exporter.run(job_id, SHOP, 'token', {})
+        return backends.db.jobs.find_one({'_id': ObjectId(job_id)})
+    
+    monkeypatch.setattr(export_tasks, 'ShopifyService', Shopify)
+    monkeypatch.setattr(export_tasks, 's3_client', S3())
+    monkeypatch.setattr(export_tasks, 'open_upload', lambda client, bucket, key, upload: Export.upload)
+    Export.run = staticmethod(run)
+    return Export
+
+
+def test_products_are_written_page_by_page(export):
+    export.pages = [
+        [{'id': 1, 'title': 'Hat', 'variants': [{'id': 11, 'sku': 'H-S'}, {'id': 12, 'sku': 'H-M'}]}],
+        [{'id': 2, 'title': 'Coat', 'variants': [{'id': 21, 'sku': 'C-L'}]}],
+    ]
+    
+    job = export.run('export_products')
+    
+    rows = list(csv.DictReader(StringIO(export.upload.getvalue().decode())))
+    assert [(row['Product ID'], row['SKU']) for row in rows] == [('1', 'H-S'), ('1', 'H-M'), ('2', 'C-L')]
+    assert len(export.upload.writes) == 2
+    assert (job['status'], job['total_records']) == ('completed', 2)
+
+
+@pytest.mark.parametrize('name, column', [('export_customers', 'Customer ID'), ('export_orders', 'Order ID')])
+def test_customers_and_orders_count_every_page(export, name, column):
+    export.pages = [[{'id': 1}, {'id': 2}], [{'id': 3}]]
+    
+    job = export.run(name)
+    
+    rows = list(csv.DictReader(StringIO(export.upload.getvalue().decode())))
+    assert [row[column] for row in rows] == ['1', '2', '3']
+    assert job['total_records'] == 3
@@ -0,0 +1,94 @@
+from io import BytesIO
+
+import openpyxl
+import pandas as pd
+import xlsxwriter
+
+from services.file_processor import FileProcessor, EXCEL_HEADER_FORMAT, EXCEL_CELL_FORMAT
+
+ROWS = [
+    {'id': 1, 'title': 'Shirt', 'price': 19.99, 'taxable': True, 'tags': 'a, b'},
+    {'id': 2, 'title': 'Hat', 'price': 5.0, 'taxable': False, 'tags': None},
+    {'id': 3, 'title': '', 'price': float('nan'), 'taxable': None},
+    {'id': 4, 'title': 'Multi\nline', 'price': 0, 'taxable': True, 'tags': 'x', 'extra': 'ignored'},
+]
+
+
+def legacy_write_excel(data, columns=None):
+    """write_excel as it was before the constant_memory writer"""
+    output = BytesIO()
+    df = pd.DataFrame(data)
+    if columns:
+        df = df[[col for col in columns if col in df.columns]]
+    df = df.fillna('')
+    
+    workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    worksheet = workbook.add_worksheet()
+    header_format = workbook.add_format(EXCEL_HEADER_FORMAT)
+    cell_format = workbook.add_format(EXCEL_CELL_FORMAT)
+    for col_num, column in enumerate(df.columns):
+        worksheet.write(0, col_num, column, header_format)
+    for row_num, row_data in enumerate(df.values, start=1):
+        for col_num, cell_value in enumerate(row_data):
+            worksheet.write(row_num, col_num, cell_value, cell_format)
+    workbook.close()
+    return output.getvalue()
+
+
+def sheet_values(content):
+    workbook = openpyxl.load_workbook(BytesIO(content))
+    return [list(row) for row in workbook.worksheets[0].iter_rows(values_only=True)]
+
+
+def test_write_excel_matches_legacy_writer():
+    columns = ['id', 'title', 'price', 'taxable', 'tags']
+    
+    assert sheet_values(FileProcessor.write_excel(ROWS, columns)) == sheet_values(legacy_write_excel(ROWS, columns))
+
+
+def test_write_excel_stream_takes_columns_from_sample():
+    output = BytesIO()
+    
+    count = FileProcessor.write_excel_stream(iter(ROWS), output)
+    
+    values = sheet_values(output.getvalue())
+    assert count == len(ROWS)
+    assert values[0] == ['id', 'title', 'price', 'taxable', 'tags', 'extra']
+    assert values[4] == [4, 'Multi\nline', 0, True, 'x', 'ignored']
+
+
+def test_write_multi_sheet_excel_stream_writes_each_sheet():
+    output = BytesIO()
+    
+    count = FileProcessor.write_multi_sheet_excel_stream(
+        {'products': iter(ROWS), 'empty': iter([])}, output, {'empty': ['id']}
+    )
+    
+    workbook = openpyxl.load_workbook(BytesIO(output.getvalue()))
+    assert count == len(ROWS)
+    assert workbook.sheetnames == ['products', 'empty']
+    assert [row for row in workbook['empty'].iter_rows(values_only=True)] == [('id',)]
+
+
+def excel_fixture():
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['Handle', 'Title', 'Price', 'Inventory Quantity', 'Taxable', None])
+    sheet.append(['shirt', 'Shirt', 19.99, 5, True, 'note'])
+    sheet.append(['shirt', None, 21.0, 3.0, False, None])
+    sheet.append([None, None, None, None, None, None])
+    sheet.append(['hat', 'Hat', 5, None, True])
+    sheet.append(['scarf', 'Scarf, wool', 12.5, 0, None, None])
+    output = BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def test_iter_excel_batches_matches_read_excel():
+    content = excel_fixture()
+    expected = pd.read_excel(BytesIO(content)).dropna(how='all').reset_index(drop=True).fillna('')
+    
+    batches = list(FileProcessor.iter_excel_batches(BytesIO(content), 2))
+    
+    assert [len(batch) for batch in batches] == [2, 2]
+    pd.testing.assert_frame_equal(FileProcessor.collect_batches(batches), expected)
@@ -0,0 +1,143 @@
+import pandas as pd
+
+from services.import_service import ImportService
+
+PRODUCTS_CSV = b"""Title,Body HTML,Vendor,Product Type,Tags,SKU,Price,Inventory Quantity,Compare At Price,Barcode
+Shirt,<p>Soft</p>,Acme,Tops,"a, b",SH-1,19.99,5,24.99,0123
+,<p>No title</p>,Acme,Tops,,SH-2,9.5,1,,
+Hat,,,,,,,,,
+Scarf,<b>Warm</b>,Knit Co,Accessories,winter,SC-1,12,,15,4006381333931
+Socks,,Acme,,,SO-1,3.0,120,,
+"""
+
+CUSTOMERS_CSV = b"""Email,First Name,Last Name,Phone,Address 1,Address 2,City,Province,Zip,Country
+ann@example.com,Ann,Lee,+15550100,1 Main St,,Springfield,IL,62701,US
+,Bob,Stone,,,,,,,
+cy@example.com,Cy,,,,,,,,
+dee@example.com,,,,,,Paris,,75001,
+"""
+
+
+def legacy_transform(df, validate, convert):
+    """The per-row iterrows loop import_products/import_customers ran before"""
+    payloads, errors = [], []
+    for index, row in df.iterrows():
+        valid, error_msg = validate(row)
+        if not valid:
+            errors.append(f"Row {index + 2}: {error_msg}")
+            continue
+        try:
+            payloads.append((index, convert(row)))
+        except Exception as e:
+            errors.append(f"Row {index + 2}: {str(e)}")
+    return payloads, errors
+
+
+def test_transform_products_matches_row_wise_conversion():
+    df = ImportService.parse_csv(PRODUCTS_CSV)
+    
+    expected = legacy_transform(df, ImportService.validate_product_row, ImportService.row_to_product)
+    
+    assert ImportService.transform_products(df) == expected
+    assert expected[1] == ['Row 3: Missing required field: Title']
+
+
+def test_transform_products_without_optional_columns():
+    df = pd.DataFrame({'Title': ['A', 'B']})
+    
+    expected = legacy_transform(df, ImportService.validate_product_row, ImportService.row_to_product)
+    
+    assert ImportService.transform_products(df) == expected
+
+
+def test_transform_products_reports_unparseable_quantity():
+    df = pd.DataFrame({'Title': ['A', 'B', None], 'Inventory Quantity': ['3', 'lots', 'x']})
+    
+    payloads, errors = ImportService.transform_products(df)
+    
+    assert [index for index, _ in payloads] == [0]
+    assert payloads[0][1]['variants'][0]['inventory_quantity'] == 3
+    assert errors == ['Row 3: Invalid Inventory Quantity', 'Row 4: Missing required field: Title']
+
+
+def test_transform_customers_matches_row_wise_conversion():
+    df = ImportService.parse_csv(CUSTOMERS_CSV)
+    
+    expected = legacy_transform(df, ImportService.validate_customer_row, ImportService.row_to_customer)
+    
+    assert ImportService.transform_customers(df) == expected
+
+
+def test_product_set_inputs_group_variant_rows_by_handle():
+    df = pd.DataFrame({
+        'Handle': ['shirt', '', '', 'hat'],
+        'Title': ['Shirt', '', '', 'Hat'],
+        'Option1 Name': ['Size', '', '', ''],
+        'Option1 Value': ['S', 'M', 'L', ''],
+        'Variant SKU': ['SH-S', 'SH-M', 'SH-L', 'HAT'],
+        'Variant Price': ['10.00', '11.00', '12.00', '5.00'],
+        'Command': ['NEW', '', '', 'NEW'],
+    })
+    
+    inputs, errors = ImportService.transform_product_set_inputs(df, 'NEW')
+    
+    assert errors == []
+    assert [indexes for indexes, _ in inputs] == [[0, 1, 2], [3]]
+    shirt, hat = (product_input for _, product_input in inputs)
+    assert [variant['optionValues'] for variant in shirt['variants']] == [
+        [{'optionName': 'Size', 'name': size}] for size in ['S', 'M', 'L']
+    ]
+    assert shirt['productOptions'] == [{'name': 'Size', 'values': [{'name': 'S'}, {'name': 'M'}, {'name': 'L'}]}]
+    assert hat['variants'] == [{'price': '5.00', 'inventoryItem': {'sku': 'HAT'},
+                                'optionValues': [{'optionName': 'Title', 'name': 'Default Title'}]}]
+
+
+def test_product_set_update_carries_every_variant_of_the_product():
+    df = pd.DataFrame({
+        'id': [101, '', ''],
+        'Handle': ['shirt', 'shirt', 'shirt'],
+        'Option1 Name': ['Size', '', ''],
+        'Option1 Value': ['S', 'M', 'L'],
+        'Option2 Name': ['Color', '', ''],
+        'Option2 Value': ['Red', 'Red', 'Blue'],
+        'Variant Price': ['10.00', '11.00', '12.00'],
+        'Command': ['UPDATE', 'UPDATE', 'UPDATE'],
+    })
+    
+    inputs, errors = ImportService.transform_product_set_inputs(df)
+    
+    assert errors == [] and len(inputs) == 1
+    product_input = inputs[0][1]
+    assert product_input['id'] == 'gid://shopify/Product/101'
+    assert [variant['price'] for variant in product_input['variants']] == ['10.00', '11.00', '12.00']
+    assert product_input['variants'][2]['optionValues'] == [
+        {'optionName': 'Size', 'name': 'L'}, {'optionName': 'Color', 'name': 'Blue'}
+    ]
+    assert product_input['productOptions'][1] == {'name': 'Color', 'values': [{'name': 'Red'}, {'name': 'Blue'}]}
+
+
+def test_product_set_rows_without_variant_columns_leave_variants_alone():
+    df = pd.DataFrame({'id': [101], 'Title': ['Renamed'], 'Tags': ['a, b']})
+    
+    inputs, _ = ImportService.transform_product_set_inputs(df)
+    
+    assert inputs[0][1] == {'id': 'gid://shopify/Product/101', 'title': 'Renamed', 'tags': ['a', 'b']}
+
+
+def test_product_set_inputs_report_unconvertible_products():
+    df = pd.DataFrame({
+        'Handle': ['a', 'a', 'b', 'c', 'c'],
+        'Title': ['A', '', '', 'C', ''],
+        'Option1 Name': ['Size', '', '', '', ''],
+        'Option1 Value': ['S', '', '', '', ''],
+        'Variant Price': ['1', '2', '3', '4', '5'],
+    })
+    
+    inputs, errors = ImportService.transform_product_set_inputs(df, 'NEW')
+    
+    assert inputs == []
+    assert [(ImportService.row_label(indexes), message) for indexes, message in errors] == [
+        ('Rows 2-3', 'Every variant row needs a value for Size'),
+        ('Row 4', 'Missing required field: Title'),
+        ('Rows 5-6', 'Several variant rows need Option1 Name and Option1 Value columns'),
+    ]
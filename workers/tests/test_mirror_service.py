@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+
+from services import mirror_service
+from services.mirror_service import MirrorService
+from tasks import entity_tasks
+
+SHOP = 'shop.myshopify.com'
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = mongomock.MongoClient().db
+    monkeypatch.setattr(mirror_service, 'mongodb', database)
+    monkeypatch.setattr(mirror_service, '_indexed', set())
+    return database
+
+
+@pytest.fixture
+def mirror(db):
+    return MirrorService(SHOP)
+
+
+def product(id, updated_at, **fields):
+    return dict({'id': id, 'title': f'Product {id}', 'status': 'active', 'created_at': '2024-01-01T00:00:00Z',
+                 'updated_at': updated_at}, **fields)
+
+
+def test_first_webhook_creates_the_unique_index(mirror, db):
+    mirror.apply_webhook('products/create', product(1, '2024-01-01T00:00:00Z'))
+    
+    indexes = db.mirror_products.index_information()
+    assert indexes['shop_1_id_1']['unique'] is True
+
+
+def test_stale_webhooks_do_not_roll_records_back(mirror, db):
+    mirror.apply_webhook('products/update', product(1, '2024-01-02T00:00:00Z', title='New'))
+    
+    assert mirror.upsert('products', [product(1, '2024-01-01T00:00:00Z', title='Old')]) == 0
+    mirror.apply_webhook('products/update', product(1, '2024-01-01T00:00:00Z', title='Old'))
+    
+    assert [record['title'] for record in db.mirror_products.find({'id': 1})] == ['New']
+    mirror.apply_webhook('products/update', product(1, '2024-01-03T00:00:00Z', title='Newer'))
+    assert db.mirror_products.find_one({'id': 1})['title'] == 'Newer'
+
+
+def test_webhook_routing_and_deletes(mirror, db):
+    assert mirror.apply_webhook('collections/create', {'id': 7, 'rules': [], 'updated_at': '2024-01-01T00:00:00Z'}) \
+        == 'smart_collections'
+    assert mirror.apply_webhook('collections-update', {'id': 8, 'updated_at': '2024-01-01T00:00:00Z'}) \
+        == 'custom_collections'
+    mirror.apply_webhook('collections/delete', {'id': 7})
+    assert mirror.apply_webhook('app/uninstalled', {'id': 1}) is None
+    
+    assert db.mirror_smart_collections.count_documents({}) == 0
+    assert db.mirror_custom_collections.count_documents({'id': 8}) == 1
+
+
+def test_load_replaces_the_mirror_and_marks_it_ready(mirror, db):
+    # Mirrored well before the load: MongoDB keeps milliseconds, so a write in the load's first one would survive
+    earlier = datetime.utcnow() - timedelta(minutes=5)
+    mirror.upsert('products', [product(1, '2024-01-01T00:00:00Z'), product(2, '2024-01-01T00:00:00Z')], earlier)
+    
+    total = mirror.load('products', [[product(2, '2024-01-05T00:00:00Z')], [product(3, '2024-01-05T00:00:00Z')]])
+    
+    assert total == 2
+    assert sorted(record['id'] for record in db.mirror_products.find()) == [2, 3]
+    assert mirror.state('products')['status'] == 'ready'
+    assert mirror.state('products')['record_count'] == 2
+
+
+def test_claim_load_is_granted_once_until_the_load_fails(mirror):
+    assert mirror.claim_load('products') is True
+    assert mirror.claim_load('products') is False
+    
+    mirror.set_state('products', status='failed', error='boom')
+    
+    assert mirror.claim_load('products') is True
+    assert mirror.claim_load('customers') is True
+
+
+def test_can_serve_only_ready_entities_and_supported_filters(mirror):
+    assert not mirror.can_serve('orders')
+    
+    mirror.set_state('orders', status='ready')
+    
+    assert mirror.can_serve('orders', {'financial_status': 'paid', 'status': 'any'})
+    assert not mirror.can_serve('orders', {'status': 'open'})
+    assert not mirror.can_serve('draft_orders')
+
+
+def test_iter_pages_filters_projects_and_pages_in_id_order(mirror):
+    mirror.upsert('products', [product(i, '2024-01-01T00:00:00Z', status='draft' if i == 2 else 'active')
+                               for i in (5, 2, 4, 1, 3)])
+    
+    pages = list(mirror.iter_pages('products', {'status': 'active'}, size=3, fields=['id', 'title']))
+    drafts = list(mirror.iter_pages('products', {'status': 'draft'}))
+    
+    assert [[record['id'] for record in page] for page in pages] == [[1, 3, 4], [5]]
+    assert pages[0][0] == {'id': 1, 'title': 'Product 1'}
+    assert drafts == [[product(2, '2024-01-01T00:00:00Z', status='draft')]]
+
+
+def test_iter_pages_applies_range_filters(mirror):
+    mirror.upsert('customers', [{'id': i, 'created_at': f'2024-01-0{i}T00:00:00Z',
+                                 'updated_at': f'2024-02-0{i}T00:00:00Z'} for i in (1, 2, 3)])
+    
+    pages = list(mirror.iter_pages('customers', {'updated_at_min': '2024-02-02T00:00:00Z'}, fields=['id']))
+    
+    assert pages == [[{'id': 2}, {'id': 3}]]
+
+
+def test_first_mirror_export_queues_the_initial_load(monkeypatch, db):
+    queued = []
+    monkeypatch.setattr(entity_tasks.mirror_load, 'apply_async', lambda args: queued.append(args))
+    
+    assert entity_tasks.iter_mirror_pages(SHOP, 'token', 'products', {}, False) is None
+    assert entity_tasks.iter_mirror_pages(SHOP, 'token', 'products', {}, False) is None
+    
+    assert queued == [[SHOP, 'token', ['products']]]
+    MirrorService(SHOP).load('products', [[product(1, '2024-01-01T00:00:00Z')]])
+    pages = entity_tasks.iter_mirror_pages(SHOP, 'token', 'products', {}, False, fields=['id'])
+    assert list(pages) == [[{'id': 1}]]
+    assert len(queued) == 1
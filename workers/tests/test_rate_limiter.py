@@ -0,0 +1,139 @@
+import time
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+
+from services import rate_limiter
+from services.rate_limiter import ShopRateLimiter, TokenBucket, throttle_delay
+
+
+class Response:
+    def __init__(self, code, headers=None):
+        self.code = code
+        self.headers = headers or {}
+
+
+class ShopifyError(Exception):
+    def __init__(self, code, headers=None):
+        super().__init__(f"HTTP {code}")
+        self.response = Response(code, headers)
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    calls = []
+    # Only the limiter's clock: patching time.sleep itself would leave pymongo's monitor threads spinning
+    monkeypatch.setattr(rate_limiter, 'time', SimpleNamespace(sleep=calls.append, monotonic=time.monotonic))
+    monkeypatch.setattr(ShopRateLimiter, '_last_response_headers', staticmethod(lambda: {}))
+    return calls
+
+
+def limiter(server, shop='a.myshopify.com', bucket='rest'):
+    return ShopRateLimiter(shop, bucket, client=fakeredis.FakeRedis(server=server, decode_responses=True))
+
+
+def test_burst_is_free_then_callers_wait_at_the_refill_rate(server, sleeps):
+    first = limiter(server)
+    started = time.monotonic()
+    
+    assert [first.acquire() for _ in range(int(first.capacity))] == [0] * int(first.capacity)
+    delay = first.acquire()
+    
+    # The bucket keeps refilling on the Redis clock while the burst is drained
+    assert 1 / first.rate - (time.monotonic() - started) - 0.01 <= delay <= 1 / first.rate
+    assert sleeps == [delay]
+
+
+def test_workers_for_one_shop_share_the_bucket(server, sleeps):
+    first, second, other_shop = limiter(server), limiter(server), limiter(server, 'b.myshopify.com')
+    
+    first.acquire(first.capacity)
+    
+    assert second.acquire(2) == pytest.approx(2 / second.rate, rel=0.1)
+    assert other_shop.acquire(2) == 0
+
+
+def test_rest_call_limit_header_clamps_the_bucket(server, sleeps):
+    shared = limiter(server)
+    
+    shared.observe_rest({'X-Shopify-Shop-Api-Call-Limit': '40/40'})
+    
+    assert shared.acquire() == pytest.approx(1 / 2, rel=0.1)
+
+
+def test_graphql_throttle_status_refunds_unused_cost(server, sleeps):
+    shared = limiter(server, bucket='graphql')
+    shared.acquire(shared.capacity)
+    
+    shared.observe_graphql({'cost': {
+        'actualQueryCost': 10,
+        'throttleStatus': {'currentlyAvailable': 990, 'maximumAvailable': 1000, 'restoreRate': 50},
+    }}, reserved=50)
+    
+    assert shared.acquire(40) == 0
+
+
+def test_call_retries_throttled_requests_after_retry_after(server, sleeps):
+    shared = limiter(server)
+    responses = [ShopifyError(429, {'Retry-After': '1.5'}), 'ok']
+    
+    def request():
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    
+    assert shared.call(request) == 'ok'
+    assert 1.5 in sleeps
+
+
+def test_call_raises_other_errors_and_gives_up_after_max_retries(server, sleeps):
+    shared = limiter(server)
+    shared.max_retries = 2
+    attempts = []
+    
+    def throttled():
+        attempts.append(1)
+        raise ShopifyError(429)
+    
+    with pytest.raises(ShopifyError):
+        shared.call(throttled)
+    with pytest.raises(ShopifyError):
+        shared.call(lambda: (_ for _ in ()).throw(ShopifyError(500)))
+    assert len(attempts) == 3
+
+
+def test_graphql_call_retries_throttled_responses(server, sleeps):
+    shared = limiter(server, bucket='graphql')
+    throttled = {'errors': [{'message': 'Throttled', 'extensions': {'code': 'THROTTLED'}}],
+                 'extensions': {'cost': {'throttleStatus': {
+                     'currentlyAvailable': 0, 'maximumAvailable': 1000, 'restoreRate': 50}}}}
+    responses = [throttled, {'data': {'shop': {'name': 'A'}}}]
+    
+    result = shared.graphql_call(lambda query, variables: responses.pop(0), '{ shop { name } }', cost=100)
+    
+    assert result == {'data': {'shop': {'name': 'A'}}}
+    assert 100 / 50 in sleeps
+
+
+def test_falls_back_to_a_local_bucket_without_redis(server, sleeps):
+    server.connected = False
+    shared = limiter(server)
+    
+    assert shared.acquire() == 0
+    shared.sync(0, 40, 2)
+
+
+def test_token_bucket_and_throttle_delay():
+    bucket = TokenBucket(rate=1000, capacity=2)
+    
+    assert bucket.acquire(2) == 0
+    assert bucket.acquire(1) > 0
+    assert throttle_delay(ShopifyError(429, {'retry-after': 'soon'})) == 2.0
+    assert throttle_delay(ShopifyError(500)) is None
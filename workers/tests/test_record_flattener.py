@@ -0,0 +1,98 @@
+import pytest
+
+from services.record_flattener import FLATTEN_SCHEMAS, RecordFlattener
+
+PRODUCTS = [
+    {
+        'id': 1, 'title': 'Shirt', 'tags': 'a, b', 'status': 'active',
+        'options': [{'name': 'Size'}, {'name': 'Color'}],
+        'images': [{'src': 'https://cdn/1.jpg'}, {'src': None}, {'src': 'https://cdn/2.jpg'}],
+        'variants': [
+            {'id': 11, 'sku': 'S-RED', 'price': '10.00', 'option1': 'S', 'option2': 'Red', 'taxable': True},
+            {'id': 12, 'sku': 'M-RED', 'price': '11.00', 'option1': 'M', 'option2': 'Red', 'taxable': False},
+        ],
+    },
+    {'id': 2, 'title': 'No variants', 'variants': [], 'images': None},
+    {'id': 3, 'title': 'Sparse'},
+]
+
+ORDERS = [
+    {
+        'id': 5, 'name': '#1001', 'customer': {'id': 9, 'first_name': 'Ann'}, 'shipping_address': None,
+        'discount_codes': [{'code': 'SAVE10'}, {'code': ''}, {'code': 'VIP'}],
+        'line_items': [{'id': 51, 'sku': 'S-RED', 'quantity': 2}, {'id': 52, 'quantity': 1}],
+    },
+    {'id': 6, 'name': '#1002', 'customer': None, 'line_items': None},
+]
+
+
+def naive_rows(records, columns, explode, join):
+    """Straightforward per-cell dict walking, as the flattener's oracle"""
+    def walk(value, path):
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        return value
+    
+    rows = []
+    for record in records:
+        for child in record.get(explode) or [{}]:
+            row = []
+            for column in columns:
+                root, *rest = column.split('.')
+                if rest and root == explode:
+                    row.append(walk(child, rest))
+                elif rest and root in join:
+                    values = (walk(item, rest) for item in record.get(root) or [])
+                    row.append(', '.join(str(value) for value in values if value is not None and value != ''))
+                else:
+                    row.append(walk(record, [root] + rest))
+            rows.append(tuple(row))
+    return rows
+
+
+@pytest.mark.parametrize('entity, records', [('products', PRODUCTS), ('orders', ORDERS)])
+def test_schema_rows_match_naive_flattening(entity, records):
+    schema = FLATTEN_SCHEMAS[entity]
+    
+    rows = RecordFlattener.for_entity(entity).rows(records)
+    
+    assert rows == naive_rows(records, schema['columns'], schema['explode'], schema['join'])
+
+
+def test_join_and_explode_cells():
+    flattener = RecordFlattener.for_entity('products', ['id', 'options.name', 'images.src', 'variants.sku'])
+    
+    assert flattener.rows(PRODUCTS) == [
+        (1, 'Size, Color', 'https://cdn/1.jpg, https://cdn/2.jpg', 'S-RED'),
+        (1, 'Size, Color', 'https://cdn/1.jpg, https://cdn/2.jpg', 'M-RED'),
+        (2, '', '', None),
+        (3, '', '', None),
+    ]
+    assert flattener.fields == ['id', 'options', 'images', 'variants']
+
+
+def test_labelled_columns_with_transforms_and_extend():
+    flattener = RecordFlattener([('Order', 'name'), ('Buyer', 'customer.first_name', str.upper)])
+    extended = flattener.extend(['Order', 'Metafield: custom.note'])
+    
+    rows = extended.rows([{'name': '#1', 'customer': {'first_name': 'ann'}, 'Metafield: custom.note': 'gift'}])
+    
+    assert extended.columns == ['Order', 'Buyer', 'Metafield: custom.note']
+    assert rows == [('#1', 'ANN', 'gift')]
+    assert flattener.extend(['Order']) is flattener
+
+
+def test_flatten_pages_yields_row_dicts():
+    flattener = RecordFlattener.for_entity('orders', ['name', 'line_items.id'])
+    
+    pages = list(flattener.flatten_pages([ORDERS[:1], ORDERS[1:]]))
+    
+    assert pages == [
+        [{'name': '#1001', 'line_items.id': 51}, {'name': '#1001', 'line_items.id': 52}],
+        [{'name': '#1002', 'line_items.id': None}],
+    ]
+
+
+def test_unknown_entity_is_rejected():
+    with pytest.raises(ValueError):
+        RecordFlattener.for_entity('collections')
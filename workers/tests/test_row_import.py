@@ -0,0 +1,119 @@
+import threading
+from collections import Counter
+from datetime import datetime
+from io import StringIO
+
+import pandas as pd
+import pytest
+from bson import ObjectId
+
+from fake_s3 import FakeS3
+from services import import_checkpoint
+from services.entity_service import EntityService
+from services.import_checkpoint import ImportCheckpoint
+from tasks import entity_tasks
+
+SHOP = 'shop.myshopify.com'
+
+
+class WorkerLost(BaseException):
+    """Stands in for the worker dying mid-import; not an Exception, so no row handler catches it"""
+
+
+class EveryTwoRows(ImportCheckpoint):
+    def __init__(self, job_id, chunk=None):
+        super().__init__(job_id, every=2, chunk=chunk)
+
+
+@pytest.fixture
+def shop(monkeypatch, backends):
+    """Creates records in ``shop.created`` (raising WorkerLost for ``crash_at``); metafield value 'bad' is rejected"""
+    lock = threading.Lock()
+    
+    class Shop:
+        created = []
+        crash_at = None
+    
+    def create_or_update(service, entity, data, command='UPDATE'):
+        if data.get('Title') == Shop.crash_at:
+            raise WorkerLost()
+        with lock:
+            Shop.created.append(data['Title'])
+            return {'id': len(Shop.created)}
+    
+    def graphql(service, query, variables=None, cost=None):
+        user_errors = [
+            {'field': ['metafields', str(position), 'value'], 'message': 'is invalid', 'elementIndex': position}
+            for position, metafield in enumerate(variables['metafields']) if metafield['value'] == 'bad'
+        ]
+        return {'metafieldsSet': {'userErrors': user_errors}}
+    
+    monkeypatch.setattr(EntityService, 'create_or_update', create_or_update)
+    monkeypatch.setattr(EntityService, 'graphql', graphql)
+    monkeypatch.setattr(entity_tasks, 'ImportCheckpoint', EveryTwoRows)
+    Shop.job_id = str(backends.db.jobs.insert_one({'status': 'processing', 'started_at': datetime.utcnow()}).inserted_id)
+    return Shop
+
+
+def products(titles, **columns):
+    return pd.DataFrame(dict({'Title': titles}, **columns))
+
+
+def test_resumed_import_skips_finished_rows_and_keeps_earlier_metafield_errors(shop, task):
+    df = products([f'P{i}' for i in range(6)], **{'Metafield:custom[fabric]': ['wool', 'bad', 'wool', 'wool', 'wool', 'wool']})
+    shop.crash_at = 'P4'
+    
+    with pytest.raises(WorkerLost):
+        entity_tasks.run_row_import(task, shop.job_id, SHOP, 'token', 'products', [df], {'concurrency': 1}, 'NEW')
+    
+    shop.crash_at = None
+    result = entity_tasks.run_row_import(task, shop.job_id, SHOP, 'token', 'products', [df], {'concurrency': 1}, 'NEW')
+    
+    assert Counter(shop.created) == Counter(f'P{i}' for i in range(6))
+    assert (result['total'], result['success']) == (6, 6)
+    assert result['errors'] == ['Row 3: Metafield custom.fabric: is invalid']
+
+
+def test_checkpoint_caps_stored_metafield_errors_but_keeps_their_count(backends, monkeypatch):
+    monkeypatch.setattr(import_checkpoint, 'JOB_ERROR_LIMIT', 2)
+    job_id = str(backends.db.jobs.insert_one({}).inserted_id)
+    
+    ImportCheckpoint(job_id).save(10, 7, 0, [(1, 'first'), (4, 'second'), (9, 'third')])
+    restored = ImportCheckpoint(job_id).load()
+    
+    assert restored.metafield_errors == [(1, 'first'), (4, 'second')]
+    assert restored.total_metafield_errors(restored.metafield_errors + [(12, 'fourth')]) == 4
+
+
+def test_chunked_import_keeps_handles_together_and_folds_chunk_results(shop, task, backends, monkeypatch):
+    s3 = FakeS3()
+    chunk_files = []
+    
+    def chord(chunks):
+        def callback(signature):
+            for chunk in chunks:
+                chunk_files.append(s3.objects[chunk.args[4]].decode())
+            results = [chunk.type.run(*chunk.args) for chunk in chunks]
+            return signature.type.run(results, *signature.args)
+        return callback
+    
+    monkeypatch.setattr(entity_tasks, 's3_client', s3)
+    monkeypatch.setattr(entity_tasks, 'group', list)
+    monkeypatch.setattr(entity_tasks, 'chord', chord)
+    for chunk_task in (entity_tasks.import_entity_chunk, entity_tasks.finish_chunked_import):
+        monkeypatch.setattr(chunk_task, 'update_state', task.update_state)
+    
+    df = products(['Hat', '', 'Scarf', '', '', 'Coat'], Handle=['hat', 'hat', 'scarf', 'scarf', 'scarf', 'coat'])
+    entity_tasks.dispatch_chunked_import(
+        task, shop.job_id, SHOP, 'token', 'products', iter([df]), {'chunk_size': 2, 'concurrency': 1}, 'NEW'
+    )
+    
+    handles = [set(pd.read_csv(StringIO(content))['Handle']) for content in chunk_files]
+    assert all(not (first & second) for i, first in enumerate(handles) for second in handles[i + 1:])
+    assert set().union(*handles) == {'hat', 'scarf', 'coat'}
+    
+    job = backends.db.jobs.find_one({'_id': ObjectId(shop.job_id)})
+    assert (job['status'], job['total_records'], job['success_count'], job['chunk_count']) == \
+        ('completed', 6, 6, len(chunk_files))
+    assert len(shop.created) == 6
+    assert not any(key.startswith(f'imports/{SHOP}/chunks/') for key in s3.objects)
@@ -0,0 +1,67 @@
+import pytest
+
+from services import shopify_service
+from services.rate_limiter import ShopRateLimiter
+from services.shopify_service import ShopifyService
+
+SHOP = 'shop.myshopify.com'
+
+
+class Record(dict):
+    def to_dict(self):
+        return dict(self)
+
+
+class Page(list):
+    """A REST page whose next_page serves the following one, like the Link header cursor"""
+    
+    def __init__(self, pages, number):
+        super().__init__(Record(record) for record in pages[number])
+        self.pages, self.number = pages, number
+    
+    def has_next_page(self):
+        return self.number + 1 < len(self.pages)
+    
+    def next_page(self, no_cache=False):
+        return Page(self.pages, self.number + 1)
+
+
+@pytest.fixture
+def resources(monkeypatch, backends):
+    """Serves ``resources.pages`` from Product, Customer and Order; ``resources.requests`` records the params"""
+    class Resources:
+        pages = []
+        requests = []
+    
+    def find(**params):
+        Resources.requests.append(params)
+        return Page(Resources.pages, 0)
+    
+    for name in ('Product', 'Customer', 'Order'):
+        monkeypatch.setattr(getattr(shopify_service.shopify, name), 'find', staticmethod(find))
+    monkeypatch.setattr(ShopRateLimiter, '_last_response_headers', staticmethod(lambda: {}))
+    return Resources
+
+
+@pytest.mark.parametrize('method', ['get_products', 'get_customers', 'get_orders'])
+def test_getters_follow_every_page(resources, method):
+    resources.pages = [[{'id': 1}, {'id': 2}], [{'id': 3}], [{'id': 4}]]
+    
+    records = getattr(ShopifyService(SHOP, 'token'), method)()
+    
+    assert [record['id'] for record in records] == [1, 2, 3, 4]
+    assert len(resources.requests) == 1
+
+
+def test_orders_are_filtered_by_status(resources):
+    resources.pages = [[{'id': 1}]]
+    
+    ShopifyService(SHOP, 'token').get_orders(status='open')
+    
+    assert resources.requests == [{'limit': 250, 'status': 'open'}]
+
+
+def test_empty_shop_yields_no_pages(resources):
+    resources.pages = [[]]
+    
+    assert list(ShopifyService(SHOP, 'token').iter_pages(shopify_service.shopify.Product)) == []
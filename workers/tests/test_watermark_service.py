@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+
+import fakeredis
+import mongomock
+import pytest
+
+from config import WATERMARK_SKEW_SECONDS
+from services import watermark_service
+from services.entity_service import EntityService
+from services.rate_limiter import ShopRateLimiter
+from services.watermark_service import WatermarkService
+from tasks import entity_tasks
+
+SHOP = 'shop.myshopify.com'
+
+
+class Record(dict):
+    def to_dict(self):
+        return dict(self)
+
+
+class Page(list):
+    """A REST page whose next_page serves the following page, or raises once ``fail_after`` is reached"""
+    
+    def __init__(self, pages, number, fail_after=None):
+        super().__init__(Record(record) for record in pages[number])
+        self.pages, self.number, self.fail_after = pages, number, fail_after
+        self.next_page_url = f'https://{SHOP}/admin/api/products.json?page_info={number + 1}'
+    
+    def has_next_page(self):
+        return self.number + 1 < len(self.pages)
+    
+    def next_page(self, no_cache=False):
+        if self.fail_after is not None and self.number + 1 >= self.fail_after:
+            raise ConnectionError('connection reset')
+        return Page(self.pages, self.number + 1, self.fail_after)
+
+
+class Progress:
+    processed = 0
+    
+    def advance(self, count):
+        self.processed += count
+
+
+class Upload(BytesIO):
+    uploads = {}
+    
+    def __init__(self, client, bucket, key, content_type):
+        super().__init__()
+        self.key = key
+    
+    def close(self):
+        Upload.uploads[self.key] = self.getvalue()
+        super().close()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = mongomock.MongoClient().db
+    monkeypatch.setattr(watermark_service, 'mongodb', database)
+    return database
+
+
+@pytest.fixture
+def shop(monkeypatch, db):
+    """Runs incremental exports against REST pages of ``shop.pages``; ``shop.requests`` records the filters"""
+    class Shop:
+        pages = []
+        fail_after = None
+        requests = []
+    
+    class Products:
+        @staticmethod
+        def find(**params):
+            Shop.requests.append(params)
+            return Page(Shop.pages, 0, Shop.fail_after)
+    
+    def export(mode='full', params=None, key='exports/products.csv'):
+        service = EntityService(SHOP, 'token')
+        service.rest_limiter = ShopRateLimiter(SHOP, 'rest', client=fakeredis.FakeRedis())
+        monkeypatch.setattr(service, 'paginated_resource', lambda entity, filters, fields=None: (Products, dict(filters)))
+        return entity_tasks.run_incremental_export(
+            Progress(), service, SHOP, 'token', 'products', dict({'export_strategy': 'rest'}, **(params or {})),
+            {'status': 'active'}, mode, key, 'text/csv'
+        )
+    
+    monkeypatch.setattr(entity_tasks, 'S3MultipartWriter', Upload)
+    Shop.export = staticmethod(export)
+    return Shop
+
+
+def test_watermark_keys_differ_by_filters_and_mode(db):
+    first = WatermarkService(SHOP, 'products', {'status': 'active'}, 'full')
+    first.high_water = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    first.save('exports/a.csv', 1)
+    
+    assert WatermarkService(SHOP, 'products', {'status': 'active'}, 'full').load()['snapshot_key'] == 'exports/a.csv'
+    assert WatermarkService(SHOP, 'products', {'status': 'draft'}, 'full').load() is None
+    assert WatermarkService(SHOP, 'products', {'status': 'active'}, 'merge').load() is None
+
+
+def test_track_keeps_the_newest_updated_at(db):
+    watermark = WatermarkService(SHOP, 'products')
+    pages = [[{'updated_at': '2024-03-01T10:00:00-05:00'}, {'updated_at': None}],
+             [{'updated_at': '2024-03-01T14:30:00Z'}, {'updated_at': 'not a date'}]]
+    
+    assert list(watermark.track(pages)) == pages
+    assert watermark.high_water == datetime(2024, 3, 1, 15, 0, tzinfo=timezone.utc)
+
+
+def test_save_without_new_records_keeps_the_previous_watermark(db):
+    watermark = WatermarkService(SHOP, 'products')
+    watermark.high_water = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    watermark.save('exports/a.csv', 5)
+    
+    unchanged = WatermarkService(SHOP, 'products')
+    unchanged.load()
+    unchanged.save('exports/b.csv', 0)
+    
+    stored = db.export_watermarks.find_one()
+    assert (stored['updated_at'], stored['snapshot_key'], stored['record_count']) == \
+        ('2024-01-01T00:00:00+00:00', 'exports/b.csv', 0)
+
+
+def test_incremental_export_fetches_changes_since_the_watermark(shop, db):
+    shop.pages = [[{'id': 1, 'updated_at': '2024-01-01T00:00:00Z'}],
+                  [{'id': 2, 'updated_at': '2024-01-02T00:00:00Z'}]]
+    assert shop.export() == 2
+    
+    shop.pages = [[{'id': 2, 'updated_at': '2024-01-03T00:00:00Z'}]]
+    assert shop.export(key='exports/next.csv') == 1
+    
+    assert 'updated_at_min' not in shop.requests[0]
+    assert shop.requests[1]['updated_at_min'] == '2024-01-02T00:00:00+00:00'
+    assert db.export_watermarks.find_one()['updated_at'] == '2024-01-03T00:00:00+00:00'
+    assert Upload.uploads['exports/next.csv'].decode().splitlines() == ['id,updated_at', '2,2024-01-03T00:00:00Z']
+
+
+def test_watermark_stops_at_the_export_start_so_mid_export_updates_are_refetched(shop, db):
+    # The record was updated after the export started; a later page may already have been read
+    updated_during_export = datetime.now(timezone.utc) + timedelta(seconds=30)
+    shop.pages = [[{'id': 1, 'updated_at': updated_during_export.isoformat()}]]
+    shop.export()
+    
+    stored = datetime.fromisoformat(db.export_watermarks.find_one()['updated_at'])
+    assert stored <= datetime.now(timezone.utc) - timedelta(seconds=WATERMARK_SKEW_SECONDS)
+    
+    shop.export(key='exports/next.csv')
+    assert shop.requests[1]['updated_at_min'] == stored.isoformat()
+    assert datetime.fromisoformat(shop.requests[1]['updated_at_min']) < updated_during_export
+
+
+def test_failed_page_fails_the_export_without_moving_the_watermark(shop, db):
+    shop.pages = [[{'id': 1, 'updated_at': '2024-01-01T00:00:00Z'}]]
+    shop.export()
+    
+    shop.pages = [[{'id': 2, 'updated_at': '2024-02-01T00:00:00Z'}], [{'id': 3, 'updated_at': '2024-02-02T00:00:00Z'}]]
+    shop.fail_after = 1
+    with pytest.raises(ConnectionError):
+        shop.export(key='exports/partial.csv')
+    
+    assert db.export_watermarks.find_one()['updated_at'] == '2024-01-01T00:00:00+00:00'